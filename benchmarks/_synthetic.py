@@ -0,0 +1,74 @@
+'''
+    Synthetic EIS intraday data used by the benchmarks
+'''
+
+import os
+import numpy as np
+import pandas as pd
+
+EIS_COLUMNS = ['Date Time', 'UnixTimefrom 1-1-1980', 'ExchToken', 'BidPrice', 'BidQty',
+               'AskPrice', 'AskQty', 'TTq', 'LTP', 'TotalTradedPrice', 'Instrument',
+               'ExpiryDate', 'ExpiryTime', 'Strike', 'Type']
+
+
+def make_eis_day(date:str, n_strikes:int=40, n_expiries:int=3, spot:float=35000, seed:int=0) -> pd.DataFrame:
+    '''
+    Returns a raw (not preprocessed) EIS intraday day as the data files look like:
+    text columns padded with spaces, prices and strikes in paisa, one quote per option per minute.
+
+    Parameters:
+        date: trading date (yyyy-mm-dd)
+        n_strikes: number of strikes per expiry
+        n_expiries: number of weekly expiries (thursdays) starting from the date
+        spot: level around which the strikes are centered
+        seed: random seed
+    '''
+    rng = np.random.default_rng(seed)
+    times = pd.date_range(f'{date} 09:15:00', f'{date} 15:30:00', freq='1min')
+    expiries = pd.date_range(date, periods=n_expiries, freq='W-THU')
+    strikes = spot - (n_strikes // 2) * 100 + 100 * np.arange(n_strikes)
+
+    # one row per (time, expiry, strike, type)
+    t_idx, e_idx, k_idx, c_idx = [a.ravel() for a in np.meshgrid(np.arange(len(times)), np.arange(len(expiries)),
+                                                                  np.arange(n_strikes), np.arange(2), indexing='ij')]
+    path = spot + np.cumsum(rng.normal(0, 10, len(times)))
+    underlying = path[t_idx]
+    strike = strikes[k_idx]
+    intrinsic = np.where(c_idx == 0, np.maximum(underlying - strike, 0), np.maximum(strike - underlying, 0))
+    time_value = 150 * np.exp(-np.abs(underlying - strike) / 800) * (1 + e_idx)
+    mid = np.maximum(intrinsic + time_value, 0.1)
+
+    rows = len(t_idx)
+    data = pd.DataFrame({
+        'Date Time': times.strftime('%Y-%m-%d %H:%M:%S').to_numpy()[t_idx],
+        'UnixTimefrom 1-1-1980': np.zeros(rows, dtype=np.int64),
+        'ExchToken': 30000 + e_idx * 1000 + k_idx * 2 + c_idx,
+        'BidPrice': np.round(mid * 0.995 * 100),
+        'BidQty': np.full(rows, 25),
+        'AskPrice': np.round(mid * 1.005 * 100 + 5),
+        'AskQty': np.full(rows, 50),
+        'TTq': np.zeros(rows),
+        'LTP': np.round(mid * 100),
+        'TotalTradedPrice': np.zeros(rows),
+        'Instrument': np.full(rows, ' BANKNIFTY'),
+        'ExpiryDate': (' ' + expiries.strftime('%d-%m-%Y')).to_numpy()[e_idx],
+        'ExpiryTime': np.full(rows, ' 15:30:00'),
+        'Strike': strike * 100,
+        'Type': np.array([' CE', ' PE'])[c_idx],
+    }, columns=EIS_COLUMNS)
+
+    # files are not ordered by option
+    return data.sample(frac=1, random_state=seed).reset_index(drop=True).astype(str)
+
+
+def write_eis_days(data_path:str, underlying:str, dates:list, **kwargs) -> list:
+    '''
+    Writes one <UNDERLYING>_<YYYYMMDD>_Intraday.csv file per date and returns the file paths
+    '''
+    os.makedirs(data_path, exist_ok=True)
+    file_paths = list()
+    for seed, date in enumerate(dates):
+        file_path = os.path.join(data_path, f"{underlying}_{pd.Timestamp(date).strftime('%Y%m%d')}_Intraday.csv")
+        make_eis_day(date, seed=seed, **kwargs).to_csv(file_path, index=False)
+        file_paths.append(file_path)
+    return file_paths
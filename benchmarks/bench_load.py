@@ -0,0 +1,76 @@
+'''
+    Benchmark of the multi-day loading of HistoricalData over 1, 5 and 20 days of synthetic minute-level chains,
+    compared with the previous load loop (concatenation inside the per-day loop). Time and peak python memory are reported.
+
+    DATA_PATH of the datasets package must point to a scratch directory, the synthetic files are written there.
+    Run from the repository root:
+        python -m benchmarks.bench_load --days 1 5 20
+'''
+
+import time
+import argparse
+import tracemalloc
+import pandas as pd
+
+from datasets import DATA_PATH
+from modules._historical_data import HistoricalData
+from modules._market_cache import load_eis_day, concat_eis_days, EIS_COLUMNS
+from benchmarks._synthetic import write_eis_days
+
+
+def legacy_load(hist_data:HistoricalData) -> pd.DataFrame:
+    '''
+    The previous load loop: concatenation inside the per-day loop.
+    Days are read the same way as in the current load so that only the concatenation differs.
+    '''
+    data = pd.DataFrame(columns=EIS_COLUMNS)
+    for file_name in hist_data.get_file_names():
+        df = load_eis_day(file_name)
+        data = df if len(data) == 0 else pd.concat([data, df], axis = 0)
+    return data
+
+
+def new_load(hist_data:HistoricalData) -> pd.DataFrame:
+    '''
+    The current load (without building the chain store and the greeks)
+    '''
+    return concat_eis_days([df for _, df in hist_data.iter_market_data()])
+
+
+def _measure(func, *args) -> tuple:
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak / 2**20, result
+
+
+def main(args):
+    dates = pd.date_range('2021-03-01', periods=max(args.days)).strftime('%Y-%m-%d').to_list()
+    write_eis_days(DATA_PATH, args.underlying, dates, n_strikes=args.strikes)
+    # write the binary cache of every day, both the loads below read it
+    for file_name in HistoricalData('eis_data', 'bench', args.underlying, dates[0], dates[-1]).get_file_names():
+        load_eis_day(file_name)
+
+    for n_days in args.days:
+        hist_data = HistoricalData(source='eis_data', name='bench', underlying_instrument=args.underlying,
+                                   start_date=dates[0], end_date=dates[n_days - 1])
+
+        legacy_time, legacy_peak, legacy = _measure(legacy_load, hist_data)
+        new_time, new_peak, new = _measure(new_load, hist_data)
+
+        pd.testing.assert_frame_equal(legacy.astype({'Type': str, 'Instrument': str}),
+                                      new.astype({'Type': str, 'Instrument': str}))
+        print(f'days={n_days:>3} rows={len(new):>10,} | before: {legacy_time:7.2f}s {legacy_peak:8.1f}MB '
+              f'| after: {new_time:7.2f}s {new_peak:8.1f}MB')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='load_market_data benchmark')
+    parser.add_argument('-d', '--days', type=int, nargs='+', default=[1, 5, 20], help='Number of days', required=False)
+    parser.add_argument('-u', '--underlying', type=str, default='BENCHNIFTY', help='Underlying of the synthetic files', required=False)
+    parser.add_argument('-k', '--strikes', type=int, default=40, help='Number of strikes per expiry', required=False)
+    args = parser.parse_args()
+    main(args)
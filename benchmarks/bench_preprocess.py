@@ -0,0 +1,84 @@
+'''
+    Benchmark of modules._utils.preprocess_eis_data against the previous row-wise implementation.
+
+    Run from the repository root:
+        python -m benchmarks.bench_preprocess --rows 1000000
+'''
+
+import time
+import argparse
+import numpy as np
+import pandas as pd
+
+from modules._utils import preprocess_eis_data
+from benchmarks._synthetic import make_eis_day
+
+
+def legacy_preprocess_eis_data(data:pd.DataFrame) -> pd.DataFrame:
+    '''
+    The previous implementation of preprocess_eis_data, kept here as the baseline
+    '''
+    data.drop(['UnixTimefrom 1-1-1980'], axis = 1, inplace = True)
+    float_col_list = ['BidPrice','BidQty','AskPrice', 'AskQty', \
+               'TTq','LTP','TotalTradedPrice','Strike']
+    data[float_col_list] = data[float_col_list].astype('float64')
+    data['ExchToken'] = data['ExchToken'].astype('int64')
+    data = data.apply(lambda x: x.str.strip() if type(x) == "<class 'str'>" else x)
+    for col in data.columns:
+        if data[col].dtype == "O":
+            data[col] = data[col].astype(str)
+            data[col] = data[col].apply(lambda x: x.strip())
+    data['ExpiryDate'] = pd.to_datetime(data['ExpiryDate'].str.strip(),format='%d-%m-%Y')
+    data['ExpiryDate'] = data['ExpiryDate'].dt.strftime('%Y-%m-%d')
+    data['ExpiryDateTime'] = data['ExpiryDate'] + ' ' + data['ExpiryTime']
+    to_drop = data[(data['Type'] == 'XX') | (data['Strike'] == -0.01) | (data['BidPrice'] > data['AskPrice']) | (data['BidQty'] == 0.0)
+    | (data['AskQty'] == 0.0)].index.to_list()
+    data.drop(data.index[to_drop], inplace = True)
+    data.set_index('Date Time', inplace = True)
+    data.index = pd.to_datetime(data.index)
+    data['ExpiryDate'] = pd.to_datetime(data['ExpiryDate'])
+    data['ExpiryDateTime'] = data['ExpiryDateTime'].astype('str')
+    data['ExpiryDateTime'] = pd.to_datetime(data['ExpiryDateTime'])
+    data['BidPrice'] = data['BidPrice'].apply(lambda x:x/100)
+    data['AskPrice'] = data['AskPrice'].apply(lambda x:x/100)
+    data['Strike'] = data['Strike'].apply(lambda x:x/100)
+    return data
+
+
+def _time_it(func, raw:pd.DataFrame, repeat:int) -> tuple:
+    best, result = np.inf, None
+    for _ in range(repeat):
+        data = raw.copy()
+        start = time.perf_counter()
+        result = func(data)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main(args):
+    # each synthetic day has 376 minutes x n_expiries x n_strikes x 2 rows
+    n_strikes = max(1, int(np.ceil(args.rows / (376 * args.expiries * 2))))
+    raw = make_eis_day('2021-03-10', n_strikes=n_strikes, n_expiries=args.expiries)
+    print(f'rows={len(raw)}')
+
+    legacy_time, legacy = _time_it(legacy_preprocess_eis_data, raw, args.repeat)
+    new_time, new = _time_it(preprocess_eis_data, raw, args.repeat)
+
+    # both the implementations must produce the same data
+    columns = legacy.columns.to_list()
+    pd.testing.assert_frame_equal(legacy.sort_values(['ExchToken']).sort_index(kind='stable'),
+                                  new[columns].astype({'Type': str, 'Instrument': str}).sort_values(['ExchToken']).sort_index(kind='stable'),
+                                  check_names=False)
+
+    print(f'before: {legacy_time:.3f}s ({len(raw)/legacy_time:,.0f} rows/s)')
+    print(f'after : {new_time:.3f}s ({len(raw)/new_time:,.0f} rows/s)')
+    print(f'speedup: {legacy_time/new_time:.1f}x')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='preprocess_eis_data benchmark')
+    parser.add_argument('-r', '--rows', type=int, default=1_000_000, help='Approximate number of rows', required=False)
+    parser.add_argument('-e', '--expiries', type=int, default=3, help='Number of expiries', required=False)
+    parser.add_argument('-n', '--repeat', type=int, default=1, help='Number of repetitions (best time is reported)', required=False)
+    args = parser.parse_args()
+    main(args)
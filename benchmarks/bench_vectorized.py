@@ -0,0 +1,109 @@
+'''
+    Benchmark of the vectorized backtest (VectorizedCondor) against the event driven run (Algo.driver) over synthetic
+    minute-level days: both runs are checked to give the same records, book and blotter, and are timed per day.
+    The vectorized run is timed a second time on the same market data, as the next configurations of a sweep are.
+
+    DATA_PATH of the datasets package must point to a scratch directory, the synthetic files are written there.
+    Run from the repository root:
+        python -m benchmarks.bench_vectorized --dates 2021-03-10 2021-03-11
+'''
+
+import time
+import argparse
+import tempfile
+import numpy as np
+import pandas as pd
+
+from datasets import DATA_PATH
+from modules import Algo, Strategy, Blotter, Portfolio
+from modules._backtest import Backtest
+from modules._historical_data import HistoricalData
+from modules._vectorized import VectorizedCondor
+from modules._runner import redirect_outputs, get_book, is_same_book
+from modules.global_variables import params
+from benchmarks._synthetic import write_eis_days
+
+RECORD_COLUMNS = ['Value', 'Cash', 'NetDelta', 'GrossExposure']
+
+
+def _time_window(date:str) -> list:
+    return pd.date_range(f'{date} {params["TRADING_START_TIME"]}', f'{date} {params["TRADING_END_TIME"]}', freq='1min')[1:].to_pydatetime().tolist()
+
+
+def run_event(hist_data:HistoricalData, underlying:str, time_window:list, param_list:list, portfolio:Portfolio, backtest:Backtest, blotter:Blotter):
+    strategy = Strategy(underlying_instrument=underlying, param_list=param_list, time_interval_list=time_window)
+    Algo(time_window=time_window, strategy=strategy, blotter=blotter).driver(portfolio=portfolio, backtest=backtest, hist_data=hist_data)
+
+
+def run_vectorized(hist_data:HistoricalData, underlying:str, time_window:list, param_list:list, portfolio:Portfolio, backtest:Backtest, blotter:Blotter):
+    engine = VectorizedCondor(time_window=time_window, underlying_instrument=underlying, param_list=param_list)
+    engine.run(backtest=backtest, portfolio=portfolio, hist_data=hist_data, blotter=blotter)
+
+
+def _same_records(records, other_records) -> bool:
+    return (len(records) == len(other_records)
+            and np.array_equal(records['Timestamp'], other_records['Timestamp'])
+            and np.array_equal(records['Legs'], other_records['Legs'])
+            and all(np.allclose(records[name], other_records[name], rtol=1e-9, atol=1e-6, equal_nan=True) for name in RECORD_COLUMNS))
+
+
+def _same_blotter(blotter:Blotter, other_blotter:Blotter) -> bool:
+    columns = ['time', 'instrument_id', 'position', 'price']
+    trades, other_trades = blotter.getDF()[columns], other_blotter.getDF()[columns]
+    return trades.shape == other_trades.shape and all(np.array_equal(trades[name].to_numpy(), other_trades[name].to_numpy()) for name in columns[:3]) \
+        and np.allclose(trades['price'].to_numpy(dtype=float), other_trades['price'].to_numpy(dtype=float))
+
+
+def main(args):
+    write_eis_days(DATA_PATH, args.underlying, args.dates, n_strikes=args.strikes)
+    param_list = [args.otm_percentage, args.trade_interval, args.hedge_interval, 45, args.unit_size, 1]
+    portfolios = {'event': Portfolio(initial_cash=0), 'vectorized': Portfolio(initial_cash=0)}
+    backtests = {'event': None, 'vectorized': None}
+
+    with tempfile.TemporaryDirectory() as output_dir, redirect_outputs(output_dir):
+        for date in args.dates:
+            day = pd.Timestamp(date).strftime('%Y%m%d')
+            hist_data = HistoricalData(source='eis_data', name='bench', underlying_instrument=args.underlying,
+                                       start_date=day, end_date=day, expiry_type='nearest_weekly')
+            hist_data.load_market_data()
+            time_window = _time_window(date)
+
+            timings, blotters, sweep_time = dict(), dict(), None
+            for name, run in (('event', run_event), ('vectorized', run_vectorized)):
+                hist_data.switch_expiry_type('nearest_weekly')
+                previous = backtests[name]
+                backtests[name] = Backtest(name=name, mode='algo', time_window=time_window,
+                                           online_metrics=previous.getOnlineMetrics() if previous is not None else None)
+                blotters[name] = Blotter()
+                start = time.perf_counter()
+                run(hist_data, args.underlying, time_window, param_list, portfolios[name], backtests[name], blotters[name])
+                timings[name] = time.perf_counter() - start
+
+            # next configuration of a sweep on the same day: the market arrays are already built
+            hist_data.switch_expiry_type('nearest_weekly')
+            sweep_portfolio = Portfolio(initial_cash=0)
+            start = time.perf_counter()
+            run_vectorized(hist_data, args.underlying, time_window, param_list, sweep_portfolio,
+                           Backtest(name='sweep', mode='algo', time_window=time_window), None)
+            sweep_time = time.perf_counter() - start
+
+            same = (_same_records(backtests['event'].getData(), backtests['vectorized'].getData())
+                    and is_same_book(get_book(portfolios['event']), get_book(portfolios['vectorized']))
+                    and np.isclose(portfolios['event'].getCash(), portfolios['vectorized'].getCash())
+                    and _same_blotter(blotters['event'], blotters['vectorized']))
+            print(f'{date} steps={len(time_window)} fills={len(blotters["event"].getDF())} | event: {timings["event"]:7.3f}s '
+                  f'| vectorized: {timings["vectorized"]:7.3f}s ({timings["event"]/timings["vectorized"]:5.1f}x) '
+                  f'| vectorized, arrays built: {sweep_time:7.3f}s ({timings["event"]/sweep_time:5.1f}x) | same results: {same}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='vectorized backtest benchmark')
+    parser.add_argument('-d', '--dates', type=str, nargs='+', default=['2021-03-10', '2021-03-11', '2021-03-12'], help='Trading dates (yyyy-mm-dd)', required=False)
+    parser.add_argument('-u', '--underlying', type=str, default='BANKNIFTY', help='Underlying of the synthetic files (their instrument)', required=False)
+    parser.add_argument('-k', '--strikes', type=int, default=40, help='Number of strikes per expiry', required=False)
+    parser.add_argument('-otm', '--otm_percentage', type=float, default=5, help='OTM percentage', required=False)
+    parser.add_argument('-ti', '--trade_interval', type=int, default=5, help='Trade interval in minutes', required=False)
+    parser.add_argument('-hi', '--hedge_interval', type=int, default=2, help='Hedge interval in minutes', required=False)
+    parser.add_argument('-us', '--unit_size', type=float, default=100, help='Unit size', required=False)
+    args = parser.parse_args()
+    main(args)
@@ -3,6 +3,8 @@ from datetime import datetime,timedelta
 import pandas as pd
 import numpy as np
 import argparse
+import os
+from yaml import load, Loader
 
 from modules import Algo
 from modules import Strategy
@@ -16,7 +18,10 @@ from modules._file_paths import UNDERLYING, OPTION_DATA
 from modules._backtest import Backtest
 from modules.global_variables import params
 from modules._logger import logger,get_exception_line_no
-from modules._utils import get_market_holidays_by_year
+from modules._calendar import get_trading_calendar
+from modules._runner import run_parallel
+from modules._sweep import run_sweep
+from modules._vectorized import VectorizedCondor
 
 # from modules._data_loader import option_data_preparation, get_underlying_price
 
@@ -72,8 +77,7 @@ def holiday(q_date_time:datetime):
     '''
 
     logger.info(f'checking whether the trading day ({q_date_time.weekday()}) is a holiday')
-    holiday_list = get_market_holidays_by_year(q_date_time.year)
-    # print(holiday_list)
+    # the holiday lists are read once per year by the trading calendar
 
     is_holiday = False
     if q_date_time.weekday() == 5:
@@ -86,7 +90,7 @@ def holiday(q_date_time:datetime):
         logger.info('#'*100)
         logger.info(f'requested trading day {q_date_time} is a sunday and not a trading day')
         logger.info('#'*100)
-    elif q_date_time.date() in holiday_list:
+    elif get_trading_calendar().is_holiday(q_date_time):
         is_holiday = True
         logger.info('#'*100)
         logger.info(f'requested trading day {q_date_time} is a holiday and not a trading day')
@@ -112,6 +116,119 @@ def get_day_difference(start_day:datetime, end_day:datetime):
     return day_difference
 
 
+def get_trading_days(start_date_time:datetime, end_date_time:datetime) -> list:
+    '''
+    Returns the (start, end) date times of every trading day (holidays are skipped) between start and end date time
+    '''
+    date_time_format = "%Y-%m-%d %H:%M:%S"
+    day_difference = get_day_difference(start_day=start_date_time, end_day=end_date_time)
+
+    trading_days = list()
+    for day in np.arange(day_difference + 1):
+        # TODO: assuming in start_date time is from 09:16:00(hh:mi:ss).
+        #       if in start_date time is other than 09:16:00(hh:mi:ss), we have to take care it separately 
+        new_start_date_time = start_date_time + timedelta(days=int(day))
+
+        # check whether new_start_date is a holiday
+        if holiday(new_start_date_time):
+            continue
+
+        if day == day_difference:
+            new_end_date_time = end_date_time
+        else:
+            # adding seconds=22440 to start_date (e.g. 2021-03-10 09:16:00) as 
+            # will push the date to trade end_date (e.g. 2021-03-10 15:30:00)
+            new_end_date_time = datetime.strptime(new_start_date_time.strftime('%Y-%m-%d') + ' ' + '15:30:00',date_time_format)
+            # new_end_date_time = new_start_date_time + timedelta(seconds=22440) #TODO: hardcoding to be moved to yaml
+        trading_days.append((new_start_date_time, new_end_date_time))
+
+    return trading_days
+
+
+def run_day(args, new_start_date_time:datetime, new_end_date_time:datetime, portfolio:Portfolio, backtest:Backtest=None, hist_data:HistoricalData=None):
+    '''
+    Runs the strategy over one trading day on the given portfolio.
+    Returns the Backtest of the day (None if the market data could not be loaded).
+
+    Parameters:
+        backtest: Backtest of the previous trading day, its live statistics are continued
+        hist_data: already loaded market data of the day, loaded from the data files if not given
+    '''
+    logger.info('#'*100)
+    logger.info('initiating new trading day for date {0}'.format(new_start_date_time.strftime('%Y-%m-%d')))
+    logger.info('#'*100)
+    print('#'*100)
+    print(f"new_start_time={new_start_date_time} and new_end_time={new_end_date_time}")
+    print('#'*100)
+    try:
+        if hist_data is not None:
+            eis_data = hist_data
+        else:
+            eis_data = HistoricalData(source=args.data_source,
+                                    name=args.data_name,
+                                    underlying_instrument=args.underlying,
+                                    start_date=new_start_date_time.strftime('%Y%m%d'),
+                                    end_date=new_end_date_time.strftime('%Y%m%d'),
+                                    expiry_type=args.expiry_type)
+            eis_data.load_market_data()
+        logger.info('market data loaded for {0}-{1}'.format(new_start_date_time.strftime('%Y-%m-%d'),new_end_date_time.strftime('%Y-%m-%d')))
+    except Exception as ex:
+        print(f"error while loading market data. {ex}")
+        logger.critical(f"error while loading market data at line={get_exception_line_no()}. {ex}")
+        return None
+
+    # print(get_one_minute_interval())
+    time_interval_list = get_time_interval(start_datetime=new_start_date_time,
+                                        end_datetime=new_end_date_time,
+                                        time_delta_type=args.interval_type,
+                                        time_delta_value=args.interval_value)
+
+    # live statistics continue across the trading days
+    backtest = Backtest(name='condor strategy',mode='algo',time_window=time_interval_list,
+                        online_metrics=backtest.getOnlineMetrics() if backtest is not None else None)
+
+    param_list = [args.otm_percentage,
+                  args.trade_interval,
+                  args.hedge_interval,
+                  args.unwind_time,
+                  args.unit_size,
+                  args.is_mkt_maker] # [otm_percentage,trade_interval,hedge_interval,unwind_time,unit_size,is_mkt_maker]
+    strategy = Strategy(strategy_type=args.strategy_type, 
+                        param_list=param_list,
+                        underlying_instrument=args.underlying,
+                        time_interval_list=time_interval_list) # TODO: input arguement will be used later
+    
+    #print('strategy initialized')
+    blotter = None
+    if not params['DISABLE_BLOTTER_UPDATE']:
+        blotter = Blotter()
+
+    if getattr(args, 'engine', 'event') == 'vectorized':
+        # same trades computed on arrays over the whole day
+        engine = VectorizedCondor(time_window=time_interval_list,
+                                  underlying_instrument=args.underlying,
+                                  param_list=param_list)
+        print('firing up vectorized engine')
+        engine.run(backtest=backtest, portfolio=portfolio, hist_data=eis_data, blotter=blotter)
+    else:
+        algo = Algo(time_window=time_interval_list,
+                    strategy=strategy,
+                    blotter=blotter
+                    )
+        #print('algo initialized')
+        print('firing up driver')
+        algo.driver(portfolio=portfolio, backtest=backtest, hist_data=eis_data)
+
+    print(portfolio)
+    
+    if not params['DISABLE_BLOTTER_UPDATE']:
+        print(blotter)
+        print(f'Rows in Portfolio {portfolio.getDF().shape[0]}')
+
+    print(f'statistics of the run: {backtest.getOnlineMetrics()}')
+    return backtest
+
+
 def main(args):
    
     try:
@@ -134,99 +251,44 @@ def main(args):
         logger.info('#'*100)
         logger.info('starting main')
         logger.info('initializing portfolio')
-        portfolio = Portfolio(initial_cash=args.initial_cash)
         print('#'*100)
         print(f"trade simulator is running for {day_difference} days")
         print('#'*100)
-        for day in np.arange(day_difference + 1):
-            try:
-                # if (day_difference > 0):
-                # TODO: assuming in start_date time is from 09:16:00(hh:mi:ss).
-                #       if in start_date time is other than 09:16:00(hh:mi:ss), we have to take care it separately 
-                new_start_date_time = start_date_time + timedelta(days=int(day))
-
-                # check whether new_start_date is a holiday
-                if holiday(new_start_date_time):
-                    continue
-
-                if day == day_difference:
-                    new_end_date_time = end_date_time
-                else:
-                    # adding seconds=22440 to start_date (e.g. 2021-03-10 09:16:00) as 
-                    # will push the date to trade end_date (e.g. 2021-03-10 15:30:00)
-                    new_end_date_time = datetime.strptime(new_start_date_time.strftime('%Y-%m-%d') + ' ' + '15:30:00',date_time_format)
-                    # new_end_date_time = new_start_date_time + timedelta(seconds=22440) #TODO: hardcoding to be moved to yaml
-
-                logger.info('#'*100)
-                logger.info('initiating new trading day for date {0}'.format(new_start_date_time.strftime('%Y-%m-%d')))
-                logger.info('#'*100)
-                print('#'*100)
-                print(f"new_start_time={new_start_date_time} and new_end_time={new_end_date_time}")
-                print('#'*100)
+        trading_days = get_trading_days(start_date_time=start_date_time, end_date_time=end_date_time)
+        str_start_time = start_date_time.strftime('%Y%m%d%H%M%S')
+        str_end_time = end_date_time.strftime('%Y%m%d%H%M%S')
+
+        if args.sweep:
+            # every configuration of the grid over the same days, the results table replaces the portfolio file
+            grid = load(open(args.sweep).read(), Loader=Loader)
+            results = run_sweep(args, trading_days=trading_days, run_day=run_day, grid=grid, workers=args.workers)
+            os.makedirs(params['OBJ_STORE'], exist_ok=True)
+            results.to_csv(os.path.join(params['OBJ_STORE'], f'EIS_sweep_{str_start_time}_{str_end_time}.csv'), index=False)
+            print(results)
+            return
+
+        if args.workers > 1:
+            # independent segments of trading days on a process pool
+            portfolio = run_parallel(args, trading_days=trading_days, run_day=run_day, workers=args.workers)
+        else:
+            portfolio = Portfolio(initial_cash=args.initial_cash)
+            backtest = None
+            for new_start_date_time, new_end_date_time in trading_days:
                 try:
-                    eis_data = HistoricalData(source=args.data_source,
-                                            name=args.data_name,
-                                            underlying_instrument=args.underlying,
-                                            start_date=new_start_date_time.strftime('%Y%m%d'),
-                                            end_date=new_end_date_time.strftime('%Y%m%d'),
-                                            expiry_type=args.expiry_type)
-                    eis_data.load_market_data()
-                    logger.info('market data loaded for {0}-{1}'.format(new_start_date_time.strftime('%Y-%m-%d'),new_end_date_time.strftime('%Y-%m-%d')))
+                    backtest = run_day(args, new_start_date_time, new_end_date_time, portfolio=portfolio, backtest=backtest) or backtest
+
+                    if (backtest is not None) and backtest.should_stop():
+                        logger.warning(f'run stopped early on {new_start_date_time.strftime("%Y-%m-%d")}, max drawdown beyond the limit')
+                        break
+
+                    #blotter.serialize()
+                    #portfolio.serialize()
+                    # TODO: backtest to implement serialize()
+                    # backtest.serialize()
                 except Exception as ex:
-                    print(f"error while loading market data. {ex}")
-                    logger.critical(f"error while loading market data at line={get_exception_line_no()}. {ex}")
-                    continue
-
-                # print(get_one_minute_interval())
-                time_interval_list = get_time_interval(start_datetime=new_start_date_time,
-                                                    end_datetime=new_end_date_time,
-                                                    time_delta_type=args.interval_type,
-                                                    time_delta_value=args.interval_value)
-
-                backtest = Backtest(rows=375,name='condor strategy',mode='algo')
-
-                # portfolio = Portfolio(initial_cash=args.initial_cash)
-                #print('portfolio initalized')
-
-                strategy = Strategy(strategy_type=args.strategy_type, 
-                                    param_list=[args.otm_percentage,
-                                                args.trade_interval,
-                                                args.hedge_interval,
-                                                args.unwind_time,
-                                                args.unit_size,
-                                                args.is_mkt_maker], # [otm_percentage,trade_interval,hedge_interval,unwind_time,unit_size,is_mkt_maker]
-                                    underlying_instrument=args.underlying,
-                                    time_interval_list=time_interval_list) # TODO: input arguement will be used later
-                
-                #print('strategy initialized')
-                if not params['DISABLE_BLOTTER_UPDATE']:
-                    blotter = Blotter()
-
-                algo = Algo(time_window=time_interval_list,
-                            strategy=strategy,
-                            blotter=blotter
-                            )
-                #print('algo initialized')
-                print('firing up driver')
-                algo.driver(portfolio=portfolio, backtest=backtest, hist_data=eis_data)
-
-                print(portfolio)
-                
-                if not params['DISABLE_BLOTTER_UPDATE']:
-                    print(blotter)
-                    print(f'Rows in Portfolio {portfolio.getDF().shape[0]}')
-
-
-                #blotter.serialize()
-                #portfolio.serialize()
-                # TODO: backtest to implement serialize()
-                # backtest.serialize()
-            except Exception as ex:
-                logger.critical(f"exception within main at line={get_exception_line_no()}. {ex}")
+                    logger.critical(f"exception within main at line={get_exception_line_no()}. {ex}")
         
         # serialize the portfolio
-        str_start_time = start_date_time.strftime('%Y%m%d%H%M%S')
-        str_end_time = end_date_time.strftime('%Y%m%d%H%M%S')
         portfolio_filename = f'EIS_portfolio_{str_start_time}_{str_end_time}.csv'
         portfolio.serialize(portfolio_filename)
     except Exception as ex:
@@ -254,6 +316,9 @@ if __name__ == '__main__':
     parser.add_argument('-us', '--unit_size', type=float, help='Unit size',required=False)
     parser.add_argument('-mm', '--is_mkt_maker', type=int, help='Is market maker',required=False)
     parser.add_argument('-ex', '--expiry_type', type=str, help='Expiry type (possible values weekly|monthly|all)',required=False)
+    parser.add_argument('-sw', '--sweep', type=str, default=None, help='Yaml file of the parameters to sweep (e.g. trade_interval: [5, 10]), runs every combination',required=False)
+    parser.add_argument('-en', '--engine', type=str, default='event', choices=['event', 'vectorized'], help='Backtest engine, event driven or vectorized over the day (condor strategy)',required=False)
+    parser.add_argument('-w', '--workers', type=int, default=1, help='Number of processes, the date range is split into independent segments at the expiry days if more than 1',required=False)
     
     args = parser.parse_args()
 
@@ -2,9 +2,11 @@
     The Algo class which take care of all the iterations
 """
 
+import numpy as np
 import pandas as pd
 import time
 from modules._strategy import Strategy
+from modules._scheduler import ACTION_UNWIND, ACTION_TRADE, ACTION_HEDGE
 from modules._blotter import Blotter
 from modules._trade import Trade
 from modules._backtest import Backtest
@@ -32,20 +34,59 @@ class Algo():
         
 
 
+    def _record_gap(self, backtest:Backtest, portfolio:Portfolio, hist_data:HistoricalData, first_step:int, last_step:int):
+        """
+            Records the time steps first_step:last_step where nothing happens in one go.
+            The positions are not re-marked over the gap: Value, Cash, GrossExposure and Legs are carried
+            from the last event, only the net delta is read at every step.
+        """
+        if last_step <= first_step:
+            return
+        start = time.perf_counter()
+        times = self._time_window[first_step:last_step]
+        deltas = portfolio.get_portfolio_delta_over(times=times, mkt_data=hist_data)
+        steps_before = backtest.getOnlineMetrics().getSteps()
+        backtest.update_many(values=(times,
+                                     portfolio.get_portfolio_value(),
+                                     portfolio.getCash(),
+                                     deltas,
+                                     portfolio.get_gross_exposure(),
+                                     portfolio.get_number_of_legs(),
+                                     (time.perf_counter() - start)/len(times)))
+
+        if (backtest.getOnlineMetrics().getSteps() // params['BCKTST_METRICS_LOG_INTERVAL']) > (steps_before // params['BCKTST_METRICS_LOG_INTERVAL']):
+            logger.info(f'live statistics at {times[-1]}: {backtest.getOnlineMetrics()}')
+
     def driver(self,backtest:Backtest, portfolio:Portfolio, hist_data:HistoricalData):
         """
             The main driver method which will run over the time windows provided.
+            Only the time steps of the event calendar of the strategy are run, the steps in between
+            are recorded in bulk with the value of the last event carried over.
+            A time step which raises before the trade or the hedge is reached delays it and the later ones
+            by one time step, as the time step counters of the strategy polled at every step did.
         """
     
-        # print(self._time_window)
-        for t in self._time_window:
+        calendar = self._strategy.build_event_calendar(time_window=self._time_window,
+                                                       expiry_times=np.concatenate([hist_data.get_expiry_times(), portfolio.get_expiry_times()]))
+        next_step = 0 # first time step not recorded yet
+        stopped = False
+        for step, t, actions in calendar:
+            try:
+                self._record_gap(backtest, portfolio, hist_data, first_step=next_step, last_step=step)
+            except Exception as ex:
+                logger.critical(f'error while recording the time steps up to {t} at lineno={get_exception_line_no()} # {ex}')
+            next_step = step + 1
+
+            step_start = time.perf_counter()
             #Generate slice data
             mkt_data = hist_data.getSlice(t)
             logger.debug(f'at time {t} slice expiry is {mkt_data.getSliceExpiry()}')
+            # actions whose time step counter the per step strategy would not have polled yet if the step raises
+            not_polled = ACTION_TRADE | ACTION_HEDGE
             try:
                 portfolio_value = portfolio.get_portfolio_value()
                 # check whether its a unwind time
-                if self._strategy.is_unwind_time(qtime = t,active=True): # TODO: need to update with time interval as well
+                if (actions & ACTION_UNWIND) and self._strategy.is_unwind_time(qtime = t,active=True):
                     trade_list=[]
                     trade_list = self._strategy.generate_unwind_strategy(qtime=t,portfolio=portfolio,mkt_data=mkt_data)
                     if len(trade_list) !=0 : #if non empty trade list generated
@@ -60,8 +101,8 @@ class Algo():
                         logger.info(f'Portfolio total positions post unwind {sum}')
                         if params['SIMPLE_UNWIND']:
                             # removing all other positions except the cash position
-                            portfolio._portfolio_df.drop(portfolio._portfolio_df.index[1:],inplace=True)
-                            logger.debug(portfolio._portfolio_df)
+                            portfolio.drop_instruments()
+                            logger.debug(portfolio.getDF())
                         else:
                             # TODO: code logic for complex unwind
                             pass
@@ -76,24 +117,17 @@ class Algo():
                         # TODO: should we remove here the instruments whose position is zero?
                         #       or we should wait till eod to remove those?
                         logger.info('loading next expiry data after unwind')
-                        # load the next expiry after unwind
-                        # TODO: tried the following 2 lines of code to implement this logic but getting error while slicing
-                        #       need to check later because this will be more efficient code
-                        # hist_data.setExpiryType('second_weekly') # TODO: should try to make expiry_type selection more generic
-                        # hist_data.load_market_data()
-                        # mkt_data = hist_data.getSlice(t)
-
-                        hist_data = HistoricalData(source=hist_data.getSource(),
-                                                   name=hist_data.getName(),
-                                                   underlying_instrument=hist_data.getInstrument(),
-                                                   start_date=hist_data.getStartDate(),
-                                                   end_date=hist_data.getEndDate(),
-                                                   expiry_type='second_weekly') # TODO: should try to make this more generic
-                        hist_data.load_market_data()
+                        # switch to the next expiry after unwind, all the expiries of the day are already loaded
+                        hist_data.switch_expiry_type('second_weekly') # TODO: should try to make expiry_type selection more generic
                         mkt_data = hist_data.getSlice(t)
                         logger.info('next expiry data loaded after unwind')
 
-                if self._strategy.is_trading_time(qtime=t,active=True):
+                # no more unwind today once it took place or there is nothing to unwind
+                if (actions & ACTION_UNWIND) and not self._strategy.unwind_pending():
+                    calendar.cancel(ACTION_UNWIND, after_step=step)
+
+                not_polled = ACTION_HEDGE
+                if actions & ACTION_TRADE:
                     trade_list=[]
                     trade_list = self._strategy.generate_trade_strategy(t,mkt_data=mkt_data)
                     if len(trade_list) !=0 : #if non empty trade list generated
@@ -105,7 +139,8 @@ class Algo():
                         logger.info(f'Portfolio Updated with {portfolio_value}')
                     logger.info('trading strategy generated')
 
-                if self._strategy.is_hedging_time(qtime=t,active=True):
+                not_polled = 0
+                if actions & ACTION_HEDGE:
                     # TODO: at a time when both trade and hedge happens trade list may get inserted twice because of +=
                     # trade_list += self._strategy.generate_hedge_strategy(trade_time=t,portfolio=portfolio,mkt_data=mkt_data)
                     trade_list=[]
@@ -119,13 +154,36 @@ class Algo():
                         logger.info(f'Portfolio Updated with {portfolio_value}')
                     logger.info(f'Trade Strategy List {trade_list} being sent')
 
-                backtest.update(values=(t,portfolio_value))
+                backtest.update(values=(t,
+                                        portfolio_value,
+                                        portfolio.getCash(),
+                                        portfolio.get_portfolio_delta(qtime=t, mkt_data=mkt_data),
+                                        portfolio.get_gross_exposure(),
+                                        portfolio.get_number_of_legs(),
+                                        time.perf_counter() - step_start))
+
+                if (backtest.getOnlineMetrics().getSteps() % params['BCKTST_METRICS_LOG_INTERVAL']) == 0:
+                    logger.info(f'live statistics at {t}: {backtest.getOnlineMetrics()}')
+
+                if backtest.should_stop():
+                    logger.warning(f'stopping the run at {t}, max drawdown {backtest.getOnlineMetrics().getMaxDrawdown()} beyond the limit')
+                    stopped = True
+                    break
 
             except Exception as ex:
                 logger.critical(f'error while executing time step {t} at lineno={get_exception_line_no()} # {ex}')
+                if not_polled:
+                    calendar.postpone(not_polled, step=step)
+
+        if not stopped:
+            try:
+                self._record_gap(backtest, portfolio, hist_data, first_step=next_step, last_step=len(self._time_window))
+            except Exception as ex:
+                logger.critical(f'error while recording the last time steps at lineno={get_exception_line_no()} # {ex}')
         
         self._blotter.serialize(start_time=self._time_window[0],end_time=self._time_window[len(self._time_window)-1])
         # print(backtest._backtest_array)
 
         # print backtest
+        logger.info(f'statistics of the run: {backtest.getOnlineMetrics()}')
         backtest.save(backtestdatetime=self._time_window[0])
@@ -1,19 +1,157 @@
 import os
-import glob
 import datetime
 import numpy as np
 import pandas as pd
 
 from modules.global_variables import params
 from modules._logger import logger,get_exception_line_no
-from visualizer.cc_financial_statistics import financial_summary
+from modules._results_store import ResultsStore, get_store_dir
+from visualizer.cc_financial_statistics import financial_summary, financial_metrics
 from visualizer.cc_financial_plots import return_plots, max_drawdown_plots, rolling_volatility_plots, general_plots, plot_returns_heatmap, rv_distribution_scatter_plots
 
 logger = logger.getLogger("backtest")
 
+# one record per time step
+BACKTEST_DTYPE = [('Timestamp', 'M8[s]'), # time step
+                  ('Value', '<f8'), # portfolio value
+                  ('Cash', '<f8'), # cash in the portfolio
+                  ('NetDelta', '<f8'), # portfolio delta
+                  ('GrossExposure', '<f8'), # sum of the absolute values of the legs
+                  ('Legs', '<i4'), # number of legs with an open position
+                  ('Latency', '<f8')] # time taken by the step (seconds)
+
+# number of records added whenever the recorder is full
+BACKTEST_CHUNK_SIZE = 1024
+# values of the metrics which are not given to Backtest.update()
+DEFAULT_RECORD = (np.datetime64('NaT'), np.nan, np.nan, np.nan, np.nan, 0, np.nan)
+
+
+class OnlineMetrics():
+    """
+    Class Description
+    ------------------
+    Performance statistics updated in O(1) with every recorded portfolio value, available during the run.
+    Step returns are the relative changes of the value (steps from a zero value are skipped), their mean and
+    variance use the Welford algorithm. Drawdowns are in currency as the portfolio value can be negative.
+
+    Methods
+    -------
+
+    update(value) : Adds the portfolio value of a time step
+
+    getMean(), getVariance(), getStd() : Running mean, variance and standard deviation of the step returns
+
+    getPeak(), getDrawdown(), getMaxDrawdown() : Running peak of the value, current and maximum drawdown
+
+    getTimeUnderWater(), getMaxTimeUnderWater() : Current and longest number of steps below the peak
+
+    getHitRate() : Fraction of the steps with a positive PnL among the steps where the value changed
+
+    to_dict() : All the statistics
+    """
+    __slots__ = ('_steps', '_last_value', '_count', '_mean', '_m2', '_peak', '_drawdown', '_max_drawdown',
+                 '_time_under_water', '_max_time_under_water', '_hits', '_moves')
+
+    def __init__(self):
+        self._steps = 0
+        self._last_value = np.nan
+        self._count = 0 # number of step returns
+        self._mean = 0.0
+        self._m2 = 0.0
+        self._peak = np.nan
+        self._drawdown = 0.0
+        self._max_drawdown = 0.0
+        self._time_under_water = 0
+        self._max_time_under_water = 0
+        self._hits = 0
+        self._moves = 0
+
+    def update(self, value:float) -> None:
+        '''
+        Adds the portfolio value of a time step, nan values are ignored
+        '''
+        if value != value:
+            return
+        self._steps += 1
+        last_value = self._last_value
+        self._last_value = value
+
+        if last_value == last_value:
+            pnl = value - last_value
+            if pnl != 0:
+                self._moves += 1
+                self._hits += pnl > 0
+            if last_value != 0:
+                # welford update of the mean and variance of the returns
+                ret = pnl / abs(last_value)
+                self._count += 1
+                delta = ret - self._mean
+                self._mean += delta / self._count
+                self._m2 += delta * (ret - self._mean)
+
+        if not (value <= self._peak):
+            self._peak = value
+        self._drawdown = value - self._peak
+        if self._drawdown < 0:
+            self._time_under_water += 1
+            self._max_time_under_water = max(self._max_time_under_water, self._time_under_water)
+            self._max_drawdown = min(self._max_drawdown, self._drawdown)
+        else:
+            self._time_under_water = 0
+
+    def getSteps(self) -> int:
+        return self._steps
+
+    def getMean(self) -> float:
+        return self._mean if self._count > 0 else np.nan
+
+    def getVariance(self) -> float:
+        return self._m2 / (self._count - 1) if self._count > 1 else np.nan
+
+    def getStd(self) -> float:
+        return np.sqrt(self.getVariance())
+
+    def getPeak(self) -> float:
+        return self._peak
+
+    def getDrawdown(self) -> float:
+        return self._drawdown
+
+    def getMaxDrawdown(self) -> float:
+        return self._max_drawdown
+
+    def getTimeUnderWater(self) -> int:
+        return self._time_under_water
+
+    def getMaxTimeUnderWater(self) -> int:
+        return self._max_time_under_water
+
+    def getHitRate(self) -> float:
+        return self._hits / self._moves if self._moves > 0 else np.nan
+
+    def to_dict(self) -> dict:
+        return {'Steps': self._steps,
+                'MeanReturn': float(self.getMean()),
+                'StdReturn': float(self.getStd()),
+                'Peak': float(self._peak),
+                'Drawdown': float(self._drawdown),
+                'MaxDrawdown': float(self._max_drawdown),
+                'TimeUnderWater': self._time_under_water,
+                'MaxTimeUnderWater': self._max_time_under_water,
+                'HitRate': float(self.getHitRate())}
+
+    def __repr__(self) -> str:
+        return ', '.join(f'{name}={value:.6g}' for name, value in self.to_dict().items())
+
+
 class Backtest:
     # init - constructor
-    def __init__(self, rows=375, name="Condor", mode="algo", currency="INR", asset_class="Derivates") -> None:
+    def __init__(self, rows=375, name="Condor", mode="algo", currency="INR", asset_class="Derivates", time_window:list=None, online_metrics:OnlineMetrics=None) -> None:
+        """
+        rows: number of records preallocated, the recorder grows in chunks if it is not enough
+        time_window: time steps of the run, if given the recorder is sized from it
+        online_metrics: running statistics to continue (e.g. from the previous trading day), new ones if not given
+        """
         self._name = name # sets name of the strategy
         self._mode = mode.lower() # analyse or algo
         self._pointer = -1 # pointer
@@ -21,7 +159,10 @@ class Backtest:
         self._asset_class = asset_class # asset class
 
         if self._mode == "algo": # check if algo initialize array or else initialize dataframe
-            self._backtest_array = np.zeros((rows, ), dtype=[('Timestamp', 'M8[s]'), ('Value', '<f4')]) # array initialized
+            if time_window is not None:
+                rows = len(time_window)
+            self._backtest_array = np.zeros((max(rows, 1), ), dtype=BACKTEST_DTYPE) # array initialized
+            self._online_metrics = online_metrics if online_metrics is not None else OnlineMetrics() # live statistics
         elif self._mode.lower() == "analyse":
             self._backtest_df = pd.DataFrame() # df initialized
 
@@ -36,7 +177,11 @@ class Backtest:
             if self._mode == "algo":
                 file_name = f"{backtestdatetime.strftime('%Y%m%d')}" # creating file name
                 self._backtest_array = self._backtest_array[:self._pointer + 1] # may have some unfilled blocks , so taking the part upto which it has been filled
-                pd.DataFrame(self._backtest_array).to_csv(f"{params['BCKTST_STORE']}{file_name}.csv", index=False) # save to csv .
+                csv_file = f"{params['BCKTST_STORE']}{file_name}.csv"
+                pd.DataFrame(self._backtest_array[['Timestamp', 'Value']]).to_csv(csv_file, index=False) # save to csv .
+                # all the recorded metrics in the results store, read back with read() / read_records()
+                ResultsStore(get_store_dir(params['BCKTST_STORE']), BACKTEST_DTYPE).append_day(file_name, self._backtest_array, source_mtime=os.stat(csv_file).st_mtime_ns,
+                                                                                   metrics=self._online_metrics.to_dict())
             else:
                 print("Not compatible with this mode of backtest")
         except Exception as e:
@@ -45,47 +190,76 @@ class Backtest:
 
     def update(self, values:tuple) -> None: # updates the backtest array at each timestamp
         """
-        Updates the Backtest Array - given a tuple (timestamp, Value)
+        Updates the Backtest Array - given a tuple (Timestamp, Value, Cash, NetDelta, GrossExposure, Legs, Latency).
+        Trailing metrics can be omitted, they are recorded as nan (0 legs).
         """
         try:
             if self._mode == "algo":
                 self._pointer = self._pointer + 1 # updates pointer
-                self._backtest_array[self._pointer] = values # insert values in array
+                if self._pointer == len(self._backtest_array):
+                    # grow in chunks instead of overflowing
+                    self._backtest_array = np.resize(self._backtest_array, len(self._backtest_array) + BACKTEST_CHUNK_SIZE)
+                record = tuple(values) + DEFAULT_RECORD[len(values):]
+                self._backtest_array[self._pointer] = record # insert values in array
+                self._online_metrics.update(record[1]) # live statistics of the value
             else:
                 print("Not compatible with this mode of backtest")
         except Exception as e:
             logger.info(f"f'Error in update() in line : {get_exception_line_no()}, error : {e}'")
 
+    def update_many(self, values:tuple) -> None:
+        """
+        Updates the Backtest Array with many time steps at once - given a tuple of columns in the order of update(),
+        the first one (Timestamp) an array and the others arrays or scalars (same value at every step).
+        """
+        try:
+            if self._mode == "algo":
+                n_steps = len(values[0])
+                if n_steps == 0:
+                    return
+                start = self._pointer + 1
+                if start + n_steps > len(self._backtest_array):
+                    chunks = -(-(start + n_steps - len(self._backtest_array)) // BACKTEST_CHUNK_SIZE)
+                    self._backtest_array = np.resize(self._backtest_array, len(self._backtest_array) + chunks * BACKTEST_CHUNK_SIZE)
+                records = self._backtest_array[start:start + n_steps]
+                for name, column in zip(self._backtest_array.dtype.names, tuple(values) + DEFAULT_RECORD[len(values):]):
+                    records[name] = column
+                self._pointer += n_steps
+                for value in records['Value']:
+                    self._online_metrics.update(value) # live statistics of the value
+            else:
+                print("Not compatible with this mode of backtest")
+        except Exception as e:
+            logger.info(f"f'Error in update_many() in line : {get_exception_line_no()}, error : {e}'")
+
 
     def read(self, path="", start_time="", end_time="", use_date_slicing=False) -> None: # read the files of backtest and generate a dataframe.
+        """
+        Loads the daily results from the results store of path (default storage path if use_date_slicing),
+        between start_time (included) and end_time (excluded) - yyyy-mm-dd - if use_date_slicing.
+        Daily csv files not in the store yet are ingested first.
+        """
         try:
             if self._mode == "analyse":
-
-                if use_date_slicing:
-                    # if using date slicing load default storage path
-                    file_names = np.array(glob.glob(pathname=params["BCKTST_STORE"]+"*.csv")) # load all files in location
-                    file_names.sort(kind="stable")    # using insertion sort on array (fastest sorting method on almost sorted array)
-                    file_names = pd.Series(file_names).apply(lambda x: x.split("/")[-1].split(".")[-2]).values # taking only the date part and removing Backtest/ and .csv 
-                    
-                    start, end = "".join(start_time.split("-")), "".join(end_time.split("-")) # pre-process dates to format 20200101 -> receive dates in format "2020-01-01"
-                    file_names = file_names[(file_names >= start) & (file_names < end)] # take all files in the included date
-                    
-                    # create df
-                    self._backtest_df = pd.concat([pd.read_csv(params["BCKTST_STORE"] + file_path + ".csv") for file_path in file_names], axis=0) # loading and concatenating all files into a single dataframe
-                else:
-                    file_names = np.array(glob.glob(pathname=path+"*.csv")) # sorting all files at a particular location
-                    file_names.sort(kind="stable")    # using insertion sort on array (fastest sorting method on almost sorted array)
-                    self._backtest_df = pd.concat([pd.read_csv(file_path) for file_path in file_names], axis=0) # loading and concatenating all files into a single dataframe
-
-                # timestamp as datetime
-                self._backtest_df["Timestamp"] = pd.to_datetime(self._backtest_df["Timestamp"])
-                self._backtest_df.sort_values(by="Timestamp", inplace=True)
+                records = self.__query_store(path=params["BCKTST_STORE"] if use_date_slicing else path,
+                                             start_time=start_time if use_date_slicing else "",
+                                             end_time=end_time if use_date_slicing else "",
+                                             columns=["Timestamp", "Value"])
+                self._backtest_df = pd.DataFrame({"Timestamp": records["Timestamp"].astype("M8[ns]"), "Value": records["Value"]})
+                self._backtest_df.sort_values(by="Timestamp", inplace=True, kind="stable")
             else:
                 print("Not compatible with this mode of backtest")
         except Exception as e:
             logger.info(f"f'Error in read() in line : {get_exception_line_no()}, error : {e}'")
 
 
+    # results store of a directory of daily files - private method
+    def __query_store(self, path="", start_time="", end_time="", columns=None) -> np.ndarray:
+        store = ResultsStore(get_store_dir(path), BACKTEST_DTYPE)
+        store.ingest_csv(path, max_workers=params["BCKTST_READ_WORKERS"])
+        return store.query(start_time, end_time, columns=columns)
+
+
     # Plots All Charts
     def plotCharts(self, freq="D", agg="last", chart_width=900, chart_height=450, window=10) -> None:
         """
@@ -201,11 +375,18 @@ class Backtest:
 
 
     # summary
-    def summary(self, frequency="D", agg="last") -> pd.DataFrame:
+    def summary(self, frequency="D", agg="last", formatted=True) -> pd.DataFrame:
+        """
+        frequency: Frequency of Resampling df.
+        agg: Aggregation Method.
+        formatted: formatted summary table if True, else the numeric metrics (financial_metrics)
+        """
         try:
             if self._mode == 'analyse':
-                return financial_summary(self.__resample_df(frequency=frequency, agg=agg).reset_index(), 
-                            frequency=frequency, date_col="Timestamp", col_name_cagr="Value", risk_free_rate=params["RISK_FREE_RATE"], asset_class=self.getAssetclass())
+                summary_df = self.__resample_df(frequency=frequency, agg=agg).reset_index()
+                if not formatted:
+                    return financial_metrics(summary_df["Value"], summary_df["Timestamp"], frequency=frequency, risk_free_rate=params["RISK_FREE_RATE"])
+                return financial_summary(summary_df, frequency=frequency, date_col="Timestamp", col_name_cagr="Value", risk_free_rate=params["RISK_FREE_RATE"], asset_class=self.getAssetclass())
             else:
                 print("Not compatible with this mode of backtest")   
         except Exception as e:
@@ -217,6 +398,27 @@ class Backtest:
         return pd.Series(port_values).diff().cumsum().values
 
 
+    def read_records(self, path="", start_time="", end_time="") -> pd.DataFrame:
+        """
+        Reads all the metrics saved by save(), between start_time and end_time (yyyy-mm-dd)
+        from the results store of path (default storage path if not given)
+        """
+        try:
+            records = pd.DataFrame(self.__query_store(path=path or params["BCKTST_STORE"], start_time=start_time, end_time=end_time))
+            return records.sort_values(by="Timestamp", kind="stable")
+        except Exception as e:
+            logger.info(f"f'Error in read_records() in line : {get_exception_line_no()}, error : {e}'")
+
+    def should_stop(self) -> bool:
+        """
+        True if the run should be stopped early, i.e. the max drawdown went beyond params['BCKTST_STOP_DRAWDOWN']
+        """
+        limit = params.get("BCKTST_STOP_DRAWDOWN")
+        return (self._mode == "algo") and (limit is not None) and (self._online_metrics.getMaxDrawdown() <= -abs(limit))
+
+    def getOnlineMetrics(self) -> OnlineMetrics: # live statistics of the run
+        return self._online_metrics
+
     def getData(self): # get data, return a numpy array if phase is "algo" else return "dataframe"
         if self._mode == "algo":
             return self._backtest_array[:self._pointer + 1]
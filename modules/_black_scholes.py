@@ -25,7 +25,7 @@ def implied_volatility_options(price:float, S:float, K:int, t:float, r:float, q:
         annualised time to maturity
     q: float
         Dividend rate of the underlying
-    option_type: array
+    option_type: str or array
         Indicating the type of the option - (call/put)
 
     Returns
@@ -33,10 +33,14 @@ def implied_volatility_options(price:float, S:float, K:int, t:float, r:float, q:
     array: Implied Volatility of the Option
 
     """
-    if option_type == "CE":
-        flag = "c"
-    elif option_type == "PE":
-        flag = "p"
+    if isinstance(option_type, str):
+        if option_type == "CE":
+            flag = "c"
+        elif option_type == "PE":
+            flag = "p"
+    else:
+        # one option type per contract
+        flag = np.where(np.asarray(option_type) == "CE", "c", "p")
 
     volatility = sigma.vectorized_implied_volatility(price=price, S=S, K=K, t=t, r=r, flag=flag, q=q, model='black_scholes_merton', return_as='numpy')
 
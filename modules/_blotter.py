@@ -1,5 +1,8 @@
 
 import os
+import shutil
+import weakref
+import tempfile
 import pandas as pd
 from datetime import datetime
 
@@ -8,7 +11,7 @@ from ._portfolio import Portfolio
 from ._historical_data import HistoricalData
 from ._trade import Trade
 from .global_variables import params
-from modules._logger import logger
+from modules._logger import logger,get_exception_line_no
 
 logger = logger.getLogger('blotter')
 
@@ -17,30 +20,128 @@ import numpy as np
 # TODO: need to increment as string (e.g.'000001' -> '000002')
 # SEQ_INIT=params['LAST_SEQ']
 
+# initial number of rows of the blotter buffers, doubled until BLOTTER_CHUNK_SIZE
+BLOTTER_INIT_CAPACITY = 1024
+
+# columns of the blotter and their types
+BLOTTER_COLUMNS = {'trade_id': np.int64,
+                   'time': 'datetime64[ns]',
+                   'instrument_id': np.int64,
+                   'position': np.float64,
+                   'price': np.float64}
+
 class Blotter():
     """
-        This class will keep track of all the trades happening
+        This class will keep track of all the trades happening.
+
+        The trades are appended into typed column buffers which grow geometrically up to 
+        BLOTTER_CHUNK_SIZE rows. A full buffer is flushed as one columnar chunk (.npz, one array per column)
+        into a spool directory and the buffer is reused. serialize() streams the chunks and the buffer 
+        into the final csv file, the whole blotter is never materialized as a single DataFrame.
     """
-    def __init__(self):
-        # initialize the dataframe where the trades will be stored
-        self._blotter_df = pd.DataFrame(columns=['trade_id','time','instrument_id','position','price'])
-        # store the instrument object here
+    def __init__(self, chunk_size:int=params['BLOTTER_CHUNK_SIZE']):
+        # column buffers where the trades are appended, self._size rows are filled
+        self._chunk_size = chunk_size
+        self._columns = {name: np.zeros(min(BLOTTER_INIT_CAPACITY, chunk_size), dtype=dtype) for name, dtype in BLOTTER_COLUMNS.items()}
+        self._size = 0
+        # chunks already flushed to the spool directory
+        self._chunks = list()
+        self._n_flushed = 0
+        self._spool_dir = None
+        self._instrument_ids = set()
         # inititize the sequence for the trades
         self.id_sequence = params['LAST_SEQ']
 
     def __repr__(self):
         repr_str = 'Blotter \n'
-        rep_str = 'Unique Intrument IDs : {0}\n'.format(len(self._blotter_df['instrument_id'].unique()))
-        rep_str += f'Number of Trades : {self._blotter_df.shape[0]}\n'
-        repr_str += self._blotter_df.__repr__()
+        repr_str += 'Unique Intrument IDs : {0}\n'.format(len(self._instrument_ids))
+        repr_str += f'Number of Trades : {len(self)}\n'
+        # latest trades only, read from the buffer
+        repr_str += self.get_buffer_df().__repr__()
         return repr_str
 
+    def __len__(self):
+        return self._n_flushed + self._size
+
     def get_next_sequence(self)->int:
         # seq = str(self.id_sequence)
         last_seq = self.id_sequence
         self.id_sequence += 1
         return last_seq
 
+    def _append(self, trade_id:int, time, instrument_id:int, position:float, price:float) -> None:
+        '''
+        Appends one trade to the column buffers, the buffers grow geometrically and are flushed when they are full
+        '''
+        if self._size == len(self._columns['trade_id']):
+            if self._size >= self._chunk_size:
+                self.flush()
+            else:
+                capacity = min(2 * self._size, self._chunk_size)
+                for name in self._columns:
+                    self._columns[name] = np.resize(self._columns[name], capacity)
+
+        row = self._size
+        self._columns['trade_id'][row] = trade_id
+        self._columns['time'][row] = np.datetime64(pd.Timestamp(time))
+        self._columns['instrument_id'][row] = instrument_id
+        self._columns['position'][row] = position
+        self._columns['price'][row] = price
+        self._size += 1
+        self._instrument_ids.add(instrument_id)
+
+    def flush(self) -> None:
+        '''
+        Writes the filled part of the buffers as one columnar chunk into the spool directory and empties the buffers
+        '''
+        try:
+            if self._size == 0:
+                return
+            if self._spool_dir is None:
+                self._spool_dir = tempfile.mkdtemp(prefix='blotter_')
+                # the spool directory is removed with the blotter
+                weakref.finalize(self, shutil.rmtree, self._spool_dir, True)
+
+            chunk_path = os.path.join(self._spool_dir, f'chunk_{len(self._chunks):06d}.npz')
+            np.savez(chunk_path, **{name: column[:self._size] for name, column in self._columns.items()})
+            self._chunks.append(chunk_path)
+            self._n_flushed += self._size
+            self._size = 0
+            logger.debug(f'blotter chunk flushed to {chunk_path}')
+
+        except Exception as e:
+            logger.critical(f'Error in flush in line {get_exception_line_no()}, error : {e}')
+            raise e
+
+    def _iter_chunks(self):
+        '''
+        Yields the flushed chunks and then the buffer as DataFrames, one at a time
+        '''
+        for chunk_path in self._chunks:
+            with np.load(chunk_path) as chunk:
+                yield pd.DataFrame({name: chunk[name] for name in BLOTTER_COLUMNS})
+        yield self.get_buffer_df()
+
+    def get_buffer_df(self) -> pd.DataFrame:
+        '''
+        Returns the trades which are still in the buffer (the latest ones)
+        '''
+        return pd.DataFrame({name: column[:self._size] for name, column in self._columns.items()},
+                            index=self._columns['trade_id'][:self._size])
+
+    def getDF(self) -> pd.DataFrame:
+        '''
+        Returns all the trades as a DataFrame. Meant for reporting, the chunks are read back from the spool directory
+        '''
+        blotter_df = pd.concat(list(self._iter_chunks()), axis=0)
+        blotter_df.index = blotter_df['trade_id'].to_numpy()
+        return blotter_df
+
+    @property
+    def _blotter_df(self) -> pd.DataFrame:
+        # kept for the notebooks which read the DataFrame directly
+        return self.getDF()
+
     def add(self,
             trade_list:list(), 
             trade_time):
@@ -55,24 +156,15 @@ class Blotter():
        
         logger.info(f'blotter update with {trade_list}')
         
-        #portfolio_trade_list = []
-        end_date_updated = False
         for trade in trade_list:
             logger.info(f'blotter:dealing with {trade}')
             
             instrument_id, price, time, position, trader_id, portfolio_id = trade.decompose()
-            dict = {'instrument_id':instrument_id,
-                    'time':trade_time,
-                    'position':position,
-                    'trade_id':self.get_next_sequence(),
-                    'price':price
-                    }
-
-            # trade.set_trade_id(dict['trade_id'][0])
-            # self.data = self.data.append(pd.DataFrame([instrument_id,time,position,trader_id],index=['instrument_id','time','position','trade_id']).T)
-            # self.data = self.data.append(dict,ignore_index=True)
-            # self._blotter_df = self._blotter_df.append(pd.DataFrame(dict), ignore_index=True)
-            self._blotter_df.loc[dict['trade_id']] = dict
+            self._append(trade_id=self.get_next_sequence(),
+                         time=trade_time,
+                         instrument_id=instrument_id,
+                         position=position,
+                         price=price)
 
         if params['DEBUG']:
             print('*'*100)
@@ -82,9 +174,23 @@ class Blotter():
             print('-'*100)
 
 
+    def add_fills(self, times, instrument_ids, positions, prices) -> None:
+        '''
+        Adds already executed trades given as columns (e.g. the fills of the vectorized backtest), in their order
+        '''
+        for time, instrument_id, position, price in zip(times, np.asarray(instrument_ids).tolist(),
+                                                        np.asarray(positions).tolist(), np.asarray(prices).tolist()):
+            self._append(trade_id=self.get_next_sequence(),
+                         time=time,
+                         instrument_id=instrument_id,
+                         position=position,
+                         price=price)
+        logger.info(f'blotter update with {len(positions)} fills')
+
     def serialize(self, start_time:datetime, end_time:datetime):
         '''
-        This funciton will save the blotter_df in a specific directory.
+        This funciton will save the blotter in a specific directory. The chunks are 
+        streamed into the csv file one after the other.
         '''
         try:
             if not os.path.exists(params['BLOTTER_STORE']):
@@ -93,7 +199,9 @@ class Blotter():
             en_time = end_time.strftime('%Y%m%d%H%M%S')
             file_name = f'blotter_{st_time}_{en_time}.csv'
             file_path = os.path.join(params['BLOTTER_STORE'],file_name)
-            self._blotter_df.to_csv(file_path, index = False)
+            with open(file_path, 'w', newline='') as f:
+                for i, chunk_df in enumerate(self._iter_chunks()):
+                    chunk_df.to_csv(f, index = False, header = (i == 0))
         
         except Exception as e:
             logger.critical(f'Error in : serialize : {e}')
@@ -103,8 +211,8 @@ class Blotter():
         print('*'*30)
         print('blotter state')
         print('-'*len('blotter state'))
-        print('Unique Intrument IDs : {0}\n'.format(len(self._blotter_df['instrument_id'].unique())))
-        print(f'Number of Trades : {self._blotter_df.shape[0]}\n')
+        print('Unique Intrument IDs : {0}\n'.format(len(self._instrument_ids)))
+        print(f'Number of Trades : {len(self)}\n')
         
         print(self)
         print('*'*30)
@@ -0,0 +1,191 @@
+"""
+    Trading calendar of the NSE: sessions, holidays and time to expiry
+"""
+
+import hashlib
+import numpy as np
+import pandas as pd
+from datetime import datetime
+
+from .global_variables import params
+from modules._utils import get_market_holidays_by_year
+from modules._logger import logger,get_exception_line_no
+
+logger = logger.getLogger('calendar')
+
+NS_PER_DAY = 86400 * 10**9
+NS_PER_MINUTE = 60 * 10**9
+
+# bases of the annualised time to expiry
+BASIS_CALENDAR = 'calendar' # calendar days left x session minutes + minutes left, over a fixed number of trading days a year
+BASIS_TRADING = 'trading' # trading minutes left (sessions of the trading days only), over the trading minutes of the year
+
+# calendar shared by everything in the process, see get_trading_calendar()
+_calendar = None
+
+
+def _to_ns(values) -> np.ndarray:
+    return np.asarray(values, dtype='datetime64[ns]').astype(np.int64)
+
+
+def _minutes_of_day(value:str) -> int:
+    time_of_day = datetime.strptime(value, '%H:%M:%S')
+    return time_of_day.hour * 60 + time_of_day.minute
+
+
+class TradingCalendar():
+    """
+    Class Description
+    ------------------
+    Trading calendar, the holiday lists are read once per year and kept in memory.
+    The time to expiry (annualised) is computed vectorized on arrays of (time, expiry).
+
+    Parameters
+    ----------
+    session_start : start of the trading session (hh:mm:ss)
+    session_end : end of the trading session (hh:mm:ss)
+    basis : BASIS_CALENDAR or BASIS_TRADING, see time_to_expiry()
+    trading_days_per_year : trading days a year of the calendar basis (before the holidays)
+    holidays_per_year : trading holidays a year of the calendar basis
+
+    Methods
+    -------
+
+    is_holiday(q_date) : Returns True if the date is a weekend or a market holiday
+
+    getHolidays(year) : Returns the market holidays of a year
+
+    time_to_expiry(t, expiry) : Returns the annualised time to expiry of every (time, expiry)
+
+    time_to_expiry_table(times, expiries) : Returns the annualised time to expiry of every time (rows) and expiry (columns)
+
+    getSignature(years) : Returns a key of everything the time to expiry of the years depends on
+    """
+    def __init__(self, session_start:str, session_end:str, basis:str=BASIS_CALENDAR,
+                 trading_days_per_year:int=252, holidays_per_year:int=16):
+        if basis not in (BASIS_CALENDAR, BASIS_TRADING):
+            raise ValueError(f'unknown time to expiry basis {basis}, should be among {(BASIS_CALENDAR, BASIS_TRADING)}')
+        self._session_start = _minutes_of_day(session_start)
+        self._session_end = _minutes_of_day(session_end)
+        self._session_minutes = self._session_end - self._session_start
+        self._basis = basis
+        self._trading_days_per_year = trading_days_per_year
+        self._holidays_per_year = holidays_per_year
+        # year -> market holidays (datetime64[D]), loaded on first use
+        self._holidays = dict()
+
+    def getHolidays(self, year:int) -> np.ndarray:
+        '''
+        Returns the sorted market holidays of a year, read from the holiday list the first time only
+        '''
+        if year not in self._holidays:
+            try:
+                holiday_list = get_market_holidays_by_year(year)
+            except Exception as e:
+                logger.critical(f'Error in getHolidays in line {get_exception_line_no()}, error : {e}')
+                raise e
+            self._holidays[year] = np.unique(np.array(holiday_list, dtype='datetime64[D]'))
+            logger.info(f'{len(self._holidays[year])} market holidays loaded for {year}')
+        return self._holidays[year]
+
+    def _get_holidays(self, years) -> np.ndarray:
+        return np.concatenate([self.getHolidays(int(year)) for year in sorted(set(years))] or [np.zeros(0, dtype='datetime64[D]')])
+
+    def is_holiday(self, q_date) -> bool:
+        '''
+        Returns True if the date is a saturday, a sunday or a market holiday
+        '''
+        day = np.datetime64(pd.Timestamp(q_date).date(), 'D')
+        return not np.is_busday(day, holidays=self.getHolidays(pd.Timestamp(q_date).year))
+
+    def getTradingDaysInYear(self, year:int) -> int:
+        '''
+        Returns the number of trading days of a year
+        '''
+        return int(np.busday_count(np.datetime64(f'{year}-01-01'), np.datetime64(f'{year + 1}-01-01'), holidays=self.getHolidays(year)))
+
+    def time_to_expiry(self, t, expiry, total_trading_holidays:int=None) -> np.ndarray:
+        '''
+        Returns the annualised time to expiry of every (t, expiry), both broadcast against each other.
+
+        Parameters
+        ----------
+        t: current time(s), date times or nanoseconds since epoch
+        expiry: expiry time(s), date times or nanoseconds since epoch
+        total_trading_holidays: trading holidays a year of the calendar basis, the one of the calendar if not given
+
+        Returns
+        -------
+        Annualised time (in minutes), on the basis of the calendar:
+            calendar: (calendar days left x session minutes + minutes left) / ((trading days - holidays) x session minutes)
+            trading: session minutes left on the trading days / session minutes of the trading days of the year of t
+        '''
+        t_ns, expiry_ns = np.broadcast_arrays(_to_ns(t), _to_ns(expiry))
+
+        if self._basis == BASIS_CALENDAR:
+            holidays = self._holidays_per_year if total_trading_holidays is None else total_trading_holidays
+            time_left = expiry_ns - t_ns
+            days_left = time_left // NS_PER_DAY
+            minutes_left = (time_left - days_left * NS_PER_DAY) // NS_PER_MINUTE
+            time_left_in_mins = (days_left * self._session_minutes) + minutes_left
+            return time_left_in_mins / ((self._trading_days_per_year - holidays) * self._session_minutes)
+
+        t_day, expiry_day = t_ns.astype('datetime64[ns]').astype('datetime64[D]'), expiry_ns.astype('datetime64[ns]').astype('datetime64[D]')
+        years = t_day.astype('datetime64[Y]').astype(int) + 1970
+        holidays = self._get_holidays(np.concatenate([np.unique(years), np.unique(expiry_day.astype('datetime64[Y]').astype(int) + 1970)]))
+
+        # minutes into the session of each time, clipped to the session
+        t_minutes = np.clip((t_ns - t_day.astype('datetime64[ns]').astype(np.int64)) // NS_PER_MINUTE - self._session_start, 0, self._session_minutes)
+        expiry_minutes = np.clip((expiry_ns - expiry_day.astype('datetime64[ns]').astype(np.int64)) // NS_PER_MINUTE - self._session_start, 0, self._session_minutes)
+
+        # full sessions from the day of t (included) to the day of the expiry (excluded), then the part of the sessions
+        # before t on its day and before the expiry on its day
+        days = np.busday_count(t_day, expiry_day, holidays=holidays)
+        minutes_left = (days * self._session_minutes
+                        - t_minutes * np.is_busday(t_day, holidays=holidays)
+                        + expiry_minutes * np.is_busday(expiry_day, holidays=holidays))
+
+        unique_years, year_idx = np.unique(years, return_inverse=True)
+        minutes_in_year = np.array([self.getTradingDaysInYear(int(year)) for year in unique_years]) * self._session_minutes
+        return minutes_left / minutes_in_year[year_idx].reshape(minutes_left.shape)
+
+    def time_to_expiry_table(self, times, expiries) -> np.ndarray:
+        '''
+        Returns an array of shape (len(times), len(expiries)) of the annualised time to expiry
+        of every time and expiry, to be looked up by (time index, expiry index)
+        '''
+        return self.time_to_expiry(_to_ns(times)[:, None], _to_ns(expiries)[None, :])
+
+    def getSignature(self, years=()) -> str:
+        '''
+        Returns a key of everything the time to expiry of the given years depends on (e.g. for the cache of the greeks)
+        '''
+        key = f'{self._basis}|{self._session_start}|{self._session_end}'
+        if self._basis == BASIS_CALENDAR:
+            key += f'|{self._trading_days_per_year}|{self._holidays_per_year}'
+        else:
+            key += '|' + ','.join(f'{year}:{self.getHolidays(int(year)).astype(str).tolist()}' for year in sorted(set(years)))
+        return hashlib.sha1(key.encode()).hexdigest()[:16]
+
+    def getBasis(self) -> str:
+        return self._basis
+
+    def getSessionMinutes(self) -> int:
+        return self._session_minutes
+
+    def __repr__(self):
+        return f'TradingCalendar(basis={self._basis}, session={self._session_minutes} minutes)'
+
+
+def get_trading_calendar() -> TradingCalendar:
+    '''
+    Returns the trading calendar of the process, built from the params the first time
+    '''
+    global _calendar
+    if _calendar is None:
+        _calendar = TradingCalendar(session_start=params['TRADING_START_TIME'],
+                                    session_end=params['TRADING_END_TIME'],
+                                    basis=params['TIME_TO_EXPIRY_BASIS'],
+                                    trading_days_per_year=params['TRADING_DAYS_PER_YEAR'],
+                                    holidays_per_year=params['TRADING_HOLIDAYS_PER_YEAR'])
+    return _calendar
@@ -0,0 +1,437 @@
+import numpy as np
+import pandas as pd
+
+from modules._logger import logger
+from modules._spot_engine import SyntheticSpot
+
+logger = logger.getLogger('chain_store')
+
+# option types are kept as small integer codes inside the store
+OPTION_TYPE_CODES = {'CE': 0, 'PE': 1}
+
+# arrays making up a store, see ChainStore.to_arrays()
+CHAIN_ARRAYS = ('_time', '_expiry', '_type', '_strike', '_bid', '_bid_qty', '_ask', '_ask_qty', '_token',
+                '_instruments', '_instrument', '_times', '_offsets', '_time_idx', '_first_expiry',
+                '_token_order', '_sorted_token', '_time_token_key', '_expiries', '_block_key', '_block_start')
+
+
+def to_ns(value) -> int:
+    '''
+    converts a datetime, np.datetime64, pd.Timestamp or a date time string
+    into nanoseconds since epoch (the representation used inside ChainStore)
+    '''
+    return pd.Timestamp(value).value
+
+
+class ChainStore():
+    """
+    Class Description
+    ------------------
+    In-memory, columnar option-chain store built once from the preprocessed market data.
+    All the rows are kept in NumPy arrays sorted by (timestamp, expiry, type, strike) and a
+    per-timestamp row-offset table points to the block of rows for every timestamp.
+    A quote lookup is therefore a few binary searches inside a single time block
+    instead of a boolean mask over the whole DataFrame.
+
+    Parameters
+    ----------
+    data : preprocessed market data (output of preprocess_eis_data) with 'Date Time' as index
+
+    Methods
+    -------
+
+    time_bounds(t) : Returns (lo, hi) row bounds of the block at time t
+
+    type_bounds(t, option_type, expiry) : Returns (lo, hi) row bounds of a single strike ladder
+
+    find(t, option_type, expiry, strike) : Returns the row of the option or -1
+
+    get_quote(row) : Returns bid price, bid qty, ask price, ask qty of a row
+
+    closest_strike_row(lo, hi, target) : Returns the row of the strike closest to target
+
+    get_spot(t) : Returns the synthetic spot at time t
+
+    get_rows_by_ids(t, ids) : Returns the rows of the instrument ids (ExchToken) at time t
+
+    get_quotes_by_ids(t, ids) : Returns bid price, bid qty, ask price, ask qty for all the ids at time t
+
+    time_indices(times), type_bounds_over(time_idx, expiry, option_type), closest_strike_rows_over(lo, hi, targets),
+    get_quotes_by_ids_over(times, ids) : same lookups over many timestamps at once
+
+    to_arrays(), from_arrays(arrays) : Returns the arrays of the store, builds a store back from them
+    """
+    def __init__(self, data: pd.DataFrame):
+
+        option_type = data['Type'].to_numpy().astype(str)
+        type_code = np.full(len(option_type), -1, dtype=np.int8)
+        for name, code in OPTION_TYPE_CODES.items():
+            type_code[option_type == name] = code
+
+        times = data.index.values.astype('datetime64[ns]').view('i8')
+        expiry = data['ExpiryDateTime'].values.astype('datetime64[ns]').view('i8')
+        strike = data['Strike'].to_numpy(dtype=np.float64)
+
+        # lexsort is stable and uses the last key as the primary key
+        order = np.lexsort((strike, type_code, expiry, times))
+        order = order[type_code[order] >= 0]
+
+        # if a quote is repeated for the same (timestamp, expiry, type, strike) keep the last one
+        if len(order) > 1:
+            keys = (times[order], expiry[order], type_code[order], strike[order])
+            is_last = np.ones(len(order), dtype=bool)
+            is_last[:-1] = ~((keys[0][1:] == keys[0][:-1]) & (keys[1][1:] == keys[1][:-1]) &
+                             (keys[2][1:] == keys[2][:-1]) & (keys[3][1:] == keys[3][:-1]))
+            if not is_last.all():
+                logger.debug(f'dropping {(~is_last).sum()} duplicate quotes while building the chain store')
+            order = order[is_last]
+
+        self._time = times[order]
+        self._expiry = expiry[order]
+        self._type = type_code[order]
+        self._strike = strike[order]
+        self._bid = data['BidPrice'].to_numpy(dtype=np.float64)[order]
+        self._bid_qty = data['BidQty'].to_numpy(dtype=np.float64)[order]
+        self._ask = data['AskPrice'].to_numpy(dtype=np.float64)[order]
+        self._ask_qty = data['AskQty'].to_numpy(dtype=np.float64)[order]
+        self._token = data['ExchToken'].to_numpy(dtype=np.int64)[order]
+        self._instruments, self._instrument = np.unique(data['Instrument'].to_numpy().astype(str)[order], return_inverse=True)
+
+        # per-timestamp row-offset table: rows of self._times[i] are self._offsets[i]:self._offsets[i+1]
+        self._times, starts = np.unique(self._time, return_index=True)
+        self._offsets = np.append(starts, len(self._time)).astype(np.int64)
+        self._time_lookup = dict(zip(self._times.tolist(), range(len(self._times))))
+        self._time_idx = np.repeat(np.arange(len(self._times)), np.diff(self._offsets))
+
+        # expiry of the first row (in the order of the data) of every timestamp
+        if len(order) > 0:
+            first = np.repeat(np.minimum.reduceat(order, starts), np.diff(self._offsets))
+            self._first_expiry = self._expiry[order == first]
+        else:
+            self._first_expiry = np.zeros(0, dtype=np.int64)
+
+        # (timestamp, ExchToken) index: within every time block the rows are ordered by token
+        self._token_order = np.lexsort((self._token, self._time))
+        self._sorted_token = self._token[self._token_order]
+        # the same index as a single sorted key, to look up ids over many timestamps at once
+        self._token_base = int(self._sorted_token.min()) if len(self._sorted_token) > 0 else 0
+        self._token_span = int(self._sorted_token.max()) - self._token_base + 1 if len(self._sorted_token) > 0 else 1
+        self._time_token_key = self._time_idx * self._token_span + (self._sorted_token - self._token_base)
+
+        # first row of every (timestamp, expiry, type) block, keyed by (time index, expiry rank, type) to find
+        # the strike ladders of many timestamps at once
+        self._expiries, expiry_rank = np.unique(self._expiry, return_inverse=True)
+        block_key = (self._time_idx * len(self._expiries) + expiry_rank) * len(OPTION_TYPE_CODES) + self._type
+        is_first = np.ones(len(block_key), dtype=bool)
+        is_first[1:] = block_key[1:] != block_key[:-1]
+        self._block_key = block_key[is_first]
+        self._block_start = np.append(np.flatnonzero(is_first), len(block_key)).astype(np.int64)
+
+        # synthetic spot for every timestamp, computed once
+        self._spot = SyntheticSpot(time_idx=self._time_idx,
+                                   n_times=len(self._times),
+                                   expiry=self._expiry,
+                                   is_call=self._type == OPTION_TYPE_CODES['CE'],
+                                   strike=self._strike,
+                                   bid=self._bid,
+                                   ask=self._ask)
+
+        logger.info(f'chain store built with {len(self._time)} rows and {len(self._times)} timestamps')
+
+    def __len__(self):
+        return len(self._time)
+
+    def to_arrays(self) -> dict:
+        '''
+        Returns the arrays of the store (name -> array), e.g. to share them with other processes
+        '''
+        arrays = {name: getattr(self, name) for name in CHAIN_ARRAYS}
+        arrays['_token_range'] = np.array([self._token_base, self._token_span], dtype=np.int64)
+        arrays['_spot_bid'], arrays['_spot_ask'], arrays['_spot_mid'] = self._spot.getBid(), self._spot.getAsk(), self._spot.getMid()
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays: dict) -> 'ChainStore':
+        '''
+        Builds a store back from the arrays of to_arrays() without copying them (e.g. attached from shared memory)
+        '''
+        chain = cls.__new__(cls)
+        for name in CHAIN_ARRAYS:
+            setattr(chain, name, arrays[name])
+        chain._token_base, chain._token_span = (int(value) for value in arrays['_token_range'])
+        chain._time_lookup = dict(zip(chain._times.tolist(), range(len(chain._times))))
+        chain._spot = SyntheticSpot.from_arrays(bid=arrays['_spot_bid'], ask=arrays['_spot_ask'], mid=arrays['_spot_mid'])
+        return chain
+
+    def time_index(self, t) -> int:
+        '''
+        Returns the position of t in the timestamp table or -1 if there is no data at t
+        '''
+        return self._time_lookup.get(to_ns(t), -1)
+
+    def time_indices(self, times) -> np.ndarray:
+        '''
+        Vectorized time_index(), returns the position of every time in the timestamp table, -1 where there is no data
+        '''
+        times_ns = pd.DatetimeIndex(times).values.astype('datetime64[ns]').view('i8')
+        pos = np.searchsorted(self._times, times_ns)
+        found = pos < len(self._times)
+        found[found] = self._times[pos[found]] == times_ns[found]
+        return np.where(found, pos, -1).astype(np.int64)
+
+    def time_bounds(self, t) -> tuple:
+        '''
+        Returns the (lo, hi) row bounds of all the quotes at time t. (0, 0) if there is no data at t
+        '''
+        idx = self.time_index(t)
+        if idx < 0:
+            return 0, 0
+        return int(self._offsets[idx]), int(self._offsets[idx + 1])
+
+    def type_bounds(self, t, option_type: str, expiry) -> tuple:
+        '''
+        Returns the (lo, hi) row bounds of the quotes at time t for a single expiry and option type.
+        Rows inside the bounds are sorted by strike.
+        '''
+        lo, hi = self.time_bounds(t)
+        if lo == hi or option_type not in OPTION_TYPE_CODES:
+            return lo, lo
+
+        expiry_ns = to_ns(expiry)
+        e_lo = lo + np.searchsorted(self._expiry[lo:hi], expiry_ns, side='left')
+        e_hi = lo + np.searchsorted(self._expiry[lo:hi], expiry_ns, side='right')
+
+        code = OPTION_TYPE_CODES[option_type]
+        t_lo = e_lo + np.searchsorted(self._type[e_lo:e_hi], code, side='left')
+        t_hi = e_lo + np.searchsorted(self._type[e_lo:e_hi], code, side='right')
+
+        return int(t_lo), int(t_hi)
+
+    def type_bounds_over(self, time_idx, expiry, option_type: str) -> tuple:
+        '''
+        Vectorized type_bounds(), returns the (lo, hi) row bounds of the strike ladder of the option type
+        and of the expiry (nanoseconds since epoch, one per time) at every time index. lo == hi where there is none.
+        '''
+        time_idx = np.asarray(time_idx, dtype=np.int64)
+        expiry = np.asarray(expiry, dtype=np.int64)
+        lo = np.zeros(len(time_idx), dtype=np.int64)
+        if len(self._block_key) == 0 or option_type not in OPTION_TYPE_CODES:
+            return lo, lo.copy()
+
+        rank = np.searchsorted(self._expiries, expiry)
+        valid = (time_idx >= 0) & (rank < len(self._expiries))
+        valid[valid] = self._expiries[rank[valid]] == expiry[valid]
+
+        key = (time_idx * len(self._expiries) + rank) * len(OPTION_TYPE_CODES) + OPTION_TYPE_CODES[option_type]
+        block = np.searchsorted(self._block_key, key)
+        valid[valid] = block[valid] < len(self._block_key)
+        valid[valid] = self._block_key[block[valid]] == key[valid]
+
+        lo[valid] = self._block_start[block[valid]]
+        hi = lo.copy()
+        hi[valid] = self._block_start[block[valid] + 1]
+        return lo, hi
+
+    def find(self, t, option_type: str, expiry, strike: float) -> int:
+        '''
+        Returns the row of the option at time t or -1 if it is not quoted at t
+        '''
+        lo, hi = self.type_bounds(t, option_type, expiry)
+        row = lo + np.searchsorted(self._strike[lo:hi], strike)
+        if row < hi and self._strike[row] == strike:
+            return int(row)
+        return -1
+
+    def closest_strike_row(self, lo: int, hi: int, target: float) -> int:
+        '''
+        Returns the row (within lo:hi) whose strike is closest to the target.
+        Same rule as the previous DataFrame based logic, the upper strike (strictly above target)
+        is taken only if it is strictly closer than the lower strike (strictly below target).
+        Returns -1 if no strike is available.
+        '''
+        strikes = self._strike[lo:hi]
+        upper = np.searchsorted(strikes, target, side='right')
+        lower = np.searchsorted(strikes, target, side='left') - 1
+
+        u = strikes[upper] if upper < len(strikes) else np.nan
+        l = strikes[lower] if lower >= 0 else np.nan
+
+        if (u - target) < (target - l):
+            return int(lo + upper)
+        elif lower >= 0:
+            return int(lo + lower)
+        return -1
+
+    def closest_strike_rows(self, lo: int, hi: int, targets) -> np.ndarray:
+        '''
+        Vectorized closest_strike_row(), returns the row (within lo:hi) whose strike is closest to
+        every target, -1 where no strike is available
+        '''
+        targets = np.asarray(targets, dtype=np.float64)
+        strikes = self._strike[lo:hi]
+        upper = np.searchsorted(strikes, targets, side='right')
+        lower = np.searchsorted(strikes, targets, side='left') - 1
+
+        u = np.where(upper < len(strikes), strikes[np.minimum(upper, len(strikes) - 1)] if len(strikes) > 0 else np.nan, np.nan)
+        l = np.where(lower >= 0, strikes[np.maximum(lower, 0)] if len(strikes) > 0 else np.nan, np.nan)
+
+        return np.where((u - targets) < (targets - l), lo + upper, np.where(lower >= 0, lo + lower, -1)).astype(np.int64)
+
+    def closest_strike_rows_over(self, lo, hi, targets) -> np.ndarray:
+        '''
+        closest_strike_row() of every (lo, hi, target), e.g. one strike ladder per timestamp.
+        The ladders are laid side by side (padded) so that all the targets are searched at once.
+        '''
+        lo, hi = np.asarray(lo, dtype=np.int64), np.asarray(hi, dtype=np.int64)
+        targets = np.asarray(targets, dtype=np.float64)
+        width = int((hi - lo).max()) if len(lo) > 0 else 0
+        if width <= 0:
+            return np.full(len(lo), -1, dtype=np.int64)
+
+        rows = lo[:, None] + np.arange(width)[None, :]
+        inside = rows < hi[:, None]
+        strikes = np.where(inside, self._strike[np.minimum(rows, len(self._strike) - 1)], np.inf)
+
+        # same positions as the binary searches of closest_strike_row(), nan targets are searched past the end
+        size = hi - lo
+        upper = np.where(np.isnan(targets), size, (strikes <= targets[:, None]).sum(axis=1))
+        lower = np.where(np.isnan(targets), size, (strikes < targets[:, None]).sum(axis=1)) - 1
+
+        u = np.where(upper < size, self._strike[np.clip(lo + upper, 0, len(self._strike) - 1)], np.nan)
+        l = np.where(lower >= 0, self._strike[np.clip(lo + lower, 0, len(self._strike) - 1)], np.nan)
+
+        return np.where((u - targets) < (targets - l), lo + upper, np.where(lower >= 0, lo + lower, -1)).astype(np.int64)
+
+    def get_quote(self, row: int) -> np.ndarray:
+        '''
+        Returns bid price, bid qty, ask price, ask qty of the row
+        '''
+        return np.array([self._bid[row], self._bid_qty[row], self._ask[row], self._ask_qty[row]])
+
+    def get_rows_by_ids(self, t, ids) -> np.ndarray:
+        '''
+        Returns the rows of the instrument ids (ExchToken) at time t, -1 for the ids not quoted at t
+        '''
+        ids = np.asarray(ids, dtype=np.int64)
+        lo, hi = self.time_bounds(t)
+        pos = lo + np.searchsorted(self._sorted_token[lo:hi], ids)
+        found = pos < hi
+        found[found] = self._sorted_token[pos[found]] == ids[found]
+
+        rows = np.full(len(ids), -1, dtype=np.int64)
+        rows[found] = self._token_order[pos[found]]
+        return rows
+
+    def get_rows_by_ids_over(self, times, ids) -> np.ndarray:
+        '''
+        Returns an array of shape (len(times), len(ids)) with the rows of the instrument ids (ExchToken)
+        at every time, -1 for the ids not quoted at a time
+        '''
+        ids = np.asarray(ids, dtype=np.int64)
+        time_idx = self.time_indices(times)
+        rows = np.full((len(time_idx), len(ids)), -1, dtype=np.int64)
+        if len(self._time_token_key) == 0:
+            return rows
+
+        token = ids - self._token_base
+        valid = (time_idx[:, None] >= 0) & ((token >= 0) & (token < self._token_span))[None, :]
+        key = time_idx[:, None] * self._token_span + token[None, :]
+        pos = np.searchsorted(self._time_token_key, key[valid])
+        found = pos < len(self._time_token_key)
+        found[found] = self._time_token_key[pos[found]] == key[valid][found]
+
+        matched = np.full(len(pos), -1, dtype=np.int64)
+        matched[found] = self._token_order[pos[found]]
+        rows[valid] = matched
+        return rows
+
+    def get_quotes_by_ids(self, t, ids) -> np.ndarray:
+        '''
+        Returns an array of shape (len(ids), 4) with bid price, bid qty, ask price, ask qty
+        of every id at time t. Rows of the ids not quoted at t are filled with nan.
+        '''
+        rows = self.get_rows_by_ids(t, ids)
+        found = rows >= 0
+
+        quotes = np.full((len(rows), 4), np.nan)
+        quotes[found, 0] = self._bid[rows[found]]
+        quotes[found, 1] = self._bid_qty[rows[found]]
+        quotes[found, 2] = self._ask[rows[found]]
+        quotes[found, 3] = self._ask_qty[rows[found]]
+        return quotes
+
+    def get_quotes_by_ids_over(self, times, ids) -> np.ndarray:
+        '''
+        Returns an array of shape (len(times), len(ids), 4) with bid price, bid qty, ask price, ask qty
+        of every id at every time, nan for the ids not quoted at a time
+        '''
+        rows = self.get_rows_by_ids_over(times, ids)
+        found = rows >= 0
+
+        quotes = np.full(rows.shape + (4,), np.nan)
+        for i, column in enumerate((self._bid, self._bid_qty, self._ask, self._ask_qty)):
+            quotes[found, i] = column[rows[found]]
+        return quotes
+
+    def get_first_expiries(self, time_idx) -> np.ndarray:
+        '''
+        Vectorized get_first_expiry(), returns the expiry (nanoseconds since epoch) of the first row at every
+        time index, the smallest int64 where there is no data
+        '''
+        time_idx = np.asarray(time_idx, dtype=np.int64)
+        expiry = np.full(len(time_idx), np.iinfo(np.int64).min, dtype=np.int64)
+        expiry[time_idx >= 0] = self._first_expiry[time_idx[time_idx >= 0]]
+        return expiry
+
+    def get_expiries(self, t) -> np.ndarray:
+        '''
+        Returns the sorted unique expiries (datetime64[ns]) quoted at time t
+        '''
+        lo, hi = self.time_bounds(t)
+        return np.unique(self._expiry[lo:hi]).astype('datetime64[ns]')
+
+    def get_first_expiry(self, t):
+        '''
+        Returns the expiry (pd.Timestamp) of the first row, in the order of the data, at time t. None if there is no data at t
+        '''
+        idx = self.time_index(t)
+        return pd.Timestamp(self._first_expiry[idx]) if idx >= 0 else None
+
+    def has_underlying(self, underlying: str) -> bool:
+        return underlying in self._instruments
+
+    def get_spot(self, t) -> float:
+        '''
+        Returns the precomputed synthetic spot (mid) at time t, nan if there is no data at t
+        '''
+        return self._spot.get_mid(self.time_index(t))
+
+    def get_spot_quote(self, t) -> tuple:
+        '''
+        Returns the precomputed synthetic spot bid and ask at time t
+        '''
+        idx = self.time_index(t)
+        return self._spot.get_bid(idx), self._spot.get_ask(idx)
+
+    # getters
+
+    def getTimes(self) -> np.ndarray:
+        return self._times.astype('datetime64[ns]')
+
+    def getSpot(self) -> SyntheticSpot:
+        return self._spot
+
+    def getStrike(self, row: int) -> float:
+        return self._strike[row]
+
+    def getExpiry(self, row: int) -> pd.Timestamp:
+        return pd.Timestamp(self._expiry[row])
+
+    def getOptionType(self, row: int) -> str:
+        return 'CE' if self._type[row] == OPTION_TYPE_CODES['CE'] else 'PE'
+
+    def getToken(self, row: int) -> int:
+        return int(self._token[row])
+
+    def getInstrument(self, row: int) -> str:
+        return self._instruments[self._instrument[row]]
@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+
+from modules._logger import logger
+
+logger = logger.getLogger('contracts')
+
+
+class ContractRegistry():
+    """
+    Class Description
+    ------------------
+    Static attributes (strike, expiry, option type, underlying) of every contract of the loaded market data,
+    built once from the unique ExchTokens and kept in arrays. A contract is looked up by id in O(1).
+    One instrument object per contract is kept (flyweight), built on first request and shared by
+    the strategies and the portfolio.
+
+    Parameters
+    ----------
+    data : preprocessed market data with ExchToken, Strike, ExpiryDateTime, Type and Instrument columns
+
+    Methods
+    -------
+
+    index_of(id) : Returns the position of the contract in the arrays, -1 if unknown
+
+    indices_of(ids) : Returns the positions of many contracts at once
+
+    get_contract(id) : Returns (strike, expiry, option type, underlying) of a contract
+
+    get_object(id, factory) : Returns the instrument object of a contract, built by factory(id, strike, expiry, option_type, underlying) the first time
+    """
+    def __init__(self, data:pd.DataFrame):
+        tokens = data['ExchToken'].to_numpy(dtype=np.int64)
+        self._ids, first = np.unique(tokens, return_index=True)
+        self._strike = data['Strike'].to_numpy(dtype=np.float64)[first]
+        self._expiry = data['ExpiryDateTime'].to_numpy(dtype='datetime64[ns]')[first]
+        self._type = data['Type'].to_numpy().astype(str)[first]
+        self._underlying = data['Instrument'].to_numpy().astype(str)[first]
+        self._lookup = dict(zip(self._ids.tolist(), range(len(self._ids))))
+        # id -> instrument object, built on first request
+        self._objects = dict()
+        logger.info(f'contract registry built with {len(self._ids)} contracts')
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, id) -> bool:
+        return int(id) in self._lookup
+
+    def index_of(self, id) -> int:
+        return self._lookup.get(int(id), -1)
+
+    def indices_of(self, ids) -> np.ndarray:
+        '''
+        Vectorized index_of(), -1 for the unknown ids
+        '''
+        ids = np.asarray(ids, dtype=np.int64)
+        pos = np.searchsorted(self._ids, ids)
+        found = pos < len(self._ids)
+        found[found] = self._ids[pos[found]] == ids[found]
+        return np.where(found, pos, -1)
+
+    def get_contract(self, id) -> tuple:
+        '''
+        Returns (strike, expiry, option type, underlying) of the contract, raises KeyError if unknown
+        '''
+        idx = self._lookup[int(id)]
+        return self._strike[idx], pd.Timestamp(self._expiry[idx]), self._type[idx], self._underlying[idx]
+
+    def get_object(self, id, factory):
+        '''
+        Returns the instrument object of the contract, built by factory(id, strike, expiry, option_type, underlying)
+        on first request and reused afterwards. Raises KeyError if the contract is unknown.
+        '''
+        id = int(id)
+        instrument = self._objects.get(id)
+        if instrument is None:
+            instrument = factory(id, *self.get_contract(id))
+            self._objects[id] = instrument
+        return instrument
+
+    def getIds(self) -> np.ndarray:
+        return self._ids
+
+    def getStrikes(self) -> np.ndarray:
+        return self._strike
+
+    def getExpiries(self) -> np.ndarray:
+        return self._expiry
+
+    def getOptionTypes(self) -> np.ndarray:
+        return self._type
@@ -0,0 +1,274 @@
+import warnings
+warnings.filterwarnings("ignore")
+
+import os
+import hashlib
+import numpy as np
+import py_vollib_vectorized as pv
+
+from .global_variables import params
+from modules._market_cache import get_source_stamp
+from modules._calendar import get_trading_calendar
+from modules._black_scholes import implied_volatility_options
+from modules._logger import logger,get_exception_line_no
+
+logger = logger.getLogger('greeks')
+
+GREEKS_DTYPE = [('iv', '<f8'), ('delta', '<f8'), ('gamma', '<f8'), ('theta', '<f8'), ('vega', '<f8')]
+
+
+def compute_greeks(premium:np.ndarray, spot, strike:np.ndarray, t:np.ndarray, is_call:np.ndarray,
+                   rf:float=params["RISK_FREE_RATE"], dividend:float=params["DIVIDEND"]) -> np.ndarray:
+    '''
+    Computes implied volatility, delta, gamma, theta and vega for a whole set of options
+    with one vectorized call each for the implied volatility and for the greeks.
+
+    Parameters
+    ----------
+    premium: option premiums
+    spot: spot of the underlying (scalar or one per option)
+    strike: strikes
+    t: annualised time to expiry
+    is_call: True for calls, False for puts
+    rf: risk-free rate
+    dividend: dividend rate of the underlying
+
+    Returns
+    -------
+    structured array with fields iv, delta, gamma, theta, vega
+    '''
+    greeks = np.full(len(premium), np.nan, dtype=GREEKS_DTYPE)
+
+    # greeks are left as nan for expired options or when the spot is not available
+    spot = np.broadcast_to(np.asarray(spot, dtype=np.float64), np.shape(premium))
+    valid = (np.asarray(t) > 0) & np.isfinite(spot)
+    if not valid.any():
+        return greeks
+
+    is_call = np.asarray(is_call)[valid]
+    sigma = implied_volatility_options(price=np.asarray(premium)[valid],
+                                       S=spot[valid],
+                                       K=np.asarray(strike)[valid],
+                                       t=np.asarray(t)[valid],
+                                       r=rf,
+                                       q=dividend,
+                                       option_type=np.where(is_call, 'CE', 'PE'))
+
+    all_greeks = pv.get_all_greeks(flag=np.where(is_call, 'c', 'p'),
+                                   S=spot[valid],
+                                   K=np.asarray(strike)[valid],
+                                   t=np.asarray(t)[valid],
+                                   r=rf,
+                                   sigma=sigma,
+                                   q=dividend,
+                                   model='black_scholes',
+                                   return_as='dict')
+    greeks['iv'][valid] = sigma
+    for name in ['delta', 'gamma', 'theta', 'vega']:
+        greeks[name][valid] = all_greeks[name]
+
+    return greeks
+
+
+class GreeksEngine():
+    """
+    Class Description
+    ------------------
+    Computes the implied volatility and greeks surface of a whole time slice (all strikes and expiries at time t)
+    in one vectorized call and caches it per (timestamp, quote type). Portfolio delta, hedging and reporting
+    all read the same surface.
+
+    Parameters
+    ----------
+    chain : ChainStore of the loaded market data
+    rf : risk-free rate
+    dividend : dividend rate of the underlying
+
+    Methods
+    -------
+
+    get_surface(t, q_type) : Returns (lo, greeks) where greeks covers the chain rows lo:lo+len(greeks) at time t
+
+    get_greeks_by_ids(t, ids, q_type) : Returns the greeks of the instrument ids at time t
+
+    precompute(q_types) : Computes the greeks of every quote row of the chain
+
+    load_or_precompute(source_files, cache_tag, q_types) : Same as precompute() but reuses the on-disk cache
+
+    load_precomputed(greeks) : Uses greeks already precomputed on the same chain (e.g. shared by another process)
+
+    getPrecomputed() : Returns the precomputed greeks (quote type -> greeks of every row of the chain)
+    """
+    def __init__(self, chain, rf:float=params["RISK_FREE_RATE"], dividend:float=params["DIVIDEND"]):
+        self._chain = chain
+        self._rf = rf
+        self._dividend = dividend
+        self._surfaces = dict()
+        # greeks of every row of the chain per quote type, populated by precompute()
+        self._full = dict()
+        self._calendar = get_trading_calendar()
+        # annualised time to expiry of every (timestamp, expiry) of the chain, built on first use
+        self._expiry_idx = None
+        self._time_to_expiry = None
+
+    def _premium(self, lo:int, hi:int, q_type:str) -> np.ndarray:
+        chain = self._chain
+        if q_type.lower() == 'bid':
+            return chain._bid[lo:hi]
+        elif q_type.lower() == 'ask':
+            return chain._ask[lo:hi]
+        elif q_type.lower() == 'mid':
+            return (chain._bid[lo:hi] + chain._ask[lo:hi]) / 2
+        raise ValueError(f'quote type should be one of bid, ask or mid, got {q_type}')
+
+    def _get_time_to_expiry(self, lo:int, hi:int) -> np.ndarray:
+        '''
+        Returns the annualised time to expiry of the chain rows lo:hi, read from the (timestamp x expiry) table
+        '''
+        chain = self._chain
+        if self._time_to_expiry is None:
+            expiries, self._expiry_idx = np.unique(chain._expiry, return_inverse=True)
+            self._time_to_expiry = self._calendar.time_to_expiry_table(chain._times, expiries)
+        return self._time_to_expiry[chain._time_idx[lo:hi], self._expiry_idx[lo:hi]]
+
+    def _get_years(self) -> np.ndarray:
+        '''
+        Returns the years of the timestamps and expiries of the chain
+        '''
+        chain = self._chain
+        days = np.concatenate([chain._times, chain._expiry]).astype('datetime64[ns]').astype('datetime64[Y]')
+        return np.unique(days).astype(int) + 1970
+
+    def precompute(self, q_types:tuple=('bid', 'ask')) -> None:
+        '''
+        Computes the implied volatility and greeks of every quote row of the chain, one vectorized pass per quote type
+        '''
+        chain = self._chain
+        time_idx = chain._time_idx
+        for q_type in q_types:
+            self._full[q_type] = compute_greeks(premium=self._premium(0, len(chain), q_type),
+                                                spot=chain.getSpot().getMid()[time_idx],
+                                                strike=chain._strike,
+                                                t=self._get_time_to_expiry(0, len(chain)),
+                                                is_call=chain._type == 0,
+                                                rf=self._rf,
+                                                dividend=self._dividend)
+            logger.info(f'greeks precomputed for {len(chain)} quotes on {q_type}')
+
+    def get_cache_key(self, source_files:list, cache_tag:str='') -> str:
+        '''
+        Returns the cache key of the precomputed greeks. The key changes with the source files (their size and
+        modification time, as the binary cache of the market data), the risk-free rate, the dividend,
+        the trading calendar and any other tag (e.g. expiry type)
+        '''
+        key = hashlib.sha1()
+        for file_path in source_files:
+            stamp = get_source_stamp(file_path)
+            key.update(f'{os.path.basename(file_path)}|{stamp["size"]}|{stamp["mtime_ns"]}'.encode())
+        key.update(f'{self._rf}|{self._dividend}|{cache_tag}|{len(self._chain)}'.encode())
+        key.update(self._calendar.getSignature(years=self._get_years()).encode())
+        return key.hexdigest()
+
+    def load_or_precompute(self, source_files:list, cache_tag:str='', q_types:tuple=('bid', 'ask')) -> None:
+        '''
+        Loads the precomputed greeks from the on-disk cache, which lives next to the first source file,
+        by memory mapping them. If the cache is missing, they are computed and the cache is written.
+
+        Parameters:
+            source_files: raw data files the chain was built from
+            cache_tag: anything else that changes the rows of the chain (e.g. expiry type)
+            q_types: quote types used as premium
+        '''
+        try:
+            cache_dir = os.path.splitext(source_files[0])[0] + '.greeks'
+            cache_key = self.get_cache_key(source_files, cache_tag)
+            cache_files = {q_type: os.path.join(cache_dir, f'{cache_key}_{q_type}.npy') for q_type in q_types}
+
+            if all(os.path.exists(file_path) for file_path in cache_files.values()):
+                for q_type, file_path in cache_files.items():
+                    self._full[q_type] = np.load(file_path, mmap_mode='r')
+                logger.info(f'greeks loaded from cache {cache_dir} with key={cache_key}')
+                return
+
+            self.precompute(q_types=q_types)
+            os.makedirs(cache_dir, exist_ok=True)
+            for q_type, file_path in cache_files.items():
+                # unique temporary file, the same day can be cached by several processes at once
+                tmp_file_path = file_path + f'.{os.getpid()}.tmp.npy'
+                np.save(tmp_file_path, self._full[q_type])
+                os.replace(tmp_file_path, file_path)
+            logger.info(f'greeks cached in {cache_dir} with key={cache_key}')
+
+        except Exception as e:
+            logger.critical(f'Error in load_or_precompute in line {get_exception_line_no()}, error : {e}')
+            # greeks will be computed per time slice
+            self._full = dict()
+
+    def load_precomputed(self, greeks:dict) -> None:
+        '''
+        Uses greeks already precomputed on the same chain (quote type -> greeks of every row of the chain,
+        as returned by getPrecomputed()) without copying them
+        '''
+        self._full = dict(greeks)
+
+    def getPrecomputed(self) -> dict:
+        return self._full
+
+    def get_surface(self, t, q_type:str='mid') -> tuple:
+        '''
+        Returns (lo, greeks) where greeks is a structured array (iv, delta, gamma, theta, vega)
+        for the chain rows lo:lo+len(greeks), i.e. every option quoted at time t
+        '''
+        idx = self._chain.time_index(t)
+        key = (idx, q_type.lower())
+        if (key[1] in self._full) and (idx >= 0):
+            lo, hi = int(self._chain._offsets[idx]), int(self._chain._offsets[idx + 1])
+            return lo, self._full[key[1]][lo:hi]
+
+        if key not in self._surfaces:
+            if idx < 0:
+                self._surfaces[key] = (0, np.full(0, np.nan, dtype=GREEKS_DTYPE))
+            else:
+                chain = self._chain
+                lo, hi = int(chain._offsets[idx]), int(chain._offsets[idx + 1])
+                greeks = compute_greeks(premium=self._premium(lo, hi, q_type),
+                                        spot=chain.getSpot().get_mid(idx),
+                                        strike=chain._strike[lo:hi],
+                                        t=self._get_time_to_expiry(lo, hi),
+                                        is_call=chain._type[lo:hi] == 0,
+                                        rf=self._rf,
+                                        dividend=self._dividend)
+                self._surfaces[key] = (lo, greeks)
+                logger.debug(f'greeks surface computed for {hi - lo} options at {t} on {q_type}')
+
+        return self._surfaces[key]
+
+    def get_greeks_by_ids(self, t, ids, q_type:str='mid') -> np.ndarray:
+        '''
+        Returns a structured array (iv, delta, gamma, theta, vega) with one entry per id,
+        filled with nan for the ids not quoted at time t
+        '''
+        lo, surface = self.get_surface(t, q_type)
+        rows = self._chain.get_rows_by_ids(t, ids)
+
+        greeks = np.full(len(rows), np.nan, dtype=GREEKS_DTYPE)
+        found = rows >= 0
+        greeks[found] = surface[rows[found] - lo]
+        return greeks
+
+    def get_greeks_by_ids_over(self, times, ids, q_type:str='mid') -> np.ndarray:
+        '''
+        Returns a structured array (iv, delta, gamma, theta, vega) of shape (len(times), len(ids)),
+        filled with nan for the ids not quoted at a time. Read in one go from the precomputed greeks if any.
+        '''
+        if q_type.lower() not in self._full:
+            greeks = np.full((len(times), len(ids)), np.nan, dtype=GREEKS_DTYPE)
+            for i, t in enumerate(times):
+                greeks[i] = self.get_greeks_by_ids(t, ids, q_type=q_type)
+            return greeks
+
+        rows = self._chain.get_rows_by_ids_over(times, ids)
+        greeks = np.full(rows.shape, np.nan, dtype=GREEKS_DTYPE)
+        found = rows >= 0
+        greeks[found] = self._full[q_type.lower()][rows[found]]
+        return greeks
@@ -1,4 +1,5 @@
 import pandas as pd
+import os
 from modules._utils import load_data, preprocess_eis_data, date_difference
 from datasets import _load_data_file, DATA_PATH
 import numpy as np
@@ -8,11 +9,19 @@ from datetime import datetime
 from dateutil.relativedelta import relativedelta, TH
 from .global_variables import params
 from modules._logger import logger,get_exception_line_no
+from modules._chain_store import ChainStore
+from modules._greeks import GreeksEngine
+from modules._contracts import ContractRegistry
+from modules._market_cache import load_eis_day, concat_eis_days
 
 DEBUG = params['DEBUG']
 
 logger = logger.getLogger('historical_data')
 
+# legs selected by HistoricalData.select_legs(), with their quotes
+LEG_DTYPE = [('Leg', 'U6'), ('OptionType', 'U2'), ('Strike', 'f8'), ('Expiry', 'M8[ns]'), ('ExchToken', 'i8'),
+             ('BidPrice', 'f8'), ('BidQty', 'f8'), ('AskPrice', 'f8'), ('AskQty', 'f8')]
+
 class NoOptionsFound(Exception):
     def __init__(self, error_message: str = "No options found.") -> None:
         super().__init__(error_message)
@@ -57,6 +66,12 @@ class HistoricalData():
 
     load_market_data() : load the preprocessed market data.
 
+    iter_market_data() : lazily yields the preprocessed market data day by day.
+
+    switch_expiry_type(expiry_type) : switches to the data of another expiry type without reloading.
+
+    getExpiryViews() : Returns the expiry views built so far (data, chain store and greeks of every expiry type).
+
     get_quote(t, option_type, expiry, strike) : Return 4 tuple values such as bid price, bid qty, ask price, ask qty respectively.
 
     get_option_detail_from_id(id) : Returns a tuple which consists Strike , ExpiryDateTime, Option Type  respectively.
@@ -86,24 +101,27 @@ class HistoricalData():
         self._slice_expiry = None
         self._slice_time = None
 
+        # columnar option-chain store, gets populated within self.load_market_data()
+        # and shared with all the slices
+        self._chain = None
+        # implied volatility and greeks surfaces cached per timestamp, shared with all the slices
+        self._greeks = None
+        # raw data files loaded within self.load_market_data()
+        self._source_files = list()
+        # all the expiries of the loaded data and the (data, chain, greeks) views per expiry type,
+        # populated within self.load_market_data() and self.switch_expiry_type()
+        self._all_data = None
+        self._expiry_views = dict()
+        # static attributes of every contract of the loaded data, built within self.load_market_data()
+        self._contracts = None
+
 
     def getSlice(self,t:datetime):
         '''
-        returns a historical data object for  smaller time slice also stores current slice
-        same methods will work on it
+        returns a light weight view (HistoricalDataSlice) of the data at time t, 
+        same query methods will work on it
         '''
-        slice_data = HistoricalData('','','',t,t)
-        slice_data._data = self._data.loc[t]
-        slice_data._source = self._source
-        slice_data._instrument = self._instrument
-        slice_data._name = self._name
-        slice_data._expiry_type = self._expiry_type
-        slice_data._slice_expiry = slice_data._data["ExpiryDateTime"][0] #this is the ONLY expiry in the slice
-        slice_data._slice_time = t
-
-        #Need to fix indexing and then change it across the board in all methods
-
-        return slice_data
+        return HistoricalDataSlice(self, t)
                                
 
     def get_slice_expiry(self):
@@ -264,76 +282,104 @@ class HistoricalData():
         else:
             logger.debug('This Expiry Type is not available. Please Select from the list:[weekly, monthly, nearest_weekly, nearest_monthly]')
 
-    def load_market_data(self):
+    def load_market_data(self, data:pd.DataFrame=None, source_files:list=None, expiry_views:dict=None):
         """
         Method Description
         ------------------
         
         method inside historical data object
+
+        data : already preprocessed market data (e.g. attached from shared memory), the files are not read if given
+        source_files : raw data files data was loaded from
+        expiry_views : expiry views already built on data (expiry type -> (data, chain store, greeks engine), see getExpiryViews())
     
         Return : return a object filled with market dataframe 
         """
         
+        if data is not None:
+            self._source_files = list(source_files or [])
+            self._data = data
         # eis data 
-        if self._source =='eis_data':
-            dates = pd.date_range(start=self._start_date,end=self._end_date).strftime('%Y-%m-%d').to_list()
-            # final_df = pd.DataFrame(columns=self._data.columns)
-            self._data = pd.DataFrame(columns=self._data.columns)
-            for date in dates:
-                    
-                    # assumption date format : 2021-03-10 09:16:00
-                    year = date[:4]
-                    month = date[5:7]
-                    day = date[8:10]
-                    
-                    date = year+month+day
-                
-                    data_np, columes = _load_data_file(DATA_PATH, self._instrument +'_'+ date + '_Intraday.csv')
-                    df = pd.DataFrame(data_np,columns=self._data.columns)
-                    
-                    # final_df = pd.concat([final_df, df], axis = 0)
-                    self._data = pd.concat([self._data, df], axis = 0)
+        elif self._source =='eis_data':
+            # day frames are collected and concatenated once
+            self._source_files = list()
+            frames = list()
+            for file_name, df in self.iter_market_data():
+                self._source_files.append(os.path.join(DATA_PATH, file_name))
+                frames.append(df)
+
+            if len(frames) > 0:
+                self._data = concat_eis_days(frames)
+            else:
+                self._data = pd.DataFrame(columns=self._data.columns)
+            del frames
         elif self._source == 'refinitiv':
             logger.debug("This source is not available")
         else:
             # TODO: should raise exception
             logger.debug("Please type the source from given names ('eis_data')")
 
-        self.preprocess()
-        
+        # every expiry of the loaded days is kept, expiry_type only selects the view
+        self._all_data = self._data
+        self._expiry_views = dict(expiry_views or {})
+        if self._source == 'eis_data':
+            self._contracts = ContractRegistry(self._all_data)
+        self.switch_expiry_type(self._expiry_type)
+
+    def switch_expiry_type(self, expiry_type:str):
+        '''
+        Switches the data, the chain store and the greeks to the view of the given expiry type
+        (e.g. from nearest_weekly to second_weekly after an unwind). The views are built from the
+        already loaded and preprocessed data the first time they are asked for and cached,
+        switching to an already built view is a dictionary lookup (no I/O and no preprocessing).
+        '''
+        if expiry_type.lower() not in self._expiry_views:
+            self._expiry_views[expiry_type.lower()] = self._build_expiry_view(expiry_type.lower())
+            logger.info(f'expiry view {expiry_type} built')
+
+        self._expiry_type = expiry_type
+        self._data, self._chain, self._greeks = self._expiry_views[expiry_type.lower()]
+
+    def _build_expiry_view(self, expiry_type:str) -> tuple:
+        '''
+        Returns (data, chain store, greeks engine) of all the loaded data filtered on the expiry type
+        '''
+        # expiry filters (and get_specific_expiry) work on self._data
+        self._data = self._all_data
+
         # add expiry_type to filter data
-        if self._expiry_type.lower() == 'all':
+        if expiry_type == 'all':
             # do nothing
             pass
-        elif self._expiry_type.lower() == 'weekly':
+        elif expiry_type == 'weekly':
             # weekly expiry filter
             expiry_list = list(set(self._data['ExpiryDateTime']))
             weekly_expiry_list = self.get_specific_expiry(expiry_list = expiry_list, expiry_type = 'weekly')
             self._data = self._data.loc[self._data['ExpiryDate'].isin(weekly_expiry_list)]
-        elif self._expiry_type.lower() == 'monthly':
+        elif expiry_type == 'monthly':
             # monthly expiry filter
             expiry_list = list(set(self._data['ExpiryDateTime']))
             monthly_expiry_list = self.get_specific_expiry(expiry_list = expiry_list, expiry_type = 'monthly')
             self._data = self._data.loc[self._data['ExpiryDate'].isin(monthly_expiry_list)]
 
-        elif self._expiry_type.lower() == 'nearest_weekly':
+        elif expiry_type == 'nearest_weekly':
             # nearest_weekly expiry filter
             expiry_list = list(set(self._data['ExpiryDateTime']))
             nearest_weekly_expiry = self.get_specific_expiry(expiry_list = expiry_list, expiry_type = 'nearest_weekly')
             self._data = self._data.loc[self._data['ExpiryDate'] == nearest_weekly_expiry]
 
-        elif self._expiry_type.lower() == 'nearest_monthly':
+        elif expiry_type == 'nearest_monthly':
             # nearest_monthly expiry filter
             expiry_list = list(set(self._data['ExpiryDateTime']))
             nearest_monthly_expiry = self.get_specific_expiry(expiry_list = expiry_list, expiry_type = 'nearest_monthly')
             self._data = self._data.loc[self._data['ExpiryDate'] == nearest_monthly_expiry]
 
-        elif self._expiry_type.lower() == 'second_weekly':
+        elif expiry_type == 'second_weekly':
             # second_weekly expiry filter
             expiry_list = list(set(self._data['ExpiryDateTime']))
             second_weekly_expiry = self.get_specific_expiry(expiry_list = expiry_list, expiry_type = 'second_weekly')
             self._data = self._data.loc[self._data['ExpiryDate'] == second_weekly_expiry]
-        elif self._expiry_type.lower() == 'second_monthly':
+        elif expiry_type == 'second_monthly':
             # second_monthly expiry filter
             expiry_list = list(set(self._data['ExpiryDateTime']))
             second_monthly_expiry = self.get_specific_expiry(expiry_list = expiry_list, expiry_type = 'second_monthly')
@@ -341,7 +387,37 @@ class HistoricalData():
         else:
             logger.debug('This Expiry Type is not available. Please Select from the list:[weekly, monthly, nearest_weekly, second_weekly,nearest_monthly,second_monthly]')
 
+        # build the chain store once, all the quote lookups are served from it
+        chain = ChainStore(self._data)
+        greeks = GreeksEngine(chain)
+
+        # iv and greeks of every quote row, computed once and reused across runs through the on-disk cache
+        if params['PRECOMPUTE_GREEKS'] and len(self._source_files) > 0:
+            if params['GREEKS_CACHE']:
+                greeks.load_or_precompute(source_files=self._source_files, cache_tag=expiry_type)
+            else:
+                greeks.precompute()
+
+        return self._data, chain, greeks
+
 
+    def get_file_names(self) -> list:
+        '''
+        Returns the raw data file names (<UNDERLYING>_<YYYYMMDD>_Intraday.csv) of every day between start and end date
+        '''
+        # assumption date format : 2021-03-10 09:16:00
+        dates = pd.date_range(start=self._start_date,end=self._end_date).strftime('%Y%m%d').to_list()
+        return [self._instrument +'_'+ date + '_Intraday.csv' for date in dates]
+
+    def iter_market_data(self):
+        '''
+        Lazily yields (file name, preprocessed day) for every day between start and end date,
+        only one day is held in memory at a time. Days are read from the binary cache when it is
+        available and not stale.
+        '''
+        for file_name in self.get_file_names():
+            df = load_eis_day(file_name, use_cache=params['MARKET_DATA_CACHE'], write_cache=params['MARKET_DATA_CACHE'])
+            yield file_name, df
 
 
     def get_quote(self, t, option_type, expiry, strike)-> tuple:
@@ -357,12 +433,10 @@ class HistoricalData():
         '''
         if self._source == 'eis_data':
 
-            quote_data = self._data.loc[t]
-            quote_data = quote_data[(quote_data['Type'] == option_type) & (quote_data['ExpiryDateTime'] == expiry) & (quote_data['Strike'] == strike)]
-            if len(quote_data) == 1:
-                return np.array(quote_data[['BidPrice', 'BidQty', 'AskPrice', 'AskQty']]).flatten()
-            
-            elif len(quote_data) == 0:
+            row = self._chain.find(t, option_type=option_type, expiry=expiry, strike=strike)
+            if row >= 0:
+                return self._chain.get_quote(row)
+            else:
                 # TODO: need to check why for some options quote_data is empty
                 logger.debug(f'Data Not available for opion_type={option_type}, expiry={expiry}, strike={strike}')
                 raise NoOptionsFound(f'Data Not available for opion_type={option_type}, expiry={expiry}, strike={strike}')
@@ -375,25 +449,110 @@ class HistoricalData():
         Parameters:
         ---------
                  t: time 
-                 option_type : type of option (e.g, 'CE', 'PE')
-                 expiry : expiry date time (e.g, '2021-06-24 15:30:00')
-                 strike : Strike Price
+                 instrument_id : ExchToken of the option
         Return 4 tuple values such as bid price, bid qty, ask price, ask qty respectively.
         '''
         if self._source == 'eis_data':
 
-            # quote_data = self._data.loc[t]
-            quote_data = self._data.loc[self._data['ExchToken'] == instrument_id]
-            if len(quote_data) == 1:
-                return np.array(quote_data[['BidPrice', 'BidQty', 'AskPrice', 'AskQty']]).flatten()
-            
-            elif len(quote_data) == 0:
+            quote = self.get_quotes_by_ids(t, [instrument_id])[0]
+            if np.isnan(quote[0]):
                 # TODO: need to check why for some options quote_data is empty
                 logger.debug(f'Data Not available for opion_id={instrument_id}')
                 raise NoOptionsFound(f'Data Not available for opion_id={instrument_id}')
+            return quote
+        else:
+            logger.debug('Select from given source(eis_data)')
+
+    def get_quotes_by_ids(self, t, ids:list) -> np.ndarray:
+
+        '''
+        Parameters:
+        ---------
+                 t: time 
+                 ids : list of ExchToken
+        Returns an array of shape (len(ids), 4) with bid price, bid qty, ask price, ask qty of every id at time t.
+        Rows of the ids which are not quoted at time t are filled with nan.
+        '''
+        if self._source == 'eis_data':
+            return self._chain.get_quotes_by_ids(t, ids)
+        else:
+            logger.debug('Select from given source(eis_data)')
+
+
+    def get_quotes_by_ids_over(self, times, ids:list) -> np.ndarray:
+        '''
+        Returns an array of shape (len(times), len(ids), 4), the quotes of the ids at every time (see get_quotes_by_ids)
+        '''
+        if self._source == 'eis_data':
+            return self._chain.get_quotes_by_ids_over(times, ids)
+        else:
+            logger.debug('Select from given source(eis_data)')
+
+
+    def get_greeks_surface(self, t, q_type:str='mid') -> pd.DataFrame:
+        '''
+        Parameters:
+        ---------
+                 t: time 
+                 q_type : quote used as premium (bid, ask or mid)
+        Returns the implied volatility, delta, gamma, theta and vega of every option quoted at time t.
+        '''
+        if self._source == 'eis_data':
+            lo, greeks = self._greeks.get_surface(t, q_type=q_type)
+            rows = np.arange(lo, lo + len(greeks))
+            surface = pd.DataFrame(greeks)
+            surface.insert(0, 'ExchToken', self._chain._token[rows])
+            surface.insert(1, 'Type', np.where(self._chain._type[rows] == 0, 'CE', 'PE'))
+            surface.insert(2, 'Strike', self._chain._strike[rows])
+            surface.insert(3, 'ExpiryDateTime', self._chain._expiry[rows].astype('datetime64[ns]'))
+            return surface
         else:
             logger.debug('Select from given source(eis_data)')
 
+    def get_greeks_by_ids(self, t, ids:list, q_type:str='mid') -> np.ndarray:
+        '''
+        Parameters:
+        ---------
+                 t: time 
+                 ids : list of ExchToken
+                 q_type : quote used as premium (bid, ask or mid)
+        Returns a structured array (iv, delta, gamma, theta, vega) with one entry per id, 
+        read from the cached surface at time t. Entries of the ids not quoted at time t are nan.
+        '''
+        if self._source == 'eis_data':
+            return self._greeks.get_greeks_by_ids(t, ids, q_type=q_type)
+        else:
+            logger.debug('Select from given source(eis_data)')
+
+    def get_greeks_by_ids_over(self, times, ids:list, q_type:str='mid') -> np.ndarray:
+        '''
+        Returns a structured array (iv, delta, gamma, theta, vega) of shape (len(times), len(ids)),
+        the greeks of the ids at every time (see get_greeks_by_ids)
+        '''
+        if self._source == 'eis_data':
+            return self._greeks.get_greeks_by_ids_over(times, ids, q_type=q_type)
+        else:
+            logger.debug('Select from given source(eis_data)')
+
+    def getExpiryViews(self) -> dict:
+        '''
+        Returns the expiry views built so far (expiry type -> (data, chain store, greeks engine))
+        '''
+        return self._expiry_views
+
+    def getContracts(self) -> ContractRegistry:
+        '''
+        Returns the contract registry of the loaded data (every expiry type)
+        '''
+        return self._contracts
+
+    def get_expiry_times(self) -> np.ndarray:
+        '''
+        Returns the sorted expiry date times of all the loaded data (every expiry type)
+        '''
+        if (self._all_data is None) or (len(self._all_data) == 0):
+            return np.zeros(0, dtype='datetime64[ns]')
+        return np.unique(self._all_data['ExpiryDateTime'].to_numpy(dtype='datetime64[ns]'))
 
     def get_option_detail_from_id(self, id: int) -> tuple:
         """
@@ -465,61 +624,29 @@ class HistoricalData():
 
     def get_spot_v2(self, ctime:datetime):
         '''
-
+        Returns the synthetic spot at ctime, (highest spot bid + lowest spot ask)/2 across all
+        the strikes where spot bid = strike + (bid call - ask put) and spot ask = strike + (ask call - bid put).
+        The spot of every timestamp is precomputed while building the chain store.
         '''
-        # group the dataframe by "Type","ExpiryDateTime", "Strike", "BidPrice", "AskPrice"
-        grp_df = self._data.loc[ctime].groupby(["Type","ExpiryDateTime", "Strike", "BidPrice", "AskPrice"], as_index=False).count()
-
-        # since we need both the CE and PE separately, break them into two dfs
-        ce_df = grp_df.loc[grp_df['Type']=='CE',['Type','ExpiryDateTime','Strike','BidPrice','AskPrice']]
-        pe_df = grp_df.loc[grp_df['Type']=='PE',['Type','ExpiryDateTime','Strike','BidPrice','AskPrice']]
-
-        # then merge both CE and PE dfs to put side by side so that we can compute row wise
-        merged_df = pd.merge(ce_df,pe_df,on=['ExpiryDateTime','Strike'],how='inner')
+        return self._chain.get_spot(ctime)
 
-        # compute bid and ask spots
-        merged_df['spot_bid'] = merged_df['Strike'] + merged_df['BidPrice_x'] - merged_df['AskPrice_y']
-        merged_df['spot_ask'] = merged_df['Strike'] + merged_df['AskPrice_x'] - merged_df['BidPrice_y']
-
-        # finally return spot
-        return (merged_df['spot_bid'].max() + merged_df['spot_ask'].min())/2
+    def get_spot_series(self) -> pd.DataFrame:
+        '''
+        Returns the precomputed synthetic spot bid, ask and mid for every timestamp of the loaded data
+        '''
+        spot = self._chain.getSpot()
+        return pd.DataFrame({'spot_bid': spot.getBid(),
+                             'spot_ask': spot.getAsk(),
+                             'spot': spot.getMid()},
+                            index=pd.DatetimeIndex(self._chain.getTimes(), name='Date Time'))
 
 
     def get_spot(self, t:datetime) -> float:
         spot_value = 0
         # market data at time t
         if self._source == 'eis_data':
-            # groupby expiry
-            # select each expiry and all strikes under that expiry
-            # calculate spot bid and ask using above formulas and take the average of (highest bid + lowest ask)
-            # spot bid and ask store
-
-            spot_Bid, spot_Ask = [], []
-
-            for z, y in self._data.loc[t].set_index(["ExpiryDateTime", "Strike"]).index.unique():
-                # query the dataframe at expiry z and strike y
-                temp = self._data.loc[t].set_index(["ExpiryDateTime", "Strike"]).loc[(z, y)]
-
-                # using a try catch block to avoid errors due to missing columns -> for eg: PE or CE both not be present for all strikes at the same time.
-                try:
-                    # check if CE and PE both exists.
-                    if len(temp[temp.Type=="PE"]) == 0 or len(temp[temp.Type=="CE"]) == 0:
-                        continue
-                    
-                    # calculate the spot bid and ask using formula
-                    spot_bid = (y + temp[temp.Type=="CE"]["BidPrice"] - temp[temp.Type=="PE"]["AskPrice"]).values[0]
-                    spot_ask = (y + temp[temp.Type=="CE"]["AskPrice"] - temp[temp.Type=="PE"]["BidPrice"]).values[0]
-
-                    # store them in a list or array
-                    spot_Bid.append(spot_bid)
-                    spot_Ask.append(spot_ask)
-
-                # Just pass for now (can be customised)
-                except:
-                    pass
-
-            # Return final spot value
-            spot_value = (max(spot_Bid) + min(spot_Ask)) / 2
+            # the spot of every timestamp is precomputed while building the chain store
+            spot_value = self._chain.get_spot(t)
         else:
             logger.debug('Source is not available !Please select from given source :(eis_data)')
 
@@ -542,31 +669,21 @@ class HistoricalData():
                 spot = self.get_spot_v2(qtime)
                 logger.debug(f'atm_spot={spot}')
                 
-                # TODO: do we need the following step anymore since data is already time sliced?
-                data = self._data.loc[qtime]
-                if data.shape[0] == 0:
+                lo, hi = self._chain.time_bounds(qtime)
+                if lo == hi:
                     # raise if no option found
                     raise NoOptionsFound(f'no options found  at time{qtime}')
-                    # print(f'no options found with spot={spot} and type={option_type} at time{qtime}')
-                
 
-                # TODO: try to combine the following filter with qtime filter to optimize
-                # get the data based on option type
-                data = data[(data['Type']==option_type) & (data['ExpiryDateTime']==expiry) & (data['Instrument']==underlying)]
-
-                # print(type(data))
-                if data.shape[0] == 0:
+                # get the strike ladder based on option type and expiry
+                lo, hi = self._chain.type_bounds(qtime, option_type=option_type, expiry=expiry)
+                if (lo == hi) or (not self._chain.has_underlying(underlying)):
                     raise NoOptionsFound(error_message=f'no options found of type={option_type}, expiry={expiry}, underlying={underlying}')
                 
-                # get the upper and lower limit            
-                u = (data[data['Strike'] > spot]['Strike']).min()
-                l = (data[data['Strike'] < spot]['Strike']).max()
-
-                strike = 0
-                if (u - spot) < (spot - l):
-                    strike = u
-                else:
-                    strike = l
+                # the closest strike between the upper and lower limit
+                row = self._chain.closest_strike_row(lo, hi, spot)
+                if row < 0:
+                    raise NoOptionsFound(error_message=f'no options found of type={option_type} around spot={spot}')
+                strike = self._chain.getStrike(row)
 
                 # if the strike is certain percentage away from the spot
                 # we wont take the code
@@ -574,13 +691,8 @@ class HistoricalData():
                 if (abs(spot - strike)/spot) > strike_tolerance:
                     raise NoOptionsFound(error_message=f'no options found of type={option_type} within specified {strike_tolerance*100}% strike tolerance. spot={spot},strike={strike}')
 
-                # print(strike)
-                # print(data[data['Strike']==strike])
-                strike, expiry, id, instrument = data[data['Strike']==strike][['Strike', 'ExpiryDateTime', 'ExchToken', 'Instrument']].values.flatten()
-                
-                # print(strike, expiry, id, instrument)
                 # TODO: check the output parameters whether they are required
-                return strike, expiry, id, instrument
+                return strike, self._chain.getExpiry(row), self._chain.getToken(row), self._chain.getInstrument(row)
                     
             except Exception as e:
                 logger.critical(f'WARNING:{e}')
@@ -620,13 +732,12 @@ class HistoricalData():
                 # atm_strike = self.get_spot(t=qtime)
                 # if DEBUG:
                 logger.debug(f'atm_strike={atm_strike}, expiry={expiry}, option_type={option_type}')
-                # tmp_data = self._data
-                data = self._data.loc[qtime]
-                if data.size == 0:
+                lo, hi = self._chain.time_bounds(qtime)
+                if lo == hi:
                     # raise NoOptionsFound(error_message=f'No options found at the current time {ctime}')
                     logger.critical(f'No options found at the current time {qtime}')
-                data = data[(data['Type']==option_type) & (data['ExpiryDateTime']==expiry)]
-                if data.size == 0:
+                lo, hi = self._chain.type_bounds(qtime, option_type=option_type, expiry=expiry)
+                if lo == hi:
                     # raise NoOptionprint(sFound(error_message=f'No options found of type={option_type} at time={ctime}')
                     logger.critical(f'No options found of type={option_type} at time={qtime}')
 
@@ -637,21 +748,13 @@ class HistoricalData():
                 elif option_type == 'PE': # TODO: constants like OPTION_TYPE_PUT should be used
                     otm_spot = atm_strike - ((atm_strike * pct)/100)
 
-                u = (data[data['Strike'] > otm_spot]['Strike']).min()
-                l = (data[data['Strike'] < otm_spot]['Strike']).max()
-
                 logger.debug(f'otm_spot={otm_spot}')
-                # logger.debug('Strike < otm_spot')
-                # logger.debug((data.loc[data['Strike'] <= otm_spot,['Strike']]))
-                # logger.debug('Strike > otm_spot')
-                # logger.debug((data.loc[data['Strike'] >= otm_spot,['Strike']]))
-                # logger.debug(f'u={u} and l={l}')
-
-                strike = 0
-                if (u - otm_spot) < (otm_spot - l):
-                    strike = u
-                else:
-                    strike = l
+
+                # the closest strike between the upper and lower limit
+                row = self._chain.closest_strike_row(lo, hi, otm_spot)
+                if row < 0:
+                    raise NoOptionsFound(error_message=f'no options found of type={option_type} around otm_spot={otm_spot}')
+                strike = self._chain.getStrike(row)
 
                 # if the strike is certain percentage away from the spot
                 # we wont take the code
@@ -661,12 +764,7 @@ class HistoricalData():
                                          specified {strike_tolerance*100}% strike tolerance otm_spot={otm_spot} and strike={strike}')
 
 
-                # logger.debug(f'strike={strike}')
-                # logger.debug('data[data[Strike]==strike]')
-                # logger.debug(data[data['Strike']==strike])
-
-                strike, expiry, id, instrument = data[data['Strike']==strike][['Strike', 'ExpiryDateTime', 'ExchToken', 'Instrument']].values.flatten()
-                return strike, expiry, id, instrument
+                return strike, self._chain.getExpiry(row), self._chain.getToken(row), self._chain.getInstrument(row)
 
             except Exception as ex:
                 logger.critical(ex)
@@ -675,6 +773,144 @@ class HistoricalData():
             logger.debug('Source is not available !Please select from given source :(eis_data)')
 
 
+    def select_legs(self, qtime:datetime, underlying:str, expiry:datetime, pct:float=None) -> np.ndarray:
+        """
+            Selects the ATM call and put and, if pct is given, the pct% OTM call and put at qtime in one pass.
+            The spot and the strike ladders (CE and PE) of the expiry are looked up once, the strikes are
+            found by binary searches on the sorted strikes of each ladder. Same rules as get_atm_option()
+            and get_otm_option(), the OTM strikes are pct% around the ATM call strike.
+
+            Returns a structured array (LEG_DTYPE) of the legs ATM_CE, ATM_PE (, OTM_CE, OTM_PE) with their
+            ids and quotes. Raises NoOptionsFound if a leg can not be selected.
+        """
+        logger.debug('within select_legs')
+        if self._source == 'eis_data':
+            try:
+                spot = self.get_spot_v2(qtime)
+                lo, hi = self._chain.time_bounds(qtime)
+                if lo == hi:
+                    raise NoOptionsFound(f'no options found  at time{qtime}')
+                if not self._chain.has_underlying(underlying):
+                    raise NoOptionsFound(error_message=f'no options found of underlying={underlying}')
+
+                # strike ladder of each option type, sorted by strike
+                ladders = [('CE', self._chain.type_bounds(qtime, option_type='CE', expiry=expiry)),
+                           ('PE', self._chain.type_bounds(qtime, option_type='PE', expiry=expiry))]
+                for option_type, (lo, hi) in ladders:
+                    if lo == hi:
+                        raise NoOptionsFound(error_message=f'no options found of type={option_type}, expiry={expiry}, underlying={underlying}')
+
+                # the ATM strikes are the closest to the spot
+                legs, targets = ['ATM_CE', 'ATM_PE'], [spot, spot]
+                rows = [self._chain.closest_strike_rows(lo, hi, [spot])[0] for _, (lo, hi) in ladders]
+                if pct is not None:
+                    # the OTM strikes are pct% above (CE) and below (PE) the ATM call strike
+                    atm_strike = int(self._chain.getStrike(rows[0])) if rows[0] >= 0 else 0
+                    legs += ['OTM_CE', 'OTM_PE']
+                    targets += [atm_strike + round((atm_strike * pct)/100), atm_strike - ((atm_strike * pct)/100)]
+                    rows += [self._chain.closest_strike_rows(lo, hi, [target])[0] for (_, (lo, hi)), target in zip(ladders, targets[2:])]
+
+                rows, targets = np.array(rows, dtype=np.int64), np.array(targets, dtype=np.float64)
+                if (rows < 0).any():
+                    raise NoOptionsFound(error_message=f'no options found for {[leg for leg, row in zip(legs, rows) if row < 0]} around {targets[rows < 0].tolist()}')
+
+                # if the strike is certain percentage away from the spot (ATM) or the target (OTM)
+                # we wont take the code
+                strike_tolerance = params['STRIKE_TOLERANCE']
+                outside = (np.abs(targets - self._chain._strike[rows])/targets) > strike_tolerance
+                if outside.any():
+                    raise NoOptionsFound(error_message=f'no options found for {[leg for leg, out in zip(legs, outside) if out]} within specified {strike_tolerance*100}% strike tolerance. targets={targets[outside].tolist()}, strikes={self._chain._strike[rows][outside].tolist()}')
+
+                selected = np.zeros(len(rows), dtype=LEG_DTYPE)
+                selected['Leg'] = legs
+                selected['OptionType'] = [leg[-2:] for leg in legs]
+                selected['Strike'] = self._chain._strike[rows]
+                selected['Expiry'] = self._chain._expiry[rows].astype('datetime64[ns]')
+                selected['ExchToken'] = self._chain._token[rows]
+                selected['BidPrice'] = self._chain._bid[rows]
+                selected['BidQty'] = self._chain._bid_qty[rows]
+                selected['AskPrice'] = self._chain._ask[rows]
+                selected['AskQty'] = self._chain._ask_qty[rows]
+                return selected
+
+            except Exception as e:
+                logger.critical(f'WARNING:{e}')
+                raise e
+
+        else:
+            logger.debug('Source is not available !Please select from given source :(eis_data)')
+
+
+    def select_legs_over(self, times, underlying:str, pct:float=None) -> tuple:
+        """
+            select_legs() at every time at once, on the expiry of the slice of every time (the expiry of its first row).
+            The strike ladders of all the times are searched together, same rules as select_legs().
+
+            Returns (legs, atm_selected, condor_selected):
+                legs: structured array (LEG_DTYPE) of shape (len(times), 4), the legs ATM_CE, ATM_PE, OTM_CE, OTM_PE
+                      of every time (the OTM legs only if pct is given), ExchToken -1 and nan quotes where not found
+                atm_selected: True where select_legs() would return the ATM legs
+                condor_selected: True where select_legs() would return the four legs (pct given)
+        """
+        logger.debug('within select_legs_over')
+        legs = np.zeros((len(times), 4), dtype=LEG_DTYPE)
+        legs['Leg'] = ['ATM_CE', 'ATM_PE', 'OTM_CE', 'OTM_PE']
+        legs['OptionType'] = ['CE', 'PE', 'CE', 'PE']
+        legs['ExchToken'] = -1
+        for name in ('Strike', 'BidPrice', 'BidQty', 'AskPrice', 'AskQty'):
+            legs[name] = np.nan
+        legs['Expiry'] = np.datetime64('NaT')
+        if self._source != 'eis_data':
+            logger.debug('Source is not available !Please select from given source :(eis_data)')
+            return legs, np.zeros(len(times), dtype=bool), np.zeros(len(times), dtype=bool)
+
+        try:
+            time_idx = self._chain.time_indices(times)
+            has_data = (time_idx >= 0) & self._chain.has_underlying(underlying)
+            spot = np.where(time_idx >= 0, self._chain.getSpot().getMid()[np.maximum(time_idx, 0)], np.nan)
+            expiry = self._chain.get_first_expiries(time_idx)
+
+            # strike ladder of each option type at every time, sorted by strike
+            ce_lo, ce_hi = self._chain.type_bounds_over(time_idx, expiry, option_type='CE')
+            pe_lo, pe_hi = self._chain.type_bounds_over(time_idx, expiry, option_type='PE')
+            has_data &= (ce_hi > ce_lo) & (pe_hi > pe_lo)
+
+            # the ATM strikes are the closest to the spot
+            rows = np.full((len(times), 4), -1, dtype=np.int64)
+            targets = np.full((len(times), 4), np.nan)
+            rows[:, 0] = self._chain.closest_strike_rows_over(ce_lo, ce_hi, spot)
+            rows[:, 1] = self._chain.closest_strike_rows_over(pe_lo, pe_hi, spot)
+            targets[:, 0] = targets[:, 1] = spot
+            if pct is not None:
+                # the OTM strikes are pct% above (CE) and below (PE) the ATM call strike
+                atm_strike = np.where(rows[:, 0] >= 0, np.trunc(self._chain._strike[np.maximum(rows[:, 0], 0)]), 0)
+                targets[:, 2] = atm_strike + np.round((atm_strike * pct)/100)
+                targets[:, 3] = atm_strike - ((atm_strike * pct)/100)
+                rows[:, 2] = self._chain.closest_strike_rows_over(ce_lo, ce_hi, targets[:, 2])
+                rows[:, 3] = self._chain.closest_strike_rows_over(pe_lo, pe_hi, targets[:, 3])
+
+            # if the strike is certain percentage away from the spot (ATM) or the target (OTM) the leg is not taken
+            found = (rows >= 0) & has_data[:, None]
+            strike = np.where(found, self._chain._strike[np.maximum(rows, 0)], np.nan)
+            outside = (np.abs(targets - strike)/targets) > params['STRIKE_TOLERANCE']
+            selected = found & ~outside
+
+            for name, column in (('Strike', self._chain._strike), ('ExchToken', self._chain._token),
+                                 ('BidPrice', self._chain._bid), ('BidQty', self._chain._bid_qty),
+                                 ('AskPrice', self._chain._ask), ('AskQty', self._chain._ask_qty)):
+                legs[name][found] = column[rows[found]]
+            legs['Expiry'][found] = self._chain._expiry[rows[found]].astype('datetime64[ns]')
+
+            atm_selected = selected[:, :2].all(axis=1)
+            condor_selected = selected.all(axis=1) if pct is not None else np.zeros(len(times), dtype=bool)
+            logger.info(f'legs selected over {len(times)} times, ATM at {atm_selected.sum()} and condor at {condor_selected.sum()}')
+            return legs, atm_selected, condor_selected
+
+        except Exception as e:
+            logger.critical(f'Error in select_legs_over in line {get_exception_line_no()}, error : {e}')
+            raise e
+
+
     def preprocess(self) -> pd.DataFrame:
 
         # if the data source is eis data , call specific preprocess method
@@ -740,3 +976,115 @@ class HistoricalData():
 
     def setSliceTime(self, slice_time:datetime):
         self._slice_time = slice_time
+
+
+
+class HistoricalDataSlice():
+    """
+    Class Description
+    ------------------
+    Light weight view of HistoricalData at a single time t. It holds the integer row bounds (lo, hi)
+    of time t inside the chain store of the parent and exposes the same query methods, so no 
+    DataFrame is built per time step. getData() returns the rows at time t and is computed only if asked for.
+
+    Parameters
+    ----------
+    parent : HistoricalData with the market data loaded
+    t : time of the slice
+
+    Methods
+    -------
+
+    getSlice(t) : Returns itself for the time of the slice, a new slice of the parent otherwise
+
+    getData() : Returns the market data at time t (DataFrame, built on first access)
+
+    getBounds() : Returns (lo, hi) row bounds of time t inside the chain store
+
+    get_option_detail_from_id(id) : Returns a tuple which consists Strike , ExpiryDateTime, Option Type  respectively.
+
+    same query methods as HistoricalData (get_quote, get_quote_by_id, get_atm_option, get_otm_option, get_spot, ...)
+    """
+    __slots__ = ('_parent', '_parent_data', '_source', '_instrument', '_name', '_expiry_type', 
+                 '_chain', '_greeks', '_contracts', '_lo', '_hi', '_slice_time', '_slice_expiry', '_slice_data')
+
+    def __init__(self, parent:HistoricalData, t:datetime):
+        self._parent = parent
+        # the view keeps the data, chain store and greeks of the parent at the time of slicing
+        self._parent_data = parent._data
+        self._source = parent._source
+        self._instrument = parent._instrument
+        self._name = parent._name
+        self._expiry_type = parent._expiry_type
+        self._chain = parent._chain
+        self._greeks = parent._greeks
+        self._contracts = parent._contracts
+        self._lo, self._hi = self._chain.time_bounds(t)
+        self._slice_time = t
+        self._slice_expiry = self._chain.get_first_expiry(t) #this is the ONLY expiry in the slice
+        self._slice_data = None
+
+    @property
+    def _data(self) -> pd.DataFrame:
+        # rows at time t, only built for the DataFrame based methods
+        if self._slice_data is None:
+            self._slice_data = self._parent_data.loc[self._slice_time]
+        return self._slice_data
+
+    def getSlice(self, t:datetime):
+        if t == self._slice_time:
+            return self
+        return self._parent.getSlice(t)
+
+    def getBounds(self) -> tuple:
+        return self._lo, self._hi
+
+    def get_option_detail_from_id(self, id: int) -> tuple:
+        """
+        parameters:
+        ---------
+           id : ExchangeID
+
+        Returns:
+                returns a tuple which consists Strike , ExpiryDateTime, Option Type  respectively.
+        """
+        if self._source == 'eis_data':
+
+            row = self._chain.get_rows_by_ids(self._slice_time, [id])[0]
+            if row < 0:
+                raise NoOptionsFound(error_message=f'No options found with id={id}')
+
+            return self._chain.getStrike(row), self._chain._expiry[row].astype('datetime64[ns]'), self._chain.getOptionType(row)
+
+        else:
+            logger.debug('Select from given source(eis_data)')
+
+    # same query methods as HistoricalData, they only use the chain store, the greeks and the getters
+    get_slice_expiry = HistoricalData.get_slice_expiry
+    get_nearest_strike_premium = HistoricalData.get_nearest_strike_premium
+    get_exercise_list = HistoricalData.get_exercise_list
+    get_quote = HistoricalData.get_quote
+    get_quote_by_id = HistoricalData.get_quote_by_id
+    get_quotes_by_ids = HistoricalData.get_quotes_by_ids
+    get_quotes_by_ids_over = HistoricalData.get_quotes_by_ids_over
+    get_greeks_surface = HistoricalData.get_greeks_surface
+    get_greeks_by_ids = HistoricalData.get_greeks_by_ids
+    get_greeks_by_ids_over = HistoricalData.get_greeks_by_ids_over
+    getContracts = HistoricalData.getContracts
+    get_option_dtls_from_id_list = HistoricalData.get_option_dtls_from_id_list
+    get_max_expiry_from_options = HistoricalData.get_max_expiry_from_options
+    get_spot_v2 = HistoricalData.get_spot_v2
+    get_spot = HistoricalData.get_spot
+    get_atm_option = HistoricalData.get_atm_option
+    get_otm_option = HistoricalData.get_otm_option
+    select_legs = HistoricalData.select_legs
+
+    # getters
+
+    getData = HistoricalData.getData
+    getName = HistoricalData.getName
+    getSource = HistoricalData.getSource
+    getInstrument = HistoricalData.getInstrument
+    getExpiryType = HistoricalData.getExpiryType
+    getSliceExpiry = HistoricalData.getSliceExpiry
+    getSliceTime = HistoricalData.getSliceTime
@@ -14,6 +14,7 @@ from scipy import optimize
 from modules._historical_data import HistoricalData, NoOptionsFound
 from abc import ABC, abstractclassmethod
 from modules._black_scholes import implied_volatility_options, black_scholes
+from modules._calendar import get_trading_calendar
 from modules._logger import logger
 
 logger = logger.getLogger('instrument')
@@ -33,16 +34,35 @@ def get_nearest_strike_premium(t:datetime, strike:int, mkt_data:HistoricalData)
 
     return bidprice, bidqty, askprice, askqty
 
+def create_option(id:int, strike:float, expiry:datetime, type_of_option:str, underlying_name:str) -> object:
+    '''
+    Creates the Options object of a contract, the dividend is read from params
+    '''
+    # Create a unique name for the instrument
+    instrument_name = str(underlying_name) + "_" + str(strike) + "_" + str(expiry) + "_" + str(type_of_option)
+    return Options(param_list=[id, instrument_name, type_of_option, strike, expiry, underlying_name, params["DIVIDEND"]])
+
+
+def get_option(id:int, strike:float, expiry:datetime, type_of_option:str, underlying_name:str, mkt_data:HistoricalData) -> object:
+    '''
+    Returns the shared Options object of the contract from the contract registry of the market data,
+    a new one when the market data has no registry
+    '''
+    contracts = mkt_data.getContracts()
+    if contracts is None:
+        return create_option(id, strike, expiry, type_of_option, underlying_name)
+    return contracts.get_object(id, factory=create_option)
+
+
 def get_option_from_instrument_id(id:int,  mkt_data:HistoricalData) -> object:
     '''
-    Get option or cash instance given an unique identifier, underlying name, dividend and HistoricalData object.
+    Get option or cash instance given an unique identifier and HistoricalData object.
+    The Options objects are shared, one per contract of the contract registry.
 
     Parameters
     ----------
     id : Unique Identifier of an Option.
-    underlying_name: Name of the underlying 
     mkt_data: market data instance (HistoricalData object)
-    dividend: rate of dividend
 
     Returns
     -------
@@ -51,21 +71,16 @@ def get_option_from_instrument_id(id:int,  mkt_data:HistoricalData) -> object:
 
     
     if id != params["CASH_ID"]:
-        # strikes expiry and option_type
-        # Receive the strike price , expiry date and option type information from given id
-
-        strikes, expiry_date, type_of_option = mkt_data.get_option_detail_from_id(id=id)
-
-        # load dividend and underlying from params
-        dividend = params["DIVIDEND"]
-        underlying_name = params["UNDERLYING"]
-
-        # Create a unique name for the instrument
-        instrument_name = str(underlying_name) + "_" + str(strikes) + "_" + str(expiry_date) + "_" + str(type_of_option)
-
-        # create the option object and return the object
-        # Returns Options object
-        opts = Options(param_list=[id, instrument_name, type_of_option, strikes, expiry_date, underlying_name, dividend])
+        contracts = mkt_data.getContracts()
+        if contracts is not None:
+            # static attributes of the contract, looked up by id
+            if id not in contracts:
+                raise NoOptionsFound(error_message=f'No options found with id={id}')
+            opts = contracts.get_object(id, factory=create_option)
+        else:
+            # Receive the strike price , expiry date and option type information from given id
+            strikes, expiry_date, type_of_option = mkt_data.get_option_detail_from_id(id=id)
+            opts = create_option(id, strikes, expiry_date, type_of_option, params["UNDERLYING"])
     
     elif id == params["CASH_ID"]:
         opts = Cash()
@@ -83,31 +98,10 @@ def get_options_from_id_list(id_list:list,  mkt_data:HistoricalData) -> list:
 
     Returns
     -------
-    List of Option objects
+    List of Option objects, in the order of id_list
     '''
 
-    # strikes expiry and option_type
-    # Receive the strike price , expiry date and option type information from given id list
-
-    tmp_list = mkt_data.get_option_dtls_from_id_list(id_list=id_list)
-    opt_list = list()
-    for dtls in tmp_list:
-
-        strikes, expiry_date, type_of_option = dtls
-
-        # load dividend and underlying from params
-        dividend = params["DIVIDEND"]
-        underlying_name = params["UNDERLYING"]
-
-        # Create a unique name for the instrument
-        instrument_name = str(underlying_name) + "_" + str(strikes) + "_" + str(expiry_date) + "_" + str(type_of_option)
-
-        # create the option object and return the object
-        # Returns Options object
-        opts = Options(param_list=[id_list, instrument_name, type_of_option, strikes, expiry_date, underlying_name, dividend])
-        opt_list.append(opts)
-
-    return opt_list
+    return [get_option_from_instrument_id(id=id, mkt_data=mkt_data) for id in id_list]
 
 
 def get_atm_options(underlying:str, expiry:datetime, t:datetime, mkt_data:HistoricalData) -> tuple:
@@ -124,21 +118,37 @@ def get_atm_options(underlying:str, expiry:datetime, t:datetime, mkt_data:Histor
 
     logger.debug('within get_atm_options()')
 
-    # Get all informations related to ATM options using mkt_data object (both CE and PE)
-    strike_ce, expiry_ce, id_ce, instrument_ce = mkt_data.get_atm_option(underlying=underlying, expiry=expiry, qtime=t, option_type="CE")
-    strike_pe, expiry_pe, id_pe, instrument_pe = mkt_data.get_atm_option(underlying=underlying, expiry=expiry, qtime=t, option_type="PE")
+    # Get the ATM call and put in one pass using mkt_data object
+    legs = mkt_data.select_legs(qtime=t, underlying=underlying, expiry=expiry)
 
-    # Dividend - reading from params 
-    dividend = params["DIVIDEND"]
+    # Objects for ATM Call and Put, shared through the contract registry
+    opt_atm_ce, opt_atm_pe = _get_leg_options(legs, underlying, mkt_data)
 
-    # Instrument Names
-    instrument_name_ce = str(instrument_ce) + "_" + str(strike_ce) + "_" + str(expiry_ce) + "_" + "CE"
-    instrument_name_pe = str(instrument_pe) + "_" + str(strike_pe) + "_" + str(expiry_pe) + "_" + "PE"
+    return opt_atm_ce, opt_atm_pe
 
-    # Creating -> Objects for ATM Call and Put (return objects)
-    opt_atm_ce, opt_atm_pe = Options(param_list=[id_ce, instrument_name_ce, "CE", strike_ce, expiry_ce, instrument_ce, dividend]), Options(param_list=[id_pe, instrument_name_pe, "PE", strike_pe, expiry_pe, instrument_pe, dividend])
 
-    return opt_atm_ce, opt_atm_pe
+def get_condor_options(underlying:str, expiry:datetime, t:datetime, pct:float, mkt_data:HistoricalData) -> tuple:
+    """
+    Returns the four legs of the condor and their quotes, selected in one pass (see HistoricalData.select_legs).
+
+    parameter
+    ---------
+    t: at timestep t
+    pct: how far (%) the OTM strikes are from the ATM call strike
+    mkt_data: HistoricalData object
+
+    returns: a tuple ((atm call, atm put, otm call, otm put), quotes) where quotes is an array
+             of shape (4, 4) with the bid price, bid qty, ask price and ask qty of every leg
+    """
+    logger.debug('within get_condor_options()')
+    legs = mkt_data.select_legs(qtime=t, underlying=underlying, expiry=expiry, pct=pct)
+    quotes = np.column_stack([legs['BidPrice'], legs['BidQty'], legs['AskPrice'], legs['AskQty']])
+
+    return _get_leg_options(legs, underlying, mkt_data), quotes
+
+
+def _get_leg_options(legs:np.ndarray, underlying:str, mkt_data:HistoricalData) -> tuple:
+    return tuple(get_option(int(leg['ExchToken']), leg['Strike'], pd.Timestamp(leg['Expiry']), str(leg['OptionType']), underlying, mkt_data=mkt_data) for leg in legs)
 
 
 def get_otm_options(underlying:str, atm_strike:float, expiry:datetime, t:datetime, pct:float, mkt_data:HistoricalData) -> tuple:
@@ -157,15 +167,9 @@ def get_otm_options(underlying:str, atm_strike:float, expiry:datetime, t:datetim
     strike_ce, expiry_ce, id_ce, instrument_ce = mkt_data.get_otm_option(underlying=underlying, atm_strike=atm_strike, expiry=expiry, qtime=t, option_type="CE", pct=pct)
     strike_pe, expiry_pe, id_pe, instrument_pe = mkt_data.get_otm_option(underlying=underlying, atm_strike=atm_strike, expiry=expiry, qtime=t, option_type="PE", pct=pct)
 
-    # Dividend - reading from params 
-    dividend = params["DIVIDEND"]
-
-    # Instrument Names
-    instrument_name_ce = str(instrument_ce) + "_" + str(strike_ce) + "_" + str(expiry_ce) + "_" + "CE"
-    instrument_name_pe = str(instrument_pe) + "_" + str(strike_pe) + "_" + str(expiry_pe) + "_" + "PE"
-
-    # Creating -> Objects for ATM Call and Put (return objects)
-    opt_otm_ce, opt_otm_pe = Options(param_list=[id_ce, instrument_name_ce, "CE", strike_ce, expiry_ce, instrument_ce, dividend]), Options(param_list=[id_pe, instrument_name_pe, "PE", strike_pe, expiry_pe, instrument_pe, dividend])
+    # Objects for OTM Call and Put, shared through the contract registry
+    opt_otm_ce = get_option(id_ce, strike_ce, expiry_ce, "CE", instrument_ce, mkt_data=mkt_data)
+    opt_otm_pe = get_option(id_pe, strike_pe, expiry_pe, "PE", instrument_pe, mkt_data=mkt_data)
 
     return opt_otm_ce, opt_otm_pe
 
@@ -441,32 +445,18 @@ class Options(Instrument):
             raise ValueError("Options type should be either a CE or a PE")
 
     # calculate the time left to expiry
-    def calculate_time_to_expiry(self, at_time_t:datetime, total_trading_holidays:int=16) -> float: 
+    def calculate_time_to_expiry(self, at_time_t:datetime, total_trading_holidays:int=None) -> float: 
         '''
         Parameters
         ----------
         at_time_t: current time 
-        total_trading_holidays: Total number of trading holidays in a year
+        total_trading_holidays: Total number of trading holidays in a year, the one of the trading calendar if not given
 
         Returns
         -------
-        Annualised time (in minutes)
+        Annualised time (in minutes), see TradingCalendar.time_to_expiry()
         '''
-        # calculates the time difference between expiry and present time
-        # send in minutes
-        total_trading_days_in_year = 252
-        number_of_trading_mins_day = (6.25 * 60)
-
-
-        # caluclating the time left between two given days and converting the total time left into minutes
-        time_left, days_left = (pd.to_datetime(self.expiry) - pd.to_datetime(at_time_t)), (pd.to_datetime(self.expiry) - pd.to_datetime(at_time_t)).days
-        minutes_left = (time_left - timedelta(days=days_left)).seconds // 60
-        time_left_in_mins = (days_left * number_of_trading_mins_day) + minutes_left
-        
-        # Annualised Time Left
-        annualised_time_left = time_left_in_mins / ((total_trading_days_in_year - total_trading_holidays) * number_of_trading_mins_day) # total time left / total trading minutes in a year 
-
-        return annualised_time_left
+        return float(get_trading_calendar().time_to_expiry(at_time_t, self.expiry, total_trading_holidays=total_trading_holidays))
 
 
     # Delta method in options class
@@ -560,6 +550,12 @@ class Options(Instrument):
         Calculated Delta value 
         '''
 
+        # read the delta from the greeks surface cached for the whole time slice
+        if rf == params["RISK_FREE_RATE"]:
+            delta = mkt_data.get_greeks_by_ids(t=t, ids=[instrument_id], q_type=q_type)['delta']
+            if not np.isnan(delta[0]):
+                return delta[0]
+
         # TODO : Check with DDG if rf should be moved to param file as a global
         time_to_expire = self.calculate_time_to_expiry(at_time_t=t)
         try:
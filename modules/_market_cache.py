@@ -0,0 +1,312 @@
+import os
+import json
+import shutil
+import tempfile
+import argparse
+import numpy as np
+from multiprocessing import shared_memory
+import pandas as pd
+
+from datasets import _load_data_file, DATA_PATH
+from modules._utils import preprocess_eis_data
+from modules._logger import logger,get_exception_line_no
+
+logger = logger.getLogger('market_cache')
+
+# bump it whenever preprocess_eis_data or the layout below changes, older caches become stale
+CACHE_VERSION = 1
+META_FILE = 'meta.json'
+
+# column names are specific to EIS DATA only
+EIS_COLUMNS = ['Date Time', 'UnixTimefrom 1-1-1980', 'ExchToken', 'BidPrice', 'BidQty',
+               'AskPrice', 'AskQty', 'TTq', 'LTP', 'TotalTradedPrice', 'Instrument',
+               'ExpiryDate', 'ExpiryTime', 'Strike', 'Type']
+
+
+def get_cache_dir(file_path:str) -> str:
+    '''
+    Returns the directory holding the binary cache of a raw data file (next to the file)
+    '''
+    return os.path.splitext(file_path)[0] + '.columns'
+
+
+def get_source_stamp(file_path:str) -> dict:
+    '''
+    Returns the (size, modification time) stamp of a raw data file, the caches built from it are keyed on it
+    '''
+    stat = os.stat(file_path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def _encode_columns(data:pd.DataFrame):
+    '''
+    Yields (name, kind, values, categories) for the index and every column of a preprocessed day,
+    values is a plain NumPy array (datetimes as int64 nanoseconds, text and categories as codes)
+    '''
+    for name, col in [(data.index.name or 'Date Time', data.index.to_series())] + list(data.items()):
+        if pd.api.types.is_datetime64_dtype(col.dtype):
+            yield name, 'datetime', col.to_numpy(dtype='datetime64[ns]').view('i8'), None
+        elif isinstance(col.dtype, pd.CategoricalDtype) or col.dtype == 'O':
+            kind = 'category' if isinstance(col.dtype, pd.CategoricalDtype) else 'text'
+            col = col.astype(str).astype('category')
+            yield name, kind, col.cat.codes.to_numpy(), col.cat.categories.to_list()
+        else:
+            yield name, 'numeric', col.to_numpy(), None
+
+
+def _decode_columns(meta:dict, arrays:dict, copy:bool=True) -> pd.DataFrame:
+    '''
+    Builds the preprocessed day back from the column arrays (name -> array) described by meta,
+    the numeric and datetime columns are views of the arrays if copy is False
+    '''
+    def _decode(column:dict):
+        values = arrays[column['name']]
+        if column['kind'] == 'datetime':
+            return values.view('datetime64[ns]')
+        elif column['kind'] == 'category':
+            return pd.Categorical.from_codes(values, column['categories'])
+        elif column['kind'] == 'text':
+            return np.asarray(column['categories'], dtype=object)[values]
+        return values
+
+    index = pd.DatetimeIndex(_decode(meta['index']), name=meta['index']['name'], copy=copy)
+    return pd.DataFrame({column['name']: _decode(column) for column in meta['columns']}, index=index, copy=copy)
+
+
+def write_day_cache(file_path:str, data:pd.DataFrame) -> str:
+    '''
+    Writes a preprocessed day (output of preprocess_eis_data) into a typed columnar binary format:
+    one .npy file per column and a meta.json with the column kinds, the categories of the text columns
+    and the size and modification time of the raw data file it was built from.
+
+    Parameters:
+        file_path: raw data file the day was loaded from
+        data: preprocessed data of the day with 'Date Time' as index
+
+    Returns the cache directory
+    '''
+    cache_dir = get_cache_dir(file_path)
+    # the day is written into a temporary directory which then replaces the cache directory, the files of a cache
+    # are never modified once in place (other processes may have them memory mapped)
+    tmp_dir = tempfile.mkdtemp(prefix=os.path.basename(cache_dir) + '.', suffix='.tmp', dir=os.path.dirname(cache_dir) or '.')
+    try:
+        columns = list()
+        for name, kind, values, categories in _encode_columns(data):
+            file_name = f'{len(columns)}.npy'
+            np.save(os.path.join(tmp_dir, file_name), np.ascontiguousarray(values))
+            columns.append({'name': name, 'kind': kind, 'file': file_name, 'categories': categories})
+
+        meta = {'version': CACHE_VERSION,
+                'rows': len(data),
+                'source': get_source_stamp(file_path),
+                # tells the caches of the same file apart, see read_day_cache
+                'build': os.path.basename(tmp_dir),
+                'index': columns[0],
+                'columns': columns[1:]}
+        with open(os.path.join(tmp_dir, META_FILE), 'w') as f:
+            json.dump(meta, f)
+
+        # a directory is only replaced by a rename if it is empty, the previous cache is moved away first
+        old_dir = tmp_dir + '.old'
+        try:
+            os.replace(cache_dir, old_dir)
+        except FileNotFoundError:
+            pass
+        try:
+            os.replace(tmp_dir, cache_dir)
+        except OSError as e:
+            # another process put its cache in place meanwhile
+            logger.debug(f'cache {cache_dir} already written by another process, error : {e}')
+        shutil.rmtree(old_dir, ignore_errors=True)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    return cache_dir
+
+
+def is_cache_valid(file_path:str) -> bool:
+    '''
+    Returns True if the binary cache of the raw data file exists and is not stale
+    '''
+    meta_path = os.path.join(get_cache_dir(file_path), META_FILE)
+    if not os.path.exists(meta_path):
+        return False
+    with open(meta_path) as f:
+        meta = json.load(f)
+    return meta['version'] == CACHE_VERSION and meta['source'] == get_source_stamp(file_path)
+
+
+def read_day_cache(file_path:str):
+    '''
+    Reads a preprocessed day from the binary cache of the raw data file. The column files are memory mapped
+    (read only) and the numeric and datetime columns of the returned day are views of the maps, so the pages
+    are read from the disk when used; the maps stay open as long as the columns are referenced.
+    Returns None if the cache is missing or stale.
+    '''
+    if not is_cache_valid(file_path):
+        return None
+
+    cache_dir = get_cache_dir(file_path)
+    try:
+        with open(os.path.join(cache_dir, META_FILE)) as f:
+            meta = json.load(f)
+
+        arrays = {column['name']: np.load(os.path.join(cache_dir, column['file']), mmap_mode='r') for column in [meta['index']] + meta['columns']}
+
+        # the cache may have been replaced by another process while the files were opened
+        with open(os.path.join(cache_dir, META_FILE)) as f:
+            if json.load(f).get('build') != meta.get('build'):
+                return None
+    except FileNotFoundError:
+        return None
+
+    return _decode_columns(meta, arrays, copy=False)
+
+
+def arrays_to_shared_memory(arrays:dict) -> tuple:
+    '''
+    Copies NumPy arrays (name -> array) into shared memory, one block per array. Other processes attach to them
+    with arrays_from_shared_memory(meta) without copying.
+    The caller owns the blocks, they must be closed and unlinked once the arrays are not used anymore.
+
+    Returns (meta, blocks) where meta (picklable) describes the arrays and their blocks
+    '''
+    meta, blocks = dict(), list()
+    for name, values in arrays.items():
+        values = np.ascontiguousarray(values)
+        block = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+        np.ndarray(values.shape, dtype=values.dtype, buffer=block.buf)[:] = values
+        blocks.append(block)
+        # structured arrays (e.g. the greeks) keep their fields
+        meta[name] = {'block': block.name, 'dtype': values.dtype.descr if values.dtype.names else values.dtype.str,
+                      'shape': values.shape}
+    return meta, blocks
+
+
+def arrays_from_shared_memory(meta:dict) -> tuple:
+    '''
+    Attaches to arrays copied into shared memory by arrays_to_shared_memory(), from the process which created them
+    or from its child processes. Returns (arrays, blocks), the blocks must be kept (and closed, not unlinked) as long
+    as the arrays are used.
+    '''
+    arrays, blocks = dict(), list()
+    for name, array in meta.items():
+        # the worker processes share the resource tracker of their parent which created the block,
+        # the block is unlinked by the parent only
+        block = shared_memory.SharedMemory(name=array['block'])
+        arrays[name] = np.ndarray(array['shape'], dtype=np.dtype(array['dtype']), buffer=block.buf)
+        blocks.append(block)
+    return arrays, blocks
+
+
+def to_shared_memory(data:pd.DataFrame) -> tuple:
+    '''
+    Copies a preprocessed day into shared memory, one block per column. Other processes attach to it
+    with from_shared_memory(meta) without copying the numeric and datetime columns.
+    The caller owns the blocks, they must be closed and unlinked once the day is not used anymore.
+
+    Returns (meta, blocks) where meta (picklable) describes the columns and their blocks
+    '''
+    columns, arrays = list(), dict()
+    for name, kind, values, categories in _encode_columns(data):
+        arrays[name] = values
+        columns.append({'name': name, 'kind': kind, 'categories': categories})
+    arrays_meta, blocks = arrays_to_shared_memory(arrays)
+
+    meta = {'rows': len(data), 'index': columns[0], 'columns': columns[1:], 'arrays': arrays_meta}
+    return meta, blocks
+
+
+def from_shared_memory(meta:dict) -> tuple:
+    '''
+    Attaches to a preprocessed day copied into shared memory by to_shared_memory(), from the process
+    which created it or from its child processes. Returns (data, blocks), the blocks must be kept (and closed, not unlinked) as long as data is used.
+    '''
+    arrays, blocks = arrays_from_shared_memory(meta['arrays'])
+    return _decode_columns(meta, arrays, copy=False), blocks
+
+
+def load_eis_day(file_name:str, data_path:str=DATA_PATH, use_cache:bool=True, write_cache:bool=True) -> pd.DataFrame:
+    '''
+    Returns the preprocessed data of one raw EIS data file. The binary cache is preferred,
+    the csv file is parsed and preprocessed only when the cache is missing or stale
+    (in that case the cache is written for the next runs if write_cache is True).
+
+    Parameters:
+        file_name: raw data file name, <UNDERLYING>_<YYYYMMDD>_Intraday.csv
+        data_path: directory of the raw data files
+        use_cache: read the binary cache if available
+        write_cache: write the binary cache after parsing the csv file
+    '''
+    file_path = os.path.join(data_path, file_name)
+
+    if use_cache:
+        try:
+            data = read_day_cache(file_path)
+            if data is not None:
+                logger.info(f'{file_name} loaded from binary cache {get_cache_dir(file_path)}')
+                return data
+        except Exception as e:
+            logger.critical(f'Error in load_eis_day in line {get_exception_line_no()}, error : {e}')
+
+    data_np, columes = _load_data_file(data_path, file_name)
+    data = preprocess_eis_data(pd.DataFrame(data_np, columns=EIS_COLUMNS))
+
+    if write_cache:
+        try:
+            write_day_cache(file_path, data)
+            logger.info(f'{file_name} cached in {get_cache_dir(file_path)}')
+        except Exception as e:
+            logger.critical(f'Error in load_eis_day in line {get_exception_line_no()}, error : {e}')
+
+    return data
+
+
+def concat_eis_days(frames:list) -> pd.DataFrame:
+    '''
+    Concatenates preprocessed days in a single pass. The categorical columns of the frames are given
+    (in place) the union of the categories of all the days so that they stay categorical after the concatenation.
+    '''
+    if len(frames) == 1:
+        return frames[0]
+
+    categories = {name: pd.api.types.union_categoricals([frame[name] for frame in frames]).categories
+                  for name, dtype in frames[0].dtypes.items() if isinstance(dtype, pd.CategoricalDtype)}
+    for frame in frames:
+        for name, cats in categories.items():
+            if not frame[name].cat.categories.equals(cats):
+                frame[name] = frame[name].cat.set_categories(cats)
+
+    return pd.concat(frames, axis = 0, copy = False)
+
+
+def convert_eis_days(underlying:str, start_date, end_date, data_path:str=DATA_PATH, force:bool=False) -> list:
+    '''
+    One-time conversion of the raw EIS data files of a date range into the binary cache.
+    Days without a raw data file are skipped. Returns the list of converted files.
+    '''
+    converted = list()
+    for date in pd.date_range(start=start_date, end=end_date).strftime('%Y%m%d'):
+        file_name = underlying + '_' + date + '_Intraday.csv'
+        file_path = os.path.join(data_path, file_name)
+        if not os.path.exists(file_path):
+            continue
+        if (not force) and is_cache_valid(file_path):
+            logger.debug(f'{file_name} is already converted')
+            continue
+        load_eis_day(file_name, data_path=data_path, use_cache=False, write_cache=True)
+        converted.append(file_path)
+
+    return converted
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Converts the raw EIS data files into the binary cache')
+    parser.add_argument('-u', '--underlying', type=str, help='Underlying Instrument (e.g BANKNIFTY)', required=True)
+    parser.add_argument('-s', '--start_date', type=str, help='Start Date (e.g 2021-03-10)', required=True)
+    parser.add_argument('-e', '--end_date', type=str, help='End Date (e.g 2021-03-31)', required=True)
+    parser.add_argument('-f', '--force', type=int, default=0, help='Convert even if the cache is valid', required=False)
+    args = parser.parse_args()
+
+    converted = convert_eis_days(args.underlying, args.start_date, args.end_date, force=bool(args.force))
+    print(f'{len(converted)} files converted')
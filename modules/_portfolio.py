@@ -5,7 +5,7 @@ import numpy as np
 import pandas as pd
 from ._instrument import Cash
 from ._instrument import Instrument, Options
-from ._instrument import get_options_from_id_list,  get_option_from_instrument_id#, : NEW method implemented in portfolio with slicing
+from ._instrument import get_option_from_instrument_id#, : NEW method implemented in portfolio with slicing
 from ._trade import Trade
 from ._historical_data import HistoricalData
 # from modules import Options, Instrument, Cash
@@ -17,6 +17,10 @@ import copy
 
 # TODO: to be moved to yaml file
 CASH_ID = params['CASH_ID']
+# initial number of slots of the portfolio ledger, doubled whenever it is full
+PORTFOLIO_INIT_CAPACITY = 16
+# per slot arrays of the portfolio ledger
+LEDGER_ARRAYS = ('_ids', '_position', '_current_price', '_avg_price', '_value', '_realized_pnl')
 logger = logger.getLogger('portfolio')
 
 
@@ -45,33 +49,167 @@ class Portfolio:
         self._is_init_cash_added = False
         self._file_name = file_name
 
+        # ledger : instrument id -> slot, the slots are rows of the NumPy arrays below.
+        # slot 0 is always the cash (instrument_id=CASH_ID)
+        self._slots = dict()
+        self._ids = np.zeros(PORTFOLIO_INIT_CAPACITY, dtype=np.int64)
+        self._objects = list()
+        self._position = np.zeros(PORTFOLIO_INIT_CAPACITY, dtype=np.float64)
+        self._current_price = np.zeros(PORTFOLIO_INIT_CAPACITY, dtype=np.float64)
+        self._value = np.zeros(PORTFOLIO_INIT_CAPACITY, dtype=np.float64)
+        # per leg pnl attribution : weighted average price of the open position and realized pnl
+        self._avg_price = np.zeros(PORTFOLIO_INIT_CAPACITY, dtype=np.float64)
+        self._realized_pnl = np.zeros(PORTFOLIO_INIT_CAPACITY, dtype=np.float64)
+        self._size = 0
+        # realized pnl of all the fills, it keeps the pnl of the instruments dropped from the ledger
+        self._total_realized_pnl = 0.0
+        # totals and DataFrame view of the ledger, built when read, None when the ledger has changed
+        self._total_value = None
+        self._total_unrealized_pnl = None
+        self._df_view = None
+
         if init_from_file:
-            self._portfolio_df = self.load_portfolio_data_from_file(file_name=self._file_name)
+            portfolio_df = self.load_portfolio_data_from_file(file_name=self._file_name)
+            if 'instrument_id' in portfolio_df.columns:
+                portfolio_df = portfolio_df.set_index('instrument_id')
+            for id, row in portfolio_df.iterrows():
+                self._add_instrument(instrument_id=id,
+                                     instrument_object=row['instrument_object'],
+                                     position=row['position'],
+                                     current_price=row['current_price'],
+                                     avg_price=row.get('weighted_avg_price', row['current_price']))
+                self._realized_pnl[self._size - 1] = row.get('realized_pnl', 0.0)
+            self._total_realized_pnl = self._realized_pnl[:self._size].sum()
         else:
-            self._portfolio_df = pd.DataFrame(
-                columns=[   "instrument_object",
-                            "position",
-                            "current_price",
-                            #"weighted_avg_price",
-                            "value"
-                            # "delta",
-                            # "trade_id_list",
-                            # "mark_to_market"
-                            # "realized_pnl",
-                            #TODO : add the features required to create instrument : option_type, strike,, expiry
-                        ])
-            self._portfolio_df.index.name = 'instrument_id'
-
-            initial_cash_dict = {"instrument_object" : Cash(),
-                                       "position":initial_cash,
-                                       "current_price":1,
-                                       "value":initial_cash,
-                                      }
-            self._portfolio_df.loc[CASH_ID]=initial_cash_dict
+            self._add_instrument(instrument_id=CASH_ID,
+                                 instrument_object=Cash(),
+                                 position=initial_cash,
+                                 current_price=1)
             logger.info(f'{self.getCash()} {self.getCurrency()} cash added to portfolio.')
-            
+
+    def _add_instrument(self, instrument_id:int, instrument_object, position:float, current_price:float, avg_price:float=None) -> int:
+        '''
+        Adds a new instrument to the ledger and returns its slot. The arrays grow geometrically.
+        avg_price is the price the position was opened at (current_price if not given).
+        '''
+        if self._size == len(self._ids):
+            capacity = 2 * len(self._ids)
+            for name in LEDGER_ARRAYS:
+                setattr(self, name, np.resize(getattr(self, name), capacity))
+
+        slot = self._size
+        self._slots[instrument_id] = slot
+        self._ids[slot] = instrument_id
+        self._objects.append(instrument_object)
+        self._position[slot] = 0
+        self._current_price[slot] = current_price
+        self._avg_price[slot] = current_price if avg_price is None else avg_price
+        self._value[slot] = 0
+        self._realized_pnl[slot] = 0
+        self._size += 1
+        self._set_position_price(slot, position, current_price)
+        return slot
+
+    def _ledger_changed(self) -> None:
+        '''
+        Drops the totals and the DataFrame view of the ledger, they are built again from the slots when read
+        '''
+        self._total_value = None
+        self._total_unrealized_pnl = None
+        self._df_view = None
+
+    def _set_position_price(self, slot:int, position:float, current_price:float) -> None:
+        '''
+        Sets position and current price of a slot and updates its value
+        '''
+        self._position[slot] = position
+        self._current_price[slot] = current_price
+        self._value[slot] = self._position[slot]*self._current_price[slot]
+        self._ledger_changed()
+
+    def _apply_fill(self, slot:int, trade_position:float, trade_price:float) -> None:
+        '''
+        Updates the weighted average price and the realized pnl of a slot with a fill. The position 
+        itself is updated by _set_position_price(). Reducing a position realizes (trade price - average price)
+        on the closed quantity, a position flipping side is reopened at the trade price.
+        '''
+        position, avg_price = self._position[slot], self._avg_price[slot]
+        new_position = position + trade_position
+        if trade_position == 0:
+            return
+        elif position == 0 or np.sign(position) == np.sign(trade_position):
+            self._avg_price[slot] = (position*avg_price + trade_position*trade_price)/new_position
+        else:
+            closed = min(abs(trade_position), abs(position))
+            pnl = closed*(trade_price - avg_price)*np.sign(position)
+            self._realized_pnl[slot] += pnl
+            self._total_realized_pnl += pnl
+            if new_position == 0:
+                self._avg_price[slot] = 0.0
+            elif np.sign(new_position) != np.sign(position):
+                self._avg_price[slot] = trade_price
+        self._ledger_changed()
+
+    def drop_instruments(self, id_list:list=None) -> None:
+        '''
+        Removes instruments from the portfolio, all the instruments except cash if id_list is None.
+        The cash can not be removed.
+        '''
+        try:
+            n = self._size
+            if id_list is None:
+                keep = np.zeros(n, dtype=bool)
+            else:
+                keep = ~np.isin(self._ids[:n], np.asarray(list(id_list), dtype=np.int64))
+            keep[0] = True
+
+            # realized pnl of the removed instruments stays in the running total
+            slots = np.flatnonzero(keep)
+            self._size = len(slots)
+            for name in LEDGER_ARRAYS:
+                array = getattr(self, name)
+                array[:self._size] = array[slots]
+            self._objects = [self._objects[slot] for slot in slots]
+            self._slots = dict(zip(self._ids[:self._size].tolist(), range(self._size)))
+            self._ledger_changed()
+            logger.debug(f'{n - self._size} instruments removed from the portfolio')
+
+        except Exception as e:
+            logger.critical(f'Error in drop_instruments in line {get_exception_line_no()}, error : {e}')
+            raise e
+
     def getDF(self):
-        return self._portfolio_df
+        '''
+        Returns the portfolio as a DataFrame (instrument_id, instrument_object, position, current_price, 
+        weighted_avg_price, value, realized_pnl).
+        It is a read only view for reporting, built from the ledger only when the ledger has changed:
+        editing its values (loc, at, iloc, ...) raises a ValueError, and columns added or replaced only change
+        the returned frame. The portfolio is changed through update() and drop_instruments().
+        '''
+        if self._df_view is None:
+            n = self._size
+            columns = {"position": self._position, "current_price": self._current_price, "weighted_avg_price": self._avg_price,
+                       "value": self._value, "realized_pnl": self._realized_pnl}
+            objects = np.empty(n, dtype=object)
+            objects[:] = self._objects[:n]
+            columns = {"instrument_object": objects, **{name: array[:n].copy() for name, array in columns.items()}}
+            index = self._ids[:n].copy()
+            for array in [index] + list(columns.values()):
+                array.flags.writeable = False
+            self._df_view = pd.DataFrame(columns, index=pd.Index(index, name='instrument_id', copy=False), copy=False)
+        # every caller gets its own frame, the columns it adds or replaces do not reach the cached one
+        return self._df_view.copy(deep=False)
+
+    @property
+    def _portfolio_df(self) -> pd.DataFrame:
+        # kept for the notebooks and the reports which read the DataFrame directly
+        return self.getDF()
+
+    def __getstate__(self):
+        # the DataFrame view is not pickled (e.g. to the worker processes), its arrays would not stay read only
+        state = self.__dict__.copy()
+        state['_df_view'] = None
+        return state
     
     def update_latest_timestamp(self,t:datetime)->None:
         '''
@@ -90,10 +228,7 @@ class Portfolio:
         This function will check if an instrument id exists in the portfolio df
         '''
         try : 
-            ret_val = False
-            if instrument_id in self._portfolio_df.index.to_list():
-                ret_val = True
-            return ret_val
+            return instrument_id in self._slots
         
         except Exception as e:
             logger.critical(f'Error in is_instrument_id_in_portfolio in line {get_exception_line_no()}, error : {e}')
@@ -108,8 +243,8 @@ class Portfolio:
         List of Option objects
         '''
         try:
-            id_list = self._portfolio_df.loc[self._portfolio_df.index != CASH_ID].index
-            return get_options_from_id_list(id_list)
+            # the instrument objects are kept in the portfolio
+            return [self._objects[slot] for slot in range(1, self._size)]
 
         except Exception as e:
             logger.critical(f'Error in get_portfolio_option_list in line : {get_exception_line_no()}, error : {e}')
@@ -181,28 +316,28 @@ class Portfolio:
 
                     accumulated_cash += trade.getCash()
 
-                    if (trade_instr_id in self._portfolio_df.index):
-                        self.getDF().at[trade_instr_id,"position"] += trade_position
+                    slot = self._slots.get(trade_instr_id, -1)
+                    if slot >= 0:
+                        self._apply_fill(slot, trade_position, trade_price)
                         # TODO: we can call get_quote_by_id() instead of get_quote()
-                        self.getDF().at[trade_instr_id,"current_price"] = self.getDF().at[trade_instr_id,'instrument_object'].get_quote(t=trade_time, q_type=quote_type, mkt_data=mkt_data)[0]
-                        self.getDF().at[trade_instr_id,"value"] = self.getDF().at[trade_instr_id,"position"]*self.getDF().at[trade_instr_id,"current_price"] 
+                        curr_price = self._objects[slot].get_quote(t=trade_time, q_type=quote_type, mkt_data=mkt_data)[0]
+                        self._set_position_price(slot, self._position[slot] + trade_position, curr_price)
                     else:
                         instr_obj = get_option_from_instrument_id(id = trade_instr_id,mkt_data=mkt_data)
                         # TODO: we can call get_quote_by_id() instead of get_quote()
                         curr_price,_ = instr_obj.get_quote(t=trade_time, q_type=quote_type, mkt_data=mkt_data)
-                        trade_dict ={  "instrument_object": instr_obj,
-                                        "position": trade_position,
-                                        'current_price': curr_price,
-                                        "value": trade_position*curr_price # TODO: Q: will it be curr_price or trade_price
-                                    }
-                        self._portfolio_df.loc[trade_instr_id] = trade_dict
+                        # TODO: Q: will value be computed with curr_price or trade_price
+                        self._add_instrument(instrument_id=trade_instr_id,
+                                             instrument_object=instr_obj,
+                                             position=trade_position,
+                                             current_price=curr_price,
+                                             avg_price=trade_price)
 
                         logger.info(f'New instrument added to Portfolio_df with ID : {trade_instr_id}')
                         
                 # update cash when trades executed
                 logger.info(f'updating cash by {accumulated_cash} to {self.getCash()}')
-                self.getDF().at[params['CASH_ID'],'position'] += ((-1)*accumulated_cash)
-                self.getDF().at[params['CASH_ID'],'value'] += ((-1)*accumulated_cash)
+                self._update_cash_slot((-1)*accumulated_cash)
                 logger.debug(f'portfolio value at time {trade_time} is {self.get_portfolio_value()}')
         
             else: #empty trade_list - only update prices and values
@@ -213,7 +348,7 @@ class Portfolio:
             if params['DEBUG']:
                 print(f'\n')
                 print('-'*80)
-                sum = self._portfolio_df['value'].sum()
+                sum = self.get_portfolio_value()
                 # print(f'trade_instr_id = {trade_instr_id}\ntrade_position = {trade_position}\nquote_type = {quote_type}\ntrade_price = {trade_price}\ntrade_time = {trade_time}')
                 print(f"Total portfolio value at time {trade_time} is : {round(sum,2)}")
                 print(f'\n')
@@ -222,7 +357,7 @@ class Portfolio:
                 print(self)
                 print(f'\n')
                 print(f'Timestamp : {trade_time}')
-                print(self._portfolio_df[['current_price','position','value']])
+                print(self.getDF()[['current_price','position','value']])
                 # print(self.getPortfolio_df()[['position','current_price', 'value']])
                 print(f'\n')
 
@@ -241,6 +376,53 @@ class Portfolio:
             raise e
 
 
+    def apply_fills(self, fills:np.ndarray, mkt_data:HistoricalData) -> None:
+        '''
+        Books already executed fills (e.g. from the vectorized backtest) in their order, as update() would do:
+        weighted average price, realized pnl, position and cash (trade cash plus transaction cost).
+        Each instrument is marked at the Mark of its last fill.
+
+        Parameters:
+            fills: structured array with ExchToken, Position, Price and Mark fields
+            mkt_data: market data the instruments new to the portfolio are looked up in
+        '''
+        try:
+            txn_cost = params['TXN_COST'] if params['TXN_COST_FLAG'] else 0
+            for instrument_id, trade_position, trade_price, mark in zip(fills['ExchToken'].tolist(), fills['Position'].tolist(),
+                                                                         fills['Price'].tolist(), fills['Mark'].tolist()):
+                slot = self._slots.get(instrument_id, -1)
+                if slot < 0:
+                    slot = self._add_instrument(instrument_id=instrument_id,
+                                                instrument_object=get_option_from_instrument_id(id=instrument_id, mkt_data=mkt_data),
+                                                position=0,
+                                                current_price=mark,
+                                                avg_price=trade_price)
+                self._apply_fill(slot, trade_position, trade_price)
+                self._set_position_price(slot, self._position[slot] + trade_position, mark)
+
+            self._update_cash_slot((-1)*(np.sum(fills['Position']*fills['Price']) + txn_cost*len(fills)))
+            logger.debug(f'{len(fills)} fills booked, portfolio value {self.get_portfolio_value()}')
+
+        except Exception as e:
+            logger.critical(f'Error in apply_fills in line : {get_exception_line_no()}, error : {e}')
+            raise e
+
+    def set_current_prices(self, ids, prices) -> None:
+        '''
+        Sets the current prices of the instruments (e.g. the marks of the vectorized backtest), their values follow
+        '''
+        for instrument_id, price in zip(np.asarray(ids, dtype=np.int64).tolist(), np.asarray(prices, dtype=np.float64).tolist()):
+            slot = self._slots.get(instrument_id, -1)
+            if slot > 0:
+                self._set_position_price(slot, self._position[slot], price)
+
+    def get_positions(self) -> tuple:
+        '''
+        Returns (ids, positions, current prices) of the instruments in the portfolio, without the cash
+        '''
+        n = self._size
+        return self._ids[1:n].copy(), self._position[1:n].copy(), self._current_price[1:n].copy()
+
     def update_cash(self, amount):
         '''
         updates the cash position and value in the portfolio
@@ -249,12 +431,11 @@ class Portfolio:
             if amount != 0 : 
                 # its assumed that there will be only one row for cash with instrumentid as CASH_ID
                 if params['DEBUG']:
-                    print('Current Cash is {0}'.format(self._portfolio_df.loc[CASH_ID]['position']))
+                    print('Current Cash is {0}'.format(self.getCash()))
                     print('Additional Cash is {}'.format(amount))
-                self.getDF().at[params['CASH_ID'],'position'] += ((-1)*amount)
-                self.getDF().at[params['CASH_ID'],'value'] += ((-1)*amount)
+                self._update_cash_slot((-1)*amount)
                 if params['DEBUG']:
-                    print('Updated cash to {0}'.format(self._portfolio_df.loc[CASH_ID]['position']))
+                    print('Updated cash to {0}'.format(self.getCash()))
                 #logger.info(f'updated cash to {self._portfolio_df.loc[CASH_ID]['position']}')
 
         except Exception as e:
@@ -262,28 +443,40 @@ class Portfolio:
             raise e
 
 
+    def _update_cash_slot(self, amount:float) -> None:
+        '''
+        O(1) update of the cash position and value (slot 0 of the ledger)
+        '''
+        self._position[0] += amount
+        self._value[0] += amount
+        self._ledger_changed()
+
     def update_current_prices_values(self,utime:datetime,mkt_data:HistoricalData):
         '''
-        Updates the current prices and corresponding values of the instruments in the portfolio
+        Updates the current prices and corresponding values of the instruments in the portfolio 
+        in one batched revaluation. Long positions are marked on the bid and short positions on the ask.
+        Instruments without a valid quote at utime (missing or non positive price) keep their last price and value.
         '''
         try:
-            cash_val_change = 0
-            for id in self._portfolio_df.index:
-                if id == CASH_ID:
-                    # TODO: need to change CASH_ID
-                    continue
-                q_type = 'ask' if self._portfolio_df.at[id,'position'] < 0 else 'bid'
-                # TODO: we can call get_quote_by_id() instead of get_quote()
-                # curr_price,_ = self._portfolio_df.at[id,'instrument_object'].get_quote(t=utime, q_type=q_type, mkt_data=mkt_data)
-                try:
-                    curr_price,_ = self._portfolio_df.at[id,'instrument_object'].get_quote_by_id(t=utime, instrument_id=id, q_type=q_type, mkt_data=mkt_data)
-                    if curr_price != None:
-                        if curr_price > 0:
-                            self._portfolio_df.at[id,'current_price'] = curr_price
-                            self._portfolio_df.at[id,'value'] = curr_price * self._portfolio_df.at[id,'position']
-                            logger.debug(f'Current price and value updated for the instrument_id : {id} and with price : {curr_price}')
-                except Exception as e:
-                    logger.critical(f'Error in : update_current_prices_values in line : {get_exception_line_no()} with error : {e}')
+            n = self._size
+            if n <= 1:
+                return
+
+            # quotes of all the instruments in the portfolio are gathered in one call
+            id_list = self._ids[1:n]
+            pos = self._position[1:n]
+            quotes = mkt_data.get_quotes_by_ids(t=utime, ids=id_list)
+            curr_price = np.where(pos < 0, quotes[:, 2], quotes[:, 0])
+
+            # nan (missing quote) compares as False
+            valid = curr_price > 0
+            self._current_price[1:n] = np.where(valid, curr_price, self._current_price[1:n])
+            self._value[1:n] = np.where(valid, curr_price * pos, self._value[1:n])
+            self._ledger_changed()
+
+            if not valid.all():
+                logger.warning(f'no valid quote at {utime} for instrument_id={id_list[~valid].tolist()}, last prices are kept')
+            logger.debug(f'Current price and value updated for {np.count_nonzero(valid)} instruments at {utime}')
 
         except Exception as e:
             logger.critical(f'Error in : update_current_prices_values in line : {get_exception_line_no()} with error : {e}')
@@ -314,7 +507,7 @@ class Portfolio:
             os.makedirs(params['OBJ_STORE'], exist_ok=True)
             with open(file_path, "w"):
                 pass
-            self._portfolio_df.to_csv(file_path)
+            self.getDF().to_csv(file_path)
             logger.info(f'Portfolio_df stored in file={file_name} at time {dt_now}')
 
         except Exception as e:
@@ -340,31 +533,67 @@ class Portfolio:
         #          OR
         #          or anytime this method is called?
 
-        def compute_delta(obj,mkt_data):
-            # row_delta = self.getDF().at[idx,'instrument_object'].calculate_delta_by_id(instrument_id=idx,t=qtime,q_type='mid',mkt_data=mkt_data)*self.getDF().at[idx,'position']
-            pos = self.getDF().at[obj.getId(),'position']
-            if pos==0:
-                row_delta = 0
-            else:
-                try:
-                    qtype = 'bid' if pos > 0 else 'ask'
-                    row_delta = obj.calculate_delta_by_id(instrument_id=obj.getId(),t=qtime,q_type=qtype,mkt_data=mkt_data)*(-1)*pos
-                except Exception as e:
-                    logger.critical(f'error while computing delta for instrument_id={obj.getId()}. setting delta for this id to 0# {e}')
-                    row_delta = 0
-            logger.debug(f'delta for instrument_id={obj.getId()} is computed as {row_delta} with position={pos}')
-            return row_delta
-
         try:
-            # self._portfolio_df.loc[self._portfolio_df.index[1]].index
-            # delta_sum = self._portfolio_df.index.to_series().apply(compute_delta, args=(mkt_data,)).sum()
-            delta_sum = self._portfolio_df.iloc[1:]['instrument_object'].apply(compute_delta, args=(mkt_data,)).sum()
+            # deltas are read from the greeks surface of the time slice, 
+            # long positions are valued on the bid and short positions on the ask
+            id_list = self._ids[1:self._size]
+            pos = self._position[1:self._size]
+            delta = np.where(pos > 0,
+                             mkt_data.get_greeks_by_ids(t=qtime, ids=id_list, q_type='bid')['delta'],
+                             mkt_data.get_greeks_by_ids(t=qtime, ids=id_list, q_type='ask')['delta'])
+
+            # not on the surface (e.g. not quoted at qtime): computed by the instrument, on the nearest strike if needed
+            for idx in np.flatnonzero((pos != 0) & np.isnan(delta)).tolist():
+                delta[idx] = self._calculate_delta(slot=idx + 1, qtime=qtime, mkt_data=mkt_data)
+            row_delta = np.where(pos == 0, 0, delta*(-1)*pos)
+            logger.debug(f'delta for instrument_id={id_list.tolist()} is computed as {row_delta.tolist()} with position={pos.tolist()}')
+
+            delta_sum = row_delta.sum()
             #logger.info('Delta computed as : {0} at {1}'.format(delta_sum,qtime))
             return delta_sum
         except Exception as e:
             logger.critical(f'Error in get_portfolio_delta() in line : {get_exception_line_no()}, error : {e}')
             # raise e
 
+    def _calculate_delta(self, slot:int, qtime, mkt_data) -> float:
+        '''
+        Delta of the instrument of a slot computed by the instrument (Options.calculate_delta_by_id, priced on the
+        nearest strike when the instrument is not quoted), on the bid if long else on the ask. 0 if it can not be computed.
+        '''
+        instrument_id = int(self._ids[slot])
+        try:
+            q_type = 'bid' if self._position[slot] > 0 else 'ask'
+            return self._objects[slot].calculate_delta_by_id(instrument_id=instrument_id, t=qtime, q_type=q_type, mkt_data=mkt_data)
+        except Exception as e:
+            logger.critical(f'error while computing delta for instrument_id={instrument_id}. setting delta for this id to 0# {e}')
+            return 0
+
+    def get_portfolio_delta_over(self, times, mkt_data) -> np.ndarray:
+        '''
+        Returns the portfolio delta (see get_portfolio_delta) at every time, the positions held constant
+        '''
+        try:
+            id_list = self._ids[1:self._size]
+            pos = self._position[1:self._size]
+            delta = np.where(pos > 0,
+                             mkt_data.get_greeks_by_ids_over(times=times, ids=id_list, q_type='bid')['delta'],
+                             mkt_data.get_greeks_by_ids_over(times=times, ids=id_list, q_type='ask')['delta'])
+
+            # not on the surface: computed by the instrument as in get_portfolio_delta
+            for time_idx, idx in zip(*np.nonzero((pos != 0) & np.isnan(delta))):
+                delta[time_idx, idx] = self._calculate_delta(slot=idx + 1, qtime=times[time_idx], mkt_data=mkt_data)
+            row_delta = np.where(pos == 0, 0, delta*(-1)*pos)
+            return row_delta.sum(axis=1)
+        except Exception as e:
+            logger.critical(f'Error in get_portfolio_delta_over() in line : {get_exception_line_no()}, error : {e}')
+            return np.full(len(times), np.nan)
+
+    def get_expiry_times(self) -> np.ndarray:
+        '''
+        Returns the expiry date times of the options in the portfolio
+        '''
+        return np.array([self._objects[slot].getExpiry() for slot in range(1, self._size)], dtype='datetime64[ns]')
+
 
     # This function will return thne unwind list
     def get_unwind_list(self, timestep:datetime)->list:
@@ -373,9 +602,8 @@ class Portfolio:
         '''
         try:
             unwind_list = []
-            valid_instrument_list = self._portfolio_df.index.to_list()[1:]
-            for id in valid_instrument_list:
-                opt,pos = self._portfolio_df.loc[id,['instrument_object','position']]
+            for slot in range(1, self._size):
+                opt,pos = self._objects[slot], self._position[slot]
                 # opt = get_option_from_instrument_id(id,mkt_data=self.get_time_slice_mkt_data(timestep))
                 if self.is_expiry_time(at_time_t = timestep, expiry= opt.getExpiry(), buffer = 45): # WE can change the buffer
                     unwind_list.append((opt,pos))
@@ -436,7 +664,9 @@ class Portfolio:
         try:
             if update:
                 self.update_current_prices_values(utime=utime)
-            portfolio_val = self._portfolio_df['value'].sum()
+            if self._total_value is None:
+                self._total_value = self._value[:self._size].sum()
+            portfolio_val = self._total_value
             return portfolio_val
 
         except Exception as e:
@@ -473,7 +703,46 @@ class Portfolio:
     # All Getter methods
 
     def getCash(self):
-        return self.getDF().at[params['CASH_ID'],'position']
+        return self._position[0]
+
+    def get_gross_exposure(self) -> float:
+        '''
+        Returns the sum of the absolute values of all the instruments except cash
+        '''
+        return np.abs(self._value[1:self._size]).sum()
+
+    def get_number_of_legs(self) -> int:
+        '''
+        Returns the number of instruments with an open position
+        '''
+        return int(np.count_nonzero(self._position[1:self._size]))
+
+    def getRealizedPnL(self) -> float:
+        return self._total_realized_pnl
+
+    def getUnrealizedPnL(self) -> float:
+        if self._total_unrealized_pnl is None:
+            n = self._size
+            self._total_unrealized_pnl = (self._position[1:n] * (self._current_price[1:n] - self._avg_price[1:n])).sum()
+        return self._total_unrealized_pnl
+
+    def getPnL(self) -> float:
+        return self._total_realized_pnl + self.getUnrealizedPnL()
+
+    def get_pnl_attribution(self) -> pd.DataFrame:
+        '''
+        Returns the pnl of every leg (instrument) in the portfolio : position, weighted average price, 
+        current price, realized, unrealized and total pnl
+        '''
+        n = self._size
+        unrealized_pnl = self._position[1:n] * (self._current_price[1:n] - self._avg_price[1:n])
+        return pd.DataFrame({"position": self._position[1:n],
+                             "weighted_avg_price": self._avg_price[1:n],
+                             "current_price": self._current_price[1:n],
+                             "realized_pnl": self._realized_pnl[1:n],
+                             "unrealized_pnl": unrealized_pnl,
+                             "total_pnl": self._realized_pnl[1:n] + unrealized_pnl},
+                            index=pd.Index(self._ids[1:n], name='instrument_id'))
      
     
     def getCurrency(self)->str:
@@ -513,7 +782,7 @@ class Portfolio:
         return self._latest_timestamp
     
     def getPortfolio_df(self):
-        return self._portfolio_df
+        return self.getDF()
     
 
 
@@ -0,0 +1,241 @@
+import os
+import glob
+import json
+import fcntl
+import shutil
+import tempfile
+import contextlib
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+
+from modules._logger import logger,get_exception_line_no
+
+logger = logger.getLogger('results_store')
+
+INDEX_FILE = 'index.json'
+LOCK_FILE = 'index.lock'
+STORE_DIR = 'store'
+# partition of the results whose name is not a date (YYYYMMDD)
+OTHER_PARTITION = 'other'
+
+
+def get_store_dir(path:str) -> str:
+    '''
+    Returns the directory of the results store of a directory of daily csv files (inside it)
+    '''
+    return os.path.join(path, STORE_DIR)
+
+
+def get_partition(date:str) -> str:
+    '''
+    Returns the partition (YYYY/MM) of a date (YYYYMMDD), results not named after a date share one partition
+    '''
+    if date.isdigit() and len(date) == 8:
+        return os.path.join(date[:4], date[4:6])
+    return OTHER_PARTITION
+
+
+class ResultsStore():
+    """
+    Class Description
+    ------------------
+    Consolidated columnar store of the daily backtest results. Every day is a directory with one binary file
+    per field of the records (root/YYYY/MM/YYYYMMDD.<version>/<field>.npy) and a date index (index.json) maps
+    each date to its directory. A date range query only opens the files of the dates in the range and of the
+    fields asked for.
+    The index is shared by the processes writing to the same store, it is updated under a file lock.
+
+    Parameters
+    ----------
+    root : directory of the store
+    dtype : dtype of the records (structured)
+
+    Methods
+    -------
+
+    append_day(date, records, source_mtime, metrics) : Writes (or replaces) the records of a day
+
+    query(start_date, end_date, columns) : Returns the records between start_date (included) and end_date (excluded)
+
+    ingest_csv(path, max_workers) : Adds the csv files of a directory (YYYYMMDD.csv for the daily ones) which are not in the store yet
+
+    getDates() : Returns the sorted dates in the store
+    """
+    def __init__(self, root:str, dtype:list):
+        self._root = root
+        self._dtype = np.dtype(dtype)
+        self._index = self._load_index()
+
+    def _load_index(self) -> dict:
+        index_path = os.path.join(self._root, INDEX_FILE)
+        if os.path.exists(index_path):
+            with open(index_path) as f:
+                return json.load(f)
+        return dict()
+
+    def _update_index(self, entries:dict) -> None:
+        '''
+        Adds (or replaces) the index entries of some dates. The index is read again and written under a file lock,
+        the days added meanwhile by other processes are kept. The directories of the replaced days are removed.
+        '''
+        os.makedirs(self._root, exist_ok=True)
+        index_path = os.path.join(self._root, INDEX_FILE)
+        with open(os.path.join(self._root, LOCK_FILE), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                self._index = self._load_index()
+                replaced = [self._index[date] for date in entries if date in self._index]
+                self._index.update(entries)
+                tmp_index_path = index_path + f'.{os.getpid()}.tmp'
+                with open(tmp_index_path, 'w') as f:
+                    json.dump(self._index, f, indent=1, sort_keys=True)
+                os.replace(tmp_index_path, index_path)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+        for entry in replaced:
+            if 'dir' in entry:
+                shutil.rmtree(os.path.join(self._root, entry['dir']), ignore_errors=True)
+            else:
+                # single structured file of the previous layout
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(os.path.join(self._root, entry['file']))
+
+    def _write_day(self, date:str, records:np.ndarray, source_mtime:int=None) -> dict:
+        '''
+        Writes every field of the records of a day into a new directory of its partition and returns its index entry,
+        the day is only visible once its index entry is saved
+        '''
+        records = np.asarray(records, dtype=self._dtype)
+        partition_dir = os.path.join(self._root, get_partition(date))
+        os.makedirs(partition_dir, exist_ok=True)
+        day_dir = tempfile.mkdtemp(prefix=f'{date}.', dir=partition_dir)
+        for name in self._dtype.names:
+            np.save(os.path.join(day_dir, f'{name}.npy'), np.ascontiguousarray(records[name]))
+        return {'dir': os.path.relpath(day_dir, self._root), 'rows': len(records), 'source_mtime': source_mtime}
+
+    def _read_day(self, date:str, names:tuple) -> dict:
+        '''
+        Returns the fields (name -> memory mapped array) of the records of a day
+        '''
+        entry = self._index[date]
+        if 'dir' not in entry:
+            # single structured file of the previous layout
+            records = np.load(os.path.join(self._root, entry['file']), mmap_mode='r')
+            return {name: records[name] for name in names if name in records.dtype.names}
+        day_dir = os.path.join(self._root, entry['dir'])
+        return {name: np.load(os.path.join(day_dir, f'{name}.npy'), mmap_mode='r') for name in names
+                if os.path.exists(os.path.join(day_dir, f'{name}.npy'))}
+
+    def _fill_default(self, records:np.ndarray, name:str) -> None:
+        '''
+        Sets a field which was not recorded to its default value (nan, NaT or 0)
+        '''
+        if records.dtype[name].kind == 'f':
+            records[name] = np.nan
+        elif records.dtype[name].kind == 'M':
+            records[name] = np.datetime64('NaT')
+
+    def append_day(self, date:str, records:np.ndarray, source_mtime:int=None, metrics:dict=None) -> None:
+        '''
+        Writes (or replaces) the records of a day
+
+        Parameters:
+            date: date of the records (YYYYMMDD)
+            records: structured array of the records
+            source_mtime: modification time of the csv file of the same day, if any
+            metrics: summary statistics of the day kept in the index, if any
+        '''
+        try:
+            entry = self._write_day(date, records, source_mtime)
+            if metrics is not None:
+                entry['metrics'] = metrics
+            self._update_index({date: entry})
+        except Exception as e:
+            logger.critical(f'Error in append_day in line {get_exception_line_no()}, error : {e}')
+            raise e
+
+    def _read_csv(self, file_path:str) -> np.ndarray:
+        '''
+        Converts a daily csv file into records, the columns not in the file get their default value
+        '''
+        df = pd.read_csv(file_path)
+        records = np.zeros(len(df), dtype=self._dtype)
+        for name in self._dtype.names:
+            if name in df.columns:
+                records[name] = pd.to_datetime(df[name]).to_numpy() if self._dtype[name].kind == 'M' else df[name].to_numpy()
+            else:
+                self._fill_default(records, name)
+        return records
+
+    def ingest_csv(self, path:str, max_workers:int=None) -> list:
+        '''
+        Adds the csv files of a directory which are not in the store yet or which have been modified since
+        they were added. The files are read and written on a thread pool.
+        A file is stored under its name, the daily files (YYYYMMDD.csv) in the partition of their date
+        and the other ones in a partition of their own, they sort by name as the dates.
+        Returns the list of the dates (file names) added.
+        '''
+        try:
+            pending = list()
+            for file_path in glob.glob(os.path.join(path, '*.csv')):
+                date = os.path.splitext(os.path.basename(file_path))[0]
+                if get_partition(date) == OTHER_PARTITION:
+                    logger.warning(f'{file_path} is not named after a date (YYYYMMDD.csv), stored as {date}')
+                source_mtime = os.stat(file_path).st_mtime_ns
+                if self._index.get(date, {}).get('source_mtime') != source_mtime:
+                    pending.append((date, file_path, source_mtime))
+
+            if len(pending) == 0:
+                return list()
+
+            def _ingest(item):
+                date, file_path, source_mtime = item
+                return date, self._write_day(date, self._read_csv(file_path), source_mtime)
+
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                entries = dict(executor.map(_ingest, pending))
+            self._update_index(entries)
+            logger.info(f'{len(pending)} daily files ingested from {path} into {self._root}')
+
+            return sorted(date for date, _, _ in pending)
+
+        except Exception as e:
+            logger.critical(f'Error in ingest_csv in line {get_exception_line_no()}, error : {e}')
+            raise e
+
+    def query(self, start_date:str='', end_date:str='', columns:list=None) -> np.ndarray:
+        '''
+        Returns the records (sorted by date) between start_date (included) and end_date (excluded),
+        dates as YYYYMMDD or yyyy-mm-dd, with the given columns only (all of them by default).
+        Only the files of the dates in the range and of the columns asked for are read.
+        '''
+        start, end = start_date.replace('-', ''), end_date.replace('-', '')
+        dates = [date for date in self.getDates() if (not start or date >= start) and (not end or date < end)]
+        dtype = self._dtype if columns is None else np.dtype([(name, self._dtype[name]) for name in columns])
+
+        days = [self._read_day(date, dtype.names) for date in dates]
+        records = np.zeros(sum(self._index[date]['rows'] for date in dates), dtype=dtype)
+        offset = 0
+        for date, day in zip(dates, days):
+            rows = slice(offset, offset + self._index[date]['rows'])
+            for name in dtype.names:
+                if name in day:
+                    records[name][rows] = day[name]
+                else:
+                    self._fill_default(records[rows], name)
+            offset = rows.stop
+        return records
+
+    def getMetrics(self, date:str) -> dict:
+        '''
+        Returns the summary statistics saved with the records of a day (YYYYMMDD), None if there are none
+        '''
+        return self._index.get(date, {}).get('metrics')
+
+    def getDates(self) -> list:
+        return sorted(self._index)
+
+    def getRoot(self) -> str:
+        return self._root
@@ -0,0 +1,251 @@
+"""
+    Parallel runner which splits the trading days into independent segments and runs them on a process pool
+"""
+
+import os
+import copy
+import shutil
+import tempfile
+from contextlib import contextmanager
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+from modules._portfolio import Portfolio
+from modules._backtest import Backtest, OnlineMetrics
+from modules._market_cache import load_eis_day
+from modules.global_variables import params
+from modules._logger import logger,get_exception_line_no
+
+logger = logger.getLogger('runner')
+
+# output locations of a segment, redirected into the segment directory inside the workers
+OUTPUT_PARAMS = ('BLOTTER_STORE', 'BCKTST_STORE', 'OBJ_STORE')
+
+
+def _is_expiry_day(underlying:str, day) -> bool:
+    '''
+    Returns True if the trading day is the nearest expiry of its market data. The file is loaded
+    through the binary cache, which is written on the way for the workers.
+    '''
+    try:
+        file_name = underlying + '_' + day.strftime('%Y%m%d') + '_Intraday.csv'
+        data = load_eis_day(file_name, use_cache=params['MARKET_DATA_CACHE'], write_cache=params['MARKET_DATA_CACHE'])
+        return data['ExpiryDate'].min().date() == day.date()
+    except Exception as e:
+        logger.warning(f'expiry of {day} could not be checked, error : {e}')
+        return False
+
+
+def plan_segments(trading_days:list, expiry_days:list) -> list:
+    '''
+    Splits the trading days into segments ending at the expiry days, i.e. right after a SIMPLE_UNWIND
+    where the book only holds the trades taken after the unwind.
+
+    Parameters:
+        trading_days: (start, end) date times of the trading days
+        expiry_days: one flag per trading day, True for the expiry days
+
+    Returns the list of segments, each a list of (start, end) date times
+    '''
+    segments, segment = list(), list()
+    for day, is_expiry in zip(trading_days, expiry_days):
+        segment.append(day)
+        if is_expiry:
+            segments.append(segment)
+            segment = list()
+    if len(segment) > 0:
+        segments.append(segment)
+    return segments
+
+
+def get_book(portfolio:Portfolio) -> tuple:
+    '''
+    Returns the open positions of the portfolio (ids, positions, average prices, realized pnl), without the cash
+    '''
+    n = portfolio._size
+    return (portfolio._ids[1:n].copy(), portfolio._position[1:n].copy(),
+            portfolio._avg_price[1:n].copy(), portfolio._realized_pnl[1:n].copy())
+
+
+def is_same_book(book:tuple, other_book:tuple) -> bool:
+    ids, *values = book
+    other_ids, *other_values = other_book
+    return np.array_equal(ids, other_ids) and all(np.allclose(a, b, rtol=1e-12, atol=1e-9) for a, b in zip(values, other_values))
+
+
+@contextmanager
+def redirect_outputs(output_dir:str):
+    '''
+    Redirects the outputs (blotters, backtest records and portfolio files) into output_dir while in the context
+    '''
+    defaults = {name: params[name] for name in OUTPUT_PARAMS}
+    for name in OUTPUT_PARAMS:
+        params[name] = os.path.join(output_dir, os.path.basename(os.path.normpath(params[name]))) + os.sep
+    try:
+        yield output_dir
+    finally:
+        params.update(defaults)
+
+
+def _run_days(run_day, args, days:list, portfolio:Portfolio, output_dir:str, backtest:Backtest=None) -> dict:
+    '''
+    Runs the trading days one after the other with their outputs written in output_dir, the live statistics
+    continued from backtest if given. As in main, no day is run after the max drawdown went beyond the limit.
+    Returns the recorded values of every day.
+    '''
+    records = dict()
+    with redirect_outputs(output_dir):
+        for start, end in days:
+            try:
+                day_backtest = run_day(args, start, end, portfolio=portfolio, backtest=backtest)
+                if day_backtest is not None:
+                    backtest = day_backtest
+                    records[start] = backtest.getData()
+                if backtest is not None and backtest.should_stop():
+                    break
+            except Exception as ex:
+                logger.critical(f"exception while running {start} at line={get_exception_line_no()}. {ex}")
+    return records
+
+
+def run_segment(task:dict) -> dict:
+    '''
+    Runs a segment of trading days in a worker process on a new portfolio.
+
+    The book carried into a segment (i.e. the trades taken after the unwind of the previous expiry day)
+    does not depend on the trades before the unwind, only the cash and the realized pnl do. The previous
+    expiry day is run first as a warm-up to build that book; its outputs are discarded and its book is handed
+    off to the merge for validation. The cash and the realized pnl of the segment are corrected by the merge.
+
+    Parameters:
+        task: run_day, args, days, warm_up_day (None for the first segment), initial_cash, output_dir
+    '''
+    portfolio = Portfolio(initial_cash=task['initial_cash'])
+
+    handoff = None
+    if task['warm_up_day'] is not None:
+        _run_days(task['run_day'], task['args'], [task['warm_up_day']], portfolio, os.path.join(task['output_dir'], 'warm_up'))
+        handoff = (get_book(portfolio), portfolio.getCash(), portfolio.getRealizedPnL())
+
+    records = _run_days(task['run_day'], task['args'], task['days'], portfolio, task['output_dir'])
+
+    return {'handoff': handoff, 'records': records, 'portfolio': portfolio, 'output_dir': task['output_dir']}
+
+
+def _stops_in_segment(result:dict, cash_offset:float, backtest:Backtest) -> bool:
+    '''
+    Returns True if the max drawdown goes beyond the limit (params['BCKTST_STOP_DRAWDOWN']) within the segment
+    once its values are continued from the live statistics of backtest. A worker starts new statistics, so its
+    own stop does not see the peak of the previous segments.
+    '''
+    limit = params.get('BCKTST_STOP_DRAWDOWN')
+    if limit is None:
+        return False
+    metrics = copy.deepcopy(backtest.getOnlineMetrics()) if backtest is not None else OnlineMetrics()
+    for records in result['records'].values():
+        for value in records['Value'].tolist():
+            metrics.update(value + cash_offset)
+            if metrics.getMaxDrawdown() <= -abs(limit):
+                return True
+    return False
+
+
+def _merge_segment(result:dict, cash_offset:float, backtest:Backtest) -> Backtest:
+    '''
+    Moves the outputs of a segment into the output locations, the recorded values and cash are shifted by cash_offset.
+    Returns the Backtest of the last day (its live statistics are continued).
+    '''
+    blotter_dir = os.path.join(result['output_dir'], os.path.basename(os.path.normpath(params['BLOTTER_STORE'])))
+    if os.path.isdir(blotter_dir):
+        os.makedirs(params['BLOTTER_STORE'], exist_ok=True)
+        for file_name in sorted(os.listdir(blotter_dir)):
+            shutil.move(os.path.join(blotter_dir, file_name), os.path.join(params['BLOTTER_STORE'], file_name))
+
+    for day, records in result['records'].items():
+        backtest = Backtest(name='condor strategy', mode='algo', rows=len(records),
+                            online_metrics=backtest.getOnlineMetrics() if backtest is not None else None)
+        for record in records:
+            record = record.item()
+            backtest.update(values=(record[0], record[1] + cash_offset, record[2] + cash_offset) + record[3:])
+        backtest.save(backtestdatetime=day)
+
+    return backtest
+
+
+def run_parallel(args, trading_days:list, run_day, workers:int=os.cpu_count()) -> Portfolio:
+    '''
+    Runs the trading days on a process pool and merges the outputs (blotters, backtest records and
+    the final portfolio) in the order of the days, so the outputs are the same as a sequential run.
+
+    The days are split into segments at the expiry days (see plan_segments). Each segment (but the
+    first) starts from the book handed off by its warm-up day, it is checked against the book of the
+    previous segment at the merge. When they differ (e.g. no unwind took place) the segment is run
+    again in this process from the previous segment's portfolio. So is the segment where the max drawdown,
+    continued from the previous segments, goes beyond params['BCKTST_STOP_DRAWDOWN']; the run stops there.
+
+    Parameters:
+        args: arguments of main
+        trading_days: (start, end) date times of the trading days
+        run_day: function running one trading day, run_day(args, start, end, portfolio, backtest) -> Backtest
+        workers: number of processes
+
+    Returns the portfolio at the end of the last day
+    '''
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # the binary cache of the market data is written once here, the workers only read it
+        expiry_days = list(executor.map(_is_expiry_day, [args.underlying]*len(trading_days), [start for start, _ in trading_days]))
+        segments = plan_segments(trading_days, expiry_days)
+        logger.info(f'{len(trading_days)} trading days split into {len(segments)} segments on {workers} processes')
+
+        work_dir = tempfile.mkdtemp(prefix='runner_')
+        try:
+            tasks = [{'run_day': run_day,
+                      'args': args,
+                      'days': segment,
+                      'warm_up_day': segments[i - 1][-1] if i > 0 else None,
+                      'initial_cash': args.initial_cash if i == 0 else 0,
+                      'output_dir': os.path.join(work_dir, f'segment_{i}')} for i, segment in enumerate(segments)]
+
+            portfolio, backtest, cash_offset, realized_pnl_offset = None, None, 0.0, 0.0
+            for i, result in enumerate(executor.map(run_segment, tasks)):
+                rerun = False
+                if i > 0:
+                    book, warm_up_cash, warm_up_realized_pnl = result['handoff']
+                    if is_same_book(book, get_book(portfolio)):
+                        cash_offset = portfolio.getCash() - warm_up_cash
+                        realized_pnl_offset = portfolio.getRealizedPnL() - warm_up_realized_pnl
+                    else:
+                        logger.warning(f'book handed off to segment {i} differs from the previous segment, running it again sequentially')
+                        rerun = True
+
+                if not rerun and _stops_in_segment(result, cash_offset, backtest):
+                    # the run stops within the segment: the stop step, the book and the fills up to it are the ones of a
+                    # sequential run continued from the previous segment
+                    logger.warning(f'max drawdown beyond the limit within segment {i}, running it again sequentially')
+                    rerun = True
+
+                if rerun:
+                    if i == 0:
+                        portfolio = Portfolio(initial_cash=tasks[i]['initial_cash'])
+                    result = {'handoff': None,
+                              'records': _run_days(run_day, args, tasks[i]['days'], portfolio, tasks[i]['output_dir'] + '_rerun',
+                                                   backtest=copy.deepcopy(backtest)),
+                              'portfolio': portfolio,
+                              'output_dir': tasks[i]['output_dir'] + '_rerun'}
+                    cash_offset, realized_pnl_offset = 0.0, 0.0
+
+                backtest = _merge_segment(result, cash_offset, backtest)
+                portfolio = result['portfolio']
+                if cash_offset != 0:
+                    portfolio._update_cash_slot(cash_offset)
+                # the worker's realized pnl starts with the warm-up day's and misses the previous segments'
+                portfolio._total_realized_pnl += realized_pnl_offset
+
+                if backtest is not None and backtest.should_stop():
+                    logger.warning(f'run stopped early after segment {i}, max drawdown beyond the limit')
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    break
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    return portfolio
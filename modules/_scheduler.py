@@ -0,0 +1,120 @@
+"""
+    Event calendar of a trading day, the time steps where the strategy has something to do
+"""
+
+import numpy as np
+import pandas as pd
+
+from modules._logger import logger
+
+logger = logger.getLogger('scheduler')
+
+# actions of an event, combined as a bit mask
+ACTION_UNWIND = 1
+ACTION_TRADE = 2
+ACTION_HEDGE = 4
+
+EVENT_DTYPE = [('Timestamp', 'datetime64[ns]'), ('Step', 'i8'), ('Action', 'i1')]
+
+
+def postpone_actions(actions:np.ndarray, action:int, from_step:int) -> np.ndarray:
+    '''
+    Returns a copy of the actions (bit mask of every time step) with the given action of from_step and of the later
+    steps moved one time step later, the ones moved past the last step are dropped
+    '''
+    actions = np.array(actions, dtype=np.int8)
+    for bit in (ACTION_UNWIND, ACTION_TRADE, ACTION_HEDGE):
+        if action & bit:
+            moved = np.flatnonzero(actions[from_step:] & bit) + from_step
+            actions[moved] &= ~np.int8(bit)
+            moved = moved[moved + 1 < len(actions)] + 1
+            actions[moved] |= bit
+    return actions
+
+
+class EventCalendar():
+    """
+    Class Description
+    ------------------
+    Sorted calendar of the events (timestamp, time step, actions) of a time window.
+    The actions of a step are a bit mask of ACTION_UNWIND, ACTION_TRADE and ACTION_HEDGE, executed in that order.
+    Actions of the events still to come can be cancelled while iterating (e.g. once the unwind took place) or postponed
+    (a time step which raises delays the actions it did not reach, as the per step counters of the Strategy do).
+
+    Parameters
+    ----------
+    time_window : time steps of the run
+    actions : dictionary of action -> steps (positions in the time window) where it takes place
+
+    Methods
+    -------
+
+    cancel(action, after_step) : Removes the action from the events after the given step
+
+    postpone(action, step) : Moves the action of the event being run and of the events still to come one time step later
+
+    getEvents() : Returns the pending events as a structured array (Timestamp, Step, Action)
+    """
+    def __init__(self, time_window, actions:dict):
+        self._time_window = time_window
+        mask = np.zeros(len(self._time_window), dtype=np.int8)
+        for action, steps in actions.items():
+            steps = np.asarray(steps, dtype=np.int64)
+            mask[steps[(steps >= 0) & (steps < len(mask))]] |= action
+
+        steps = np.flatnonzero(mask)
+        self._events = self._make_events(steps, mask[steps])
+        self._cursor = 0
+
+    def _make_events(self, steps:np.ndarray, actions:np.ndarray) -> np.ndarray:
+        events = np.zeros(len(steps), dtype=EVENT_DTYPE)
+        events['Timestamp'] = pd.DatetimeIndex(self._time_window).values[steps]
+        events['Step'] = steps
+        events['Action'] = actions
+        return events
+
+    def __len__(self):
+        return int(np.count_nonzero(self._events['Action'][self._cursor:]))
+
+    def __iter__(self):
+        '''
+        Yields (step, timestamp, actions) of every pending event in time order
+        '''
+        while self._cursor < len(self._events):
+            event = self._events[self._cursor]
+            self._cursor += 1
+            if event['Action'] != 0:
+                yield int(event['Step']), self._time_window[int(event['Step'])], int(event['Action'])
+
+    def cancel(self, action:int, after_step:int=-1) -> None:
+        '''
+        Removes the action from the events after the given step
+        '''
+        later = self._events['Step'] > after_step
+        self._events['Action'][later] &= ~np.int8(action)
+        logger.debug(f'action {action} cancelled after step {after_step}, {len(self)} events pending')
+
+    def postpone(self, action:int, step:int) -> None:
+        '''
+        Moves the action of the event being run at the given step and of the events still to come one time step later
+        '''
+        actions = np.zeros(len(self._time_window), dtype=np.int8)
+        pending = self._events[self._cursor:]
+        actions[pending['Step']] = pending['Action']
+        if self._cursor > 0 and self._events['Step'][self._cursor - 1] == step:
+            actions[step] = self._events['Action'][self._cursor - 1] & action
+        actions = postpone_actions(actions, action, from_step=step)
+        actions[:step + 1] = 0
+        steps = np.flatnonzero(actions)
+        self._events = np.concatenate([self._events[:self._cursor], self._make_events(steps, actions[steps])])
+        logger.debug(f'action {action} postponed from step {step}, {len(self)} events pending')
+
+    def getEvents(self) -> np.ndarray:
+        pending = self._events[self._cursor:]
+        return pending[pending['Action'] != 0]
+
+    def getTimeWindow(self):
+        return self._time_window
+
+    def __repr__(self):
+        return f'EventCalendar({len(self)} events over {len(self._time_window)} steps)'
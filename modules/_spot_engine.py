@@ -0,0 +1,89 @@
+import numpy as np
+
+from modules._logger import logger
+
+logger = logger.getLogger('spot_engine')
+
+
+class SyntheticSpot():
+    """
+    Class Description
+    ------------------
+    Synthetic spot computed with put call parity for every timestamp of the loaded data
+    in one vectorized pass. For each timestamp, across all the (expiry, strike) pairs
+    where both the call and the put are quoted
+
+        spot bid = strike + (bid call - ask put)
+        spot ask = strike + (ask call - bid put)
+        spot     = (highest spot bid + lowest spot ask)/2
+
+    Parameters
+    ----------
+    time_idx : timestamp position of every row
+    n_times : number of timestamps
+    expiry, is_call, strike, bid, ask : row arrays of the option chain sorted by (timestamp, expiry, type, strike)
+
+    Methods
+    -------
+
+    get_bid(idx), get_ask(idx), get_mid(idx) : Returns spot bid, ask and mid at timestamp position idx
+
+    from_arrays(bid, ask, mid) : Builds the spot back from already computed arrays
+    """
+    def __init__(self, time_idx: np.ndarray, n_times: int, expiry: np.ndarray, is_call: np.ndarray,
+                 strike: np.ndarray, bid: np.ndarray, ask: np.ndarray):
+
+        self._bid = np.full(n_times, np.nan)
+        self._ask = np.full(n_times, np.nan)
+
+        if len(time_idx) > 0:
+            # integer key of (timestamp, expiry, strike), increasing for calls and puts separately
+            _, expiry_code = np.unique(expiry, return_inverse=True)
+            _, strike_code = np.unique(strike, return_inverse=True)
+            n_expiry, n_strike = expiry_code.max() + 1, strike_code.max() + 1
+            key = (time_idx.astype(np.int64) * n_expiry + expiry_code) * n_strike + strike_code
+
+            ce_rows, pe_rows = np.flatnonzero(is_call), np.flatnonzero(~is_call)
+            _, ce, pe = np.intersect1d(key[ce_rows], key[pe_rows], assume_unique=True, return_indices=True)
+            ce, pe = ce_rows[ce], pe_rows[pe]
+
+            if len(ce) > 0:
+                spot_bid = strike[ce] + bid[ce] - ask[pe]
+                spot_ask = strike[ce] + ask[ce] - bid[pe]
+
+                # pairs are ordered by timestamp, reduce every timestamp group
+                pair_time = time_idx[ce]
+                starts = np.flatnonzero(np.r_[True, pair_time[1:] != pair_time[:-1]])
+                self._bid[pair_time[starts]] = np.maximum.reduceat(spot_bid, starts)
+                self._ask[pair_time[starts]] = np.minimum.reduceat(spot_ask, starts)
+
+        self._mid = (self._bid + self._ask) / 2
+
+        logger.info(f'synthetic spot computed for {np.count_nonzero(~np.isnan(self._mid))} of {n_times} timestamps')
+
+    @classmethod
+    def from_arrays(cls, bid: np.ndarray, ask: np.ndarray, mid: np.ndarray) -> 'SyntheticSpot':
+        '''
+        Builds the spot back from the arrays of getBid(), getAsk() and getMid() without copying them
+        '''
+        spot = cls.__new__(cls)
+        spot._bid, spot._ask, spot._mid = bid, ask, mid
+        return spot
+
+    def get_bid(self, idx: int) -> float:
+        return self._bid[idx] if idx >= 0 else np.nan
+
+    def get_ask(self, idx: int) -> float:
+        return self._ask[idx] if idx >= 0 else np.nan
+
+    def get_mid(self, idx: int) -> float:
+        return self._mid[idx] if idx >= 0 else np.nan
+
+    def getBid(self) -> np.ndarray:
+        return self._bid
+
+    def getAsk(self) -> np.ndarray:
+        return self._ask
+
+    def getMid(self) -> np.ndarray:
+        return self._mid
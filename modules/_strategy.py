@@ -1,13 +1,15 @@
 import numpy as np
+import pandas as pd
 from datetime import datetime
 import copy
 import os,sys
-from modules._instrument import Instrument,get_atm_options,get_otm_options
+from modules._instrument import Instrument,get_condor_options
 from modules._instrument import Options
 from modules._trade import Trade
 from modules._portfolio import Portfolio
 from modules._historical_data import HistoricalData
 from modules._instrument import get_synthetic_futures
+from modules._scheduler import EventCalendar, ACTION_UNWIND, ACTION_TRADE, ACTION_HEDGE
 from .global_variables import params
 # from modules._utils import get_hft_logger
 # from modules._logger import get_hft_logger
@@ -188,6 +190,51 @@ class Strategy():
         return take_hedge
 
 
+    def unwind_pending(self) -> bool:
+        '''
+        Returns True while the unwind may still have to take place today
+        '''
+        return (not self._unwind_taken_place) and self._unwind_day
+
+
+    def build_event_calendar(self, time_window, expiry_times=None, expiry_buffer:int=45) -> EventCalendar:
+        '''
+        Returns the event calendar of the time window, the steps where is_trading_time, is_hedging_time
+        and is_unwind_time would be True on a strategy which has not been polled yet.
+
+        Parameters:
+        time_window: time steps of the run
+        expiry_times: expiry date times of the options which can be held during the run (market data and portfolio),
+                      the unwind is only looked for within expiry_buffer minutes of the nearest one. None to look for it
+                      during the whole unwind window.
+        expiry_buffer: minutes before the expiry an option is unwound (see Portfolio.get_unwind_list)
+        '''
+        times = pd.DatetimeIndex(time_window)
+        n_steps = len(times)
+
+        # trade at the first step and then every trade interval
+        actions = {ACTION_TRADE: np.arange(0, n_steps, self._trade_interval)}
+
+        # the first hedge is one hedge interval after the first trade
+        if params['DELTA_HEDGE']:
+            actions[ACTION_HEDGE] = np.arange(self._hedge_interval, n_steps, self._hedge_interval)
+
+        if self.unwind_pending():
+            trading_end_time = times.normalize() + pd.Timedelta(params['TRADING_END_TIME'])
+            is_unwind = (trading_end_time - times) < pd.Timedelta(minutes=params['UNWIND_TIME'])
+            if expiry_times is not None:
+                expiry_times = np.asarray(expiry_times, dtype='datetime64[ns]')
+                if len(expiry_times) > 0:
+                    is_unwind &= (expiry_times.min() - times.values) < np.timedelta64(expiry_buffer, 'm')
+                else:
+                    is_unwind[:] = False
+            actions[ACTION_UNWIND] = np.flatnonzero(is_unwind)
+
+        calendar = EventCalendar(time_window=time_window, actions=actions)
+        logger.info(f'{calendar} built with trade interval={self._trade_interval}, hedge interval={self._hedge_interval}')
+        return calendar
+
+
     def unwind_to_reduce_txn_cost(self, qtime, portfolio, mkt_data:HistoricalData):
         '''
         EIS unwind logic: TODO: tobe implemented
@@ -281,13 +328,15 @@ class Strategy():
                             obj_opt:Options, 
                             trade_time:datetime,
                             trade_qty:float,
-                            mkt_data_slice:HistoricalData)->Trade:
+                            mkt_data_slice:HistoricalData,
+                            quote:np.ndarray=None)->Trade:
         '''
         Parameters:
             obj_opt: Option object, 
             instru_name: intrument name , 
             trade_time: trading time,
             trade_type: trade type (sell/buy)
+            quote: bid price, bid qty, ask price, ask qty of the option at trade_time if already known
         '''
         # TODO: need to change the logic here to cater the requirement for changing the 
         #       strategy to be market maker at trade time and non-market maker during hedge.
@@ -300,9 +349,12 @@ class Strategy():
         trade = None
         if trade_qty < 0:
             # TODO: we can call get_quote_by_id() instead of get_quote()
-            askprice, _ = obj_opt.get_quote(trade_time, 
-                                            q_type='ask',
-                                            mkt_data=mkt_data_slice)
+            if quote is not None:
+                askprice = quote[2]
+            else:
+                askprice, _ = obj_opt.get_quote(trade_time, 
+                                                q_type='ask',
+                                                mkt_data=mkt_data_slice)
 
             trade = Trade(instr_id=obj_opt.getId(),
                           trade_price=askprice,
@@ -314,9 +366,12 @@ class Strategy():
 
         elif trade_qty > 0:
             # TODO: we can call get_quote_by_id() instead of get_quote()
-            bidprice, _ = obj_opt.get_quote(trade_time,
-                                            q_type='bid',
-                                            mkt_data=mkt_data_slice)
+            if quote is not None:
+                bidprice = quote[0]
+            else:
+                bidprice, _ = obj_opt.get_quote(trade_time,
+                                                q_type='bid',
+                                                mkt_data=mkt_data_slice)
 
             # TODO: do we need to check the expiration also?
             trade = Trade(instr_id=obj_opt.getId(),
@@ -375,39 +430,29 @@ class Strategy():
             expiry = mkt_data.get_slice_expiry() #
             #  use a single expiry
             try:
-                atm_call, atm_put = get_atm_options(t=trade_time, 
-                                                        underlying=self._underlying_instrument,
-                                                        expiry=expiry,
-                                                        mkt_data=mkt_data)
+                # the four legs and their quotes in one pass
+                (atm_call, atm_put, otm_call, otm_put), quotes = get_condor_options(t=trade_time,
+                                                                                    underlying=self._underlying_instrument,
+                                                                                    expiry=expiry,
+                                                                                    pct=self._percentage_otm,
+                                                                                    mkt_data=mkt_data)
             except Exception as ex:
                 # if no options found then continue
                 logger.critical(f'{ex} at {get_exception_line_no()} with # {expiry}, {self._underlying_instrument}, {trade_time}')
                 raise ex
 
-            try:
-                otm_call, otm_put = get_otm_options(t=trade_time, 
-                                                        atm_strike=atm_call.getStrike(),
-                                                        underlying=self._underlying_instrument,
-                                                        expiry=expiry,
-                                                        pct=self._percentage_otm,
-                                                        mkt_data=mkt_data)
-            except Exception as ex:
-                # if no options found then continue
-                logger.warning(f'{ex} at {get_exception_line_no()} with # {expiry}, {self._underlying_instrument}, {trade_time}')
-                raise ex
-
             # creating an atm call sell trade
-            trade_list.append(self.create_option_trade(atm_call,trade_time,-(self._unit_size),mkt_data_slice=mkt_data))
+            trade_list.append(self.create_option_trade(atm_call,trade_time,-(self._unit_size),mkt_data_slice=mkt_data,quote=quotes[0]))
             logger.info(f'{trade_time}# creating atm call sell with id={atm_call.getId()} expiry={atm_call.getExpiry()} strike={atm_call.getStrike()}')
 
             # creating an atm put sell trade
-            trade_list.append(self.create_option_trade(atm_put,trade_time,-(self._unit_size),mkt_data_slice=mkt_data))
+            trade_list.append(self.create_option_trade(atm_put,trade_time,-(self._unit_size),mkt_data_slice=mkt_data,quote=quotes[1]))
             logger.info(f'{trade_time}# creating atm put sell with id={atm_put.getId()} expiry={atm_put.getExpiry()}')
 
-            trade_list.append(self.create_option_trade(otm_call,trade_time,self._unit_size,mkt_data_slice=mkt_data))
+            trade_list.append(self.create_option_trade(otm_call,trade_time,self._unit_size,mkt_data_slice=mkt_data,quote=quotes[2]))
             logger.info(f'{trade_time}# creating otm call buy with id={otm_call.getId()} expiry={otm_call.getExpiry()}')
 
-            trade_list.append(self.create_option_trade(otm_put,trade_time,self._unit_size,mkt_data_slice=mkt_data))
+            trade_list.append(self.create_option_trade(otm_put,trade_time,self._unit_size,mkt_data_slice=mkt_data,quote=quotes[3]))
             logger.info(f'{trade_time}# creating otm put buy with id={otm_put.getId()} expiry={otm_put.getExpiry()}')
                 
             return trade_list
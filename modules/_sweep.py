@@ -0,0 +1,264 @@
+"""
+    Parameter sweep engine, runs many strategy configurations over the same trading days on a process pool.
+    The market data of a day, its chain stores and its greeks are built once and shared with the workers through shared memory.
+"""
+
+import gc
+import shutil
+import argparse
+import tempfile
+import itertools
+import os
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+from modules._portfolio import Portfolio
+from modules._historical_data import HistoricalData
+from modules._chain_store import ChainStore
+from modules._greeks import GreeksEngine
+from modules._market_cache import to_shared_memory, from_shared_memory, arrays_to_shared_memory, arrays_from_shared_memory
+from modules._runner import redirect_outputs
+from modules.global_variables import params
+from modules._logger import logger,get_exception_line_no
+from visualizer.cc_financial_statistics import financial_metrics
+
+logger = logger.getLogger('sweep')
+
+# arguments of main which can be swept, they make the param_list of the Strategy
+SWEEP_PARAMS = ('otm_percentage', 'trade_interval', 'hedge_interval', 'unwind_time', 'unit_size')
+
+# market data of the day the worker is attached to
+_worker_day = dict()
+
+
+def get_configurations(grid:dict) -> list:
+    '''
+    Returns every combination of the grid (parameter name -> list of values) as a list of dictionaries,
+    in a deterministic order
+    '''
+    unknown = set(grid) - set(SWEEP_PARAMS)
+    if unknown:
+        raise ValueError(f'{unknown} can not be swept, should be among {SWEEP_PARAMS}')
+    names = [name for name in SWEEP_PARAMS if name in grid]
+    return [dict(zip(names, values)) for values in itertools.product(*[list(grid[name]) for name in names])]
+
+
+def _release_worker_day() -> None:
+    hist_data, blocks = _worker_day.pop('hist_data', None), _worker_day.pop('blocks', [])
+    del hist_data
+    # the views of the blocks must be gone before closing them
+    gc.collect()
+    for block in blocks:
+        try:
+            block.close()
+        except BufferError as e:
+            logger.warning(f'shared memory block {block.name} still in use, error : {e}')
+    _worker_day.clear()
+
+
+def _share_day(hist_data:HistoricalData, expiry_types:list) -> tuple:
+    '''
+    Copies the loaded day into shared memory: all its data and, for every expiry type, the data of the view,
+    the arrays of its chain store and its precomputed greeks.
+    Returns (meta, blocks), the blocks must be closed and unlinked once the workers are done with the day
+    '''
+    meta, blocks = {'views': dict()}, list()
+    try:
+        meta['data'], shared = to_shared_memory(hist_data._all_data)
+        blocks += shared
+        for expiry_type in expiry_types:
+            hist_data.switch_expiry_type(expiry_type)
+        for expiry_type, (data, chain, greeks) in hist_data.getExpiryViews().items():
+            view = dict()
+            # the view of every expiry is all the data, not copied twice
+            view['data'], shared = (None, []) if data is hist_data._all_data else to_shared_memory(data)
+            blocks += shared
+            view['chain'], shared = arrays_to_shared_memory(chain.to_arrays())
+            blocks += shared
+            view['greeks'], shared = arrays_to_shared_memory(greeks.getPrecomputed())
+            blocks += shared
+            meta['views'][expiry_type] = view
+    except Exception:
+        for block in blocks:
+            block.close()
+            block.unlink()
+        raise
+    return meta, blocks
+
+
+def _attach_day(meta:dict) -> tuple:
+    '''
+    Attaches (zero-copy) to a day shared by _share_day().
+    Returns (data, expiry views, blocks) where expiry views is expiry type -> (data, chain store, greeks engine)
+    '''
+    all_data, blocks = from_shared_memory(meta['data'])
+    expiry_views = dict()
+    for expiry_type, view in meta['views'].items():
+        data = all_data
+        if view['data'] is not None:
+            data, shared = from_shared_memory(view['data'])
+            blocks += shared
+        chain_arrays, shared = arrays_from_shared_memory(view['chain'])
+        blocks += shared
+        greeks_arrays, shared = arrays_from_shared_memory(view['greeks'])
+        blocks += shared
+
+        chain = ChainStore.from_arrays(chain_arrays)
+        greeks = GreeksEngine(chain)
+        greeks.load_precomputed(greeks_arrays)
+        expiry_views[expiry_type] = (data, chain, greeks)
+    return all_data, expiry_views, blocks
+
+
+def _get_market_data(args, day:dict) -> HistoricalData:
+    '''
+    Returns the market data of the day in a worker, attached (zero-copy) to the shared memory of the
+    day the first time and reused by the next configurations. The chain stores and the greeks of the
+    shared expiry views are not built again, an expiry view which was not shared is built on first use.
+    '''
+    if _worker_day.get('name') != day['name']:
+        _release_worker_day()
+        data, expiry_views, blocks = _attach_day(day['meta'])
+        hist_data = HistoricalData(source=args.data_source,
+                                   name=args.data_name,
+                                   underlying_instrument=args.underlying,
+                                   start_date=day['start'].strftime('%Y%m%d'),
+                                   end_date=day['end'].strftime('%Y%m%d'),
+                                   expiry_type=args.expiry_type)
+        hist_data.load_market_data(data=data, source_files=day['source_files'], expiry_views=expiry_views)
+        _worker_day.update(name=day['name'], hist_data=hist_data, blocks=blocks)
+
+    hist_data = _worker_day['hist_data']
+    # a previous configuration may have switched the expiry (unwind)
+    hist_data.switch_expiry_type(args.expiry_type)
+    return hist_data
+
+
+def run_configuration_day(task:dict) -> dict:
+    '''
+    Runs one configuration over one trading day in a worker process, continuing its portfolio
+    and its backtest statistics. Returns the updated portfolio and the Backtest of the day.
+
+    Parameters:
+        task: run_day, args (of the configuration), day, portfolio, backtest, output_dir
+    '''
+    try:
+        day = task['day']
+        hist_data = _get_market_data(task['args'], day)
+        with redirect_outputs(task['output_dir']):
+            backtest = task['run_day'](task['args'], day['start'], day['end'], portfolio=task['portfolio'],
+                                       backtest=task['backtest'], hist_data=hist_data)
+    except Exception as ex:
+        logger.critical(f"exception while running {task['day']['start']} at line={get_exception_line_no()}. {ex}")
+        backtest = None
+
+    return {'portfolio': task['portfolio'], 'backtest': backtest}
+
+
+def run_sweep(args, trading_days:list, run_day, grid:dict, workers:int=os.cpu_count()) -> pd.DataFrame:
+    '''
+    Runs every configuration of the grid over the trading days and returns the summary metrics per configuration.
+
+    The days are run one after the other. The market data of a day is loaded (and preprocessed) once in this
+    process, its chain stores and greeks are built, all of them are copied into shared memory and the
+    configurations of the day are fanned out to the workers, which attach to them without copying.
+    The view of the next expiry, used after the unwind, is only shared on the expiry days. The portfolio and the backtest of every configuration are carried
+    from one day to the next. As in main, a configuration is not run on the days after its max drawdown went
+    beyond params['BCKTST_STOP_DRAWDOWN'], its equity curve ends on the day it stopped.
+
+    Parameters:
+        args: arguments of main, the swept parameters are overridden per configuration
+        trading_days: (start, end) date times of the trading days
+        run_day: function running one trading day, run_day(args, start, end, portfolio, backtest, hist_data) -> Backtest
+        grid: parameter name (see SWEEP_PARAMS) -> list of values
+        workers: number of processes
+
+    Returns a DataFrame with one row per configuration: the parameters, the live statistics of the run
+    (OnlineMetrics), the final value and the metrics of the end of day values (financial_metrics)
+    '''
+    configurations = get_configurations(grid)
+    config_args = [argparse.Namespace(**{**vars(args), **config}) for config in configurations]
+    portfolios = [Portfolio(initial_cash=args.initial_cash) for _ in configurations]
+    backtests = [None] * len(configurations)
+    # a configuration whose max drawdown went beyond the limit is not run on the next days, as in main
+    stopped = [False] * len(configurations)
+    end_of_day_values, dates = list(), list()
+    logger.info(f'sweeping {len(configurations)} configurations over {len(trading_days)} trading days on {workers} processes')
+
+    work_dir = tempfile.mkdtemp(prefix='sweep_')
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for start, end in trading_days:
+                active = [i for i in range(len(configurations)) if not stopped[i]]
+                if len(active) == 0:
+                    logger.warning(f'every configuration stopped before {start.strftime("%Y-%m-%d")}, max drawdown beyond the limit')
+                    break
+                try:
+                    hist_data = HistoricalData(source=args.data_source,
+                                               name=args.data_name,
+                                               underlying_instrument=args.underlying,
+                                               start_date=start.strftime('%Y%m%d'),
+                                               end_date=end.strftime('%Y%m%d'),
+                                               expiry_type=args.expiry_type)
+                    hist_data.load_market_data()
+                except Exception as ex:
+                    logger.critical(f"error while loading market data of {start} at line={get_exception_line_no()}. {ex}")
+                    continue
+
+                # the view of the next expiry is only needed after the unwind of an expiry day
+                expiry_types = [args.expiry_type]
+                expiry_dates = pd.DatetimeIndex(hist_data.get_expiry_times()).normalize()
+                if (expiry_dates == pd.Timestamp(start).normalize()).any():
+                    expiry_types.append('second_weekly')
+                try:
+                    meta, blocks = _share_day(hist_data, expiry_types)
+                except Exception as ex:
+                    logger.critical(f"error while sharing market data of {start} at line={get_exception_line_no()}. {ex}")
+                    continue
+                try:
+                    day = {'name': start.isoformat(), 'meta': meta, 'start': start, 'end': end,
+                           'source_files': hist_data._source_files}
+                    tasks = [{'run_day': run_day,
+                              'args': config_args[i],
+                              'day': day,
+                              'portfolio': portfolios[i],
+                              'backtest': backtests[i],
+                              'output_dir': os.path.join(work_dir, f'configuration_{i}')} for i in active]
+
+                    for i, result in zip(active, executor.map(run_configuration_day, tasks)):
+                        portfolios[i] = result['portfolio']
+                        backtests[i] = result['backtest'] or backtests[i]
+                finally:
+                    del hist_data
+                    for block in blocks:
+                        block.close()
+                        block.unlink()
+
+                # the equity curve of a stopped configuration ends on the day it stopped
+                end_of_day_values.append([portfolio.get_portfolio_value() if i in active else np.nan for i, portfolio in enumerate(portfolios)])
+                dates.append(start)
+                for i in active:
+                    if backtests[i] is not None and backtests[i].should_stop():
+                        logger.warning(f'configuration {configurations[i]} stopped on {start.strftime("%Y-%m-%d")}, max drawdown beyond the limit')
+                        stopped[i] = True
+                logger.info(f'{len(configurations)} configurations run on {start.strftime("%Y-%m-%d")}')
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    results = pd.DataFrame(configurations)
+    statistics = pd.DataFrame([backtest.getOnlineMetrics().to_dict() if backtest is not None else {} for backtest in backtests])
+    results = pd.concat([results, statistics], axis=1)
+    results['FinalValue'] = [portfolio.get_portfolio_value() for portfolio in portfolios]
+
+    if len(dates) > 0:
+        # one equity curve (end of day values) per configuration
+        values = np.array(end_of_day_values, dtype=np.float64)
+        # no returns after the stop of a configuration
+        returns = np.full(values.shape, np.nan)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            returns[1:] = values[1:] / pd.DataFrame(values).ffill().to_numpy()[:-1] - 1
+        metrics = financial_metrics(pd.DataFrame(values), dates, frequency='D', risk_free_rate=params['RISK_FREE_RATE'], returns=returns)
+        results = pd.concat([results, metrics.drop(columns=['Start Date', 'End Date', 'Time Period']).reset_index(drop=True)], axis=1)
+
+    return results
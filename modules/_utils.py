@@ -1,3 +1,4 @@
+import numpy as np
 import pandas as pd
 from datetime import datetime
 import json
@@ -5,58 +6,65 @@ import json
 from modules.global_variables import params
 
 
+def _strip_categorical(col:pd.Series) -> pd.Series:
+    """
+        Converts a text column to categorical with stripped categories.
+        Stripping runs once per unique value instead of once per row.
+    """
+    col = col.astype(str).astype('category')
+    categories, codes = np.unique(col.cat.categories.str.strip(), return_inverse=True)
+    codes = np.append(codes, -1) # keeps missing values (code -1) missing
+    return pd.Series(pd.Categorical.from_codes(codes[col.cat.codes.to_numpy()], categories), index=col.index)
+
+
+def _parse_categorical_datetime(col:pd.Series, format:str=None) -> pd.DatetimeIndex:
+    """
+        Parses a categorical column as datetime, once per unique value.
+    """
+    return pd.to_datetime(col.cat.categories, format=format).take(col.cat.codes.to_numpy())
+
+
 def preprocess_eis_data(data:pd.DataFrame) -> pd.DataFrame:
     """
-        This method is specifically written for preprocessing EIS data
+        This method is specifically written for preprocessing EIS data.
+        Only vectorized operations are used, the text columns are handled as categoricals
+        so that stripping and datetime parsing happen once per unique value.
     """
 
     # drop column
-    data.drop(['UnixTimefrom 1-1-1980'], axis = 1, inplace = True)
+    data = data.drop(['UnixTimefrom 1-1-1980'], axis = 1)
     # convert object type to float type
     float_col_list = ['BidPrice','BidQty','AskPrice', 'AskQty', \
                'TTq','LTP','TotalTradedPrice','Strike']
     
     data[float_col_list] = data[float_col_list].astype('float64')
-    # data['ExchToken'] = data['ExchToken'].astype('str') 
     data['ExchToken'] = data['ExchToken'].astype('int64') # as per requirement
 
-    
-    #strip white spaces from every cell
-    data = data.apply(lambda x: x.str.strip() if type(x) == "<class 'str'>" else x)
-    
-    # strip the text columns
+    # strip the text columns, Type and Instrument stay categorical
     for col in data.columns:
         if data[col].dtype == "O":
-            data[col] = data[col].astype(str)
-            data[col] = data[col].apply(lambda x: x.strip())
-    
-    # create a new column ExpiryDateTime
-    data['ExpiryDate'] = pd.to_datetime(data['ExpiryDate'].str.strip(),format='%d-%m-%Y')
-    data['ExpiryDate'] = data['ExpiryDate'].dt.strftime('%Y-%m-%d')
-    data['ExpiryDateTime'] = data['ExpiryDate'] + ' ' + data['ExpiryTime']
+            data[col] = _strip_categorical(data[col])
 
     #drop rows where type = 'xx', strike = -1, bidprice > askprice, bidqty and askqty = 0
-    to_drop = data[(data['Type'] == 'XX') | (data['Strike'] == -0.01) | (data['BidPrice'] > data['AskPrice']) | (data['BidQty'] == 0.0)
-    | (data['AskQty'] == 0.0)].index.to_list()
+    to_drop = (data['Type'] == 'XX') | (data['Strike'] == -0.01) | (data['BidPrice'] > data['AskPrice']) | (data['BidQty'] == 0.0) \
+              | (data['AskQty'] == 0.0)
+    data = data.loc[~to_drop.to_numpy()]
 
-    data.drop(data.index[to_drop], inplace = True)
+    # create a new column ExpiryDateTime and convert Date Time, ExpiryDate and ExpiryDateTime to datetime
+    expiry_date = _parse_categorical_datetime(data['ExpiryDate'], format='%d-%m-%Y')
+    expiry_time = pd.to_timedelta(data['ExpiryTime'].cat.categories).take(data['ExpiryTime'].cat.codes.to_numpy())
+    date_time = _parse_categorical_datetime(data['Date Time'])
 
-    #set date time as index
-    data.set_index('Date Time', inplace = True)
+    data = data.drop(['Date Time'], axis = 1)
+    data['ExpiryDate'] = expiry_date
+    data['ExpiryTime'] = data['ExpiryTime'].astype(str)
+    data['ExpiryDateTime'] = expiry_date + expiry_time
 
-    # convert as datetime for specific colums such as Date Time, ExpiryDate, ExpiryTime, ExpiryDateTime
-    data.index = pd.to_datetime(data.index)
-    data['ExpiryDate'] = pd.to_datetime(data['ExpiryDate'])
-    data['ExpiryDateTime'] = data['ExpiryDateTime'].astype('str')
-    data['ExpiryDateTime'] = pd.to_datetime(data['ExpiryDateTime'])
+    #set date time as index
+    data.index = pd.DatetimeIndex(date_time, name='Date Time')
 
-    
     # divide the bid, ask price and strike by 100 since these are in paisa
-    data['BidPrice'] = data['BidPrice'].apply(lambda x:x/100)
-    data['AskPrice'] = data['AskPrice'].apply(lambda x:x/100)
-    data['Strike'] = data['Strike'].apply(lambda x:x/100)
-
-    # print(data.loc[data['ExchToken']==35023])
+    data[['BidPrice', 'AskPrice', 'Strike']] = data[['BidPrice', 'AskPrice', 'Strike']] / 100
 
     return data
 
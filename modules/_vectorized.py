@@ -0,0 +1,552 @@
+"""
+    Vectorized backtest of the condor strategy, an alternative to the event driven Algo for the parameter sweeps
+"""
+
+import time
+import weakref
+import numpy as np
+import pandas as pd
+from contextlib import contextmanager
+
+from modules._strategy import Strategy
+from modules._scheduler import ACTION_UNWIND, ACTION_TRADE, ACTION_HEDGE, postpone_actions
+from modules._backtest import Backtest
+from modules._blotter import Blotter
+from modules._portfolio import Portfolio
+from modules._instrument import get_option_from_instrument_id
+from ._historical_data import HistoricalData
+from .global_variables import params
+from modules._logger import logger,get_exception_line_no
+
+logger = logger.getLogger('vectorized')
+
+# one executed trade. Within a time step the fills are booked in the order of the actions (unwind, trade, hedge)
+# like in the event driven run, the Mark is the price the instrument is marked at right after the fill
+FILL_DTYPE = [('Step', 'i8'), ('Action', 'i1'), ('ExchToken', 'i8'), ('Position', 'f8'), ('Price', 'f8'), ('Mark', 'f8')]
+
+# HistoricalData -> market arrays of its expiry views, kept as long as the market data (see get_market_arrays)
+_market_arrays = weakref.WeakKeyDictionary()
+
+
+@contextmanager
+def _in_view(hist_data:HistoricalData, expiry_type:str):
+    '''
+    Switches the market data to the expiry view while in the context and back to the previous one
+    '''
+    previous = hist_data.getExpiryType()
+    if previous.lower() != expiry_type.lower():
+        hist_data.switch_expiry_type(expiry_type)
+    try:
+        yield hist_data
+    finally:
+        if hist_data.getExpiryType().lower() != previous.lower():
+            hist_data.switch_expiry_type(previous)
+
+
+def _make_fills(step, action:int, ids, positions, prices, marks) -> np.ndarray:
+    ids = np.asarray(ids, dtype=np.int64)
+    fills = np.zeros(len(ids), dtype=FILL_DTYPE)
+    fills['Step'], fills['Action'], fills['ExchToken'] = step, action, ids
+    fills['Position'], fills['Price'], fills['Mark'] = positions, prices, marks
+    return fills
+
+
+def _forward_fill(values:np.ndarray, first:np.ndarray) -> np.ndarray:
+    '''
+    Returns the rows of values where the nan entries are replaced by the last non nan entry above them (first if none)
+    '''
+    values = np.vstack([first[None, :], values])
+    rows = np.where(np.isnan(values), 0, np.arange(len(values))[:, None])
+    np.maximum.accumulate(rows, axis=0, out=rows)
+    return np.take_along_axis(values, rows, axis=0)[1:]
+
+
+def _net_delta(position:np.ndarray, delta_bid:np.ndarray, delta_ask:np.ndarray, steps, missing_delta) -> np.ndarray:
+    '''
+    Portfolio delta (see Portfolio.get_portfolio_delta) of positions of shape (time steps, instruments) at the time steps:
+    long positions on the bid delta and short positions on the ask delta. The deltas missing on the surface are
+    computed by missing_delta(step, column, q_type), see MarketArrays.get_missing_delta()
+    '''
+    delta = np.where(position > 0, delta_bid, delta_ask)
+    for row, column in zip(*np.nonzero((position != 0) & np.isnan(delta))):
+        delta[row, column] = missing_delta(int(steps[row]), column, 'bid' if position[row, column] > 0 else 'ask')
+    return np.where(position == 0, 0, delta*(-1)*position).sum(axis=-1)
+
+
+class MarketArrays():
+    """
+    Class Description
+    ------------------
+    Market data of one expiry view over the time steps of a day, in arrays indexed by time step:
+    the condor legs selected at every step and the quotes and deltas of a growing set of contracts (columns).
+    Built once per day and expiry view and shared by all the configurations run on the day, see get_market_arrays().
+
+    Parameters
+    ----------
+    hist_data : market data of the day
+    time_window : time steps of the day
+    underlying : underlying instrument
+    expiry_type : expiry view of the market data the arrays are built from
+
+    Methods
+    -------
+
+    get_legs(pct) : Returns the legs selected at every step (see HistoricalData.select_legs_over), cached per pct
+
+    get_columns(ids) : Returns the columns of the contracts in the quote and delta arrays, the missing contracts are added
+
+    get_missing_delta(step, id, q_type) : Returns the delta of a contract not on the greeks surface at a step, computed by the instrument
+
+    getBid(), getAsk(), getDeltaBid(), getDeltaAsk() : Arrays of shape (time steps, columns)
+    """
+    def __init__(self, hist_data:HistoricalData, time_window, underlying:str, expiry_type:str):
+        self._hist_data = hist_data
+        self._time_window = time_window
+        self._underlying = underlying
+        self._expiry_type = expiry_type
+        # pct -> (legs, atm selected, condor selected)
+        self._legs = dict()
+        # contract id -> column of the arrays
+        self._columns = dict()
+        self._bid = np.zeros((len(time_window), 0))
+        self._ask = np.zeros((len(time_window), 0))
+        self._delta_bid = np.zeros((len(time_window), 0))
+        self._delta_ask = np.zeros((len(time_window), 0))
+        # (step, id, q_type) -> delta computed by the instrument, see get_missing_delta()
+        self._missing_deltas = dict()
+
+    def get_legs(self, pct:float) -> tuple:
+        '''
+        Returns (legs, atm selected, condor selected) at every time step, see HistoricalData.select_legs_over()
+        '''
+        if pct not in self._legs:
+            with _in_view(self._hist_data, self._expiry_type):
+                self._legs[pct] = self._hist_data.select_legs_over(self._time_window, self._underlying, pct=pct)
+        return self._legs[pct]
+
+    def get_columns(self, ids) -> np.ndarray:
+        '''
+        Returns the columns of the contracts, the quotes and the bid and ask deltas of the contracts
+        not in the arrays yet are read over all the time steps and added
+        '''
+        ids = np.asarray(ids, dtype=np.int64)
+        missing = np.setdiff1d(ids, np.fromiter(self._columns, dtype=np.int64, count=len(self._columns)))
+        if len(missing) > 0:
+            try:
+                with _in_view(self._hist_data, self._expiry_type):
+                    quotes = self._hist_data.get_quotes_by_ids_over(self._time_window, missing)
+                    delta_bid = self._hist_data.get_greeks_by_ids_over(self._time_window, missing, q_type='bid')['delta']
+                    delta_ask = self._hist_data.get_greeks_by_ids_over(self._time_window, missing, q_type='ask')['delta']
+            except Exception as e:
+                logger.critical(f'Error in get_columns in line {get_exception_line_no()}, error : {e}')
+                raise e
+            self._columns.update(zip(missing.tolist(), range(len(self._columns), len(self._columns) + len(missing))))
+            self._bid = np.hstack([self._bid, quotes[:, :, 0]])
+            self._ask = np.hstack([self._ask, quotes[:, :, 2]])
+            self._delta_bid = np.hstack([self._delta_bid, delta_bid])
+            self._delta_ask = np.hstack([self._delta_ask, delta_ask])
+            logger.debug(f'{len(missing)} contracts added to the market arrays of {self._expiry_type}, {len(self._columns)} in total')
+        return np.array([self._columns[id] for id in ids.tolist()], dtype=np.int64)
+
+    def get_missing_delta(self, step:int, id:int, q_type:str) -> float:
+        '''
+        Returns the delta of a contract which is not on the greeks surface at the time step (e.g. not quoted), computed
+        by the instrument (Options.calculate_delta_by_id, priced on the nearest strike) as Portfolio.get_portfolio_delta
+        does, 0 if it can not be computed. Cached per (step, id, q_type).
+        '''
+        key = (step, int(id), q_type)
+        if key not in self._missing_deltas:
+            try:
+                with _in_view(self._hist_data, self._expiry_type):
+                    instrument = get_option_from_instrument_id(id=int(id), mkt_data=self._hist_data)
+                    self._missing_deltas[key] = instrument.calculate_delta_by_id(instrument_id=int(id), t=self._time_window[step],
+                                                                                 q_type=q_type, mkt_data=self._hist_data)
+            except Exception as e:
+                logger.critical(f'error while computing delta for instrument_id={id}. setting delta for this id to 0# {e}')
+                self._missing_deltas[key] = 0
+        return self._missing_deltas[key]
+
+    def getBid(self) -> np.ndarray:
+        return self._bid
+
+    def getAsk(self) -> np.ndarray:
+        return self._ask
+
+    def getDeltaBid(self) -> np.ndarray:
+        return self._delta_bid
+
+    def getDeltaAsk(self) -> np.ndarray:
+        return self._delta_ask
+
+    def getExpiryType(self) -> str:
+        return self._expiry_type
+
+    def __repr__(self):
+        return f'MarketArrays({self._expiry_type}, {len(self._time_window)} steps, {len(self._columns)} contracts)'
+
+
+def get_market_arrays(hist_data:HistoricalData, time_window, underlying:str, expiry_type:str=None) -> MarketArrays:
+    '''
+    Returns the market arrays of the expiry view (the current one if not given) over the time window,
+    built the first time and reused as long as the market data is alive (e.g. by the next configurations of a sweep)
+    '''
+    expiry_type = (expiry_type or hist_data.getExpiryType()).lower()
+    views = _market_arrays.setdefault(hist_data, dict())
+    key = (expiry_type, underlying, pd.Timestamp(time_window[0]), pd.Timestamp(time_window[-1]), len(time_window))
+    if key not in views:
+        views[key] = MarketArrays(hist_data, time_window, underlying, expiry_type)
+    return views[key]
+
+
+def _resolve_schedule(actions:np.ndarray, first_step:int, condor_selected:np.ndarray, unwind_failed=(), last_step:int=None) -> np.ndarray:
+    '''
+    Returns the actions of every time step once the time steps from first_step to last_step which raise are accounted
+    for, as Algo.driver does: a failed unwind delays the trade and the hedge, a condor which can not be selected delays
+    the hedge (see EventCalendar.postpone)
+    '''
+    last_step = len(actions) if last_step is None else last_step
+    step = first_step
+    while step < last_step:
+        failed_trades = np.flatnonzero(((actions[step:last_step] & ACTION_TRADE) > 0) & ~condor_selected[step:last_step])
+        failed_trade = step + int(failed_trades[0]) if len(failed_trades) > 0 else last_step
+        failed_unwind = min([unwind_step for unwind_step in unwind_failed if unwind_step >= step], default=last_step)
+        if failed_unwind < last_step and failed_unwind <= failed_trade:
+            actions, step = postpone_actions(actions, ACTION_TRADE | ACTION_HEDGE, failed_unwind), failed_unwind + 1
+        elif failed_trade < last_step:
+            actions, step = postpone_actions(actions, ACTION_HEDGE, failed_trade), failed_trade + 1
+        else:
+            break
+    return actions
+
+
+class VectorizedCondor():
+    """
+    Class Description
+    ------------------
+    Backtest of the condor strategy over a trading day computed on arrays, with the same schedule and the
+    same trades as the event driven run (Algo.driver) on the same data.
+
+    The legs of every time step, their quotes and deltas are precomputed (MarketArrays). The trades of the condor
+    do not depend on the book, their positions and cash flows are cumulative sums over the day. The hedge depends
+    on the delta of the book (rounded), it is the only loop, over the hedge steps, on vectors of the contracts.
+    The marks, the values, the net delta and the exposures of every time step are then computed on
+    (time steps x contracts) arrays. The day is split in two phases at the unwind of the expiry day,
+    the second one on the next expiry.
+
+    The fills are booked into the portfolio and the blotter at the end of the day, so the book carried to the
+    next day is the one of the event driven run (positions, average prices, realized pnl, cash).
+
+    Parameters
+    ----------
+    time_window : time steps of the day
+    underlying_instrument : underlying instrument
+    param_list : same as Strategy, [percentage of otm, trade interval, hedge interval, unwind time, unit_qty, is_mkt_maker]
+
+    Methods
+    -------
+
+    run(backtest, portfolio, hist_data, blotter) : Runs the day, records every time step in backtest and books the fills
+    """
+    def __init__(self, time_window, underlying_instrument:str, param_list=[5,5,2,45,1,1]):
+        self._time_window = time_window
+        self._underlying = underlying_instrument
+        self._param_list = param_list
+        self._percentage_otm = param_list[0]
+        self._unit_size = param_list[4]
+        self._txn_cost = params['TXN_COST'] if params['TXN_COST_FLAG'] else 0
+
+    def _simulate(self, arrays:MarketArrays, actions:np.ndarray, times:np.ndarray, first_step:int, book:tuple,
+                  expiries, can_unwind:bool, unwind_failed:tuple=()) -> dict:
+        '''
+        Runs the trades and hedges of one phase of the day (from first_step, on one expiry view) and,
+        if can_unwind, looks for the unwind at the unwind steps, the phase ends at the unwind.
+
+        Parameters:
+            arrays: market arrays of the expiry view of the phase
+            actions: actions (bit mask) of every time step, see Strategy.build_event_calendar()
+            times: time steps (datetime64[ns])
+            first_step: first time step of the phase
+            book: (ids, positions, marks, expiries) of the instruments held at the start of the phase
+            expiries: contract registry of the market data, for the expiries of the contracts
+            can_unwind: True to look for the unwind
+            unwind_failed: time steps where the unwind is known to raise
+
+        Returns a dictionary with the contracts of the phase (ids), its quote and delta arrays, the positions at the end
+        of every time step, the fills, the failed time steps (not recorded), the unwind steps processed, the unwind step
+        and the actions of every time step up to the unwind (the ones the next phase starts from)
+        '''
+        n_steps = len(times)
+        steps = np.arange(n_steps)
+        legs, atm_selected, condor_selected = arrays.get_legs(self._percentage_otm)
+
+        # a time step where the legs can not be selected raises in the event driven run, its remaining actions are
+        # skipped and the ones it did not reach are delayed by one time step
+        schedule = _resolve_schedule(actions, first_step, condor_selected, unwind_failed)
+        is_trade = (steps >= first_step) & ((schedule & ACTION_TRADE) > 0)
+        is_hedge = (steps >= first_step) & ((schedule & ACTION_HEDGE) > 0)
+        failed = (is_trade & ~condor_selected) | (is_hedge & ~atm_selected)
+        failed[list(unwind_failed)] = True
+        traded = is_trade & condor_selected
+        hedged = is_hedge & ~failed
+        is_unwind = (steps >= first_step) & ((actions & ACTION_UNWIND) > 0) & can_unwind
+
+        # contracts which can be held during the phase, and their columns in the arrays
+        book_ids, book_position, book_marks, book_expiries = book
+        ids = np.unique(np.concatenate([book_ids, legs['ExchToken'][traded].ravel(), legs['ExchToken'][hedged, :2].ravel()]))
+        columns = arrays.get_columns(ids)
+        bid, ask = arrays.getBid()[:, columns], arrays.getAsk()[:, columns]
+        delta_bid, delta_ask = arrays.getDeltaBid()[:, columns], arrays.getDeltaAsk()[:, columns]
+        missing_delta = lambda step, column, q_type: arrays.get_missing_delta(step, ids[column], q_type)
+
+        initial_position, initial_marks = np.zeros(len(ids)), np.full(len(ids), np.nan)
+        book_columns = np.searchsorted(ids, book_ids)
+        initial_position[book_columns], initial_marks[book_columns] = book_position, book_marks
+        registry_idx = expiries.indices_of(ids)
+        expiry = np.where(registry_idx >= 0, expiries.getExpiries()[np.maximum(registry_idx, 0)], np.datetime64('NaT'))
+        expiry[book_columns] = book_expiries
+
+        # the condor: sell the ATM call and put at the ask, buy the OTM call and put at the bid
+        trade_steps = np.flatnonzero(traded)
+        leg_columns = np.searchsorted(ids, legs['ExchToken'][trade_steps])
+        leg_position = np.array([-1, -1, 1, 1]) * self._unit_size
+        trades = np.zeros((n_steps, len(ids)))
+        np.add.at(trades, (np.repeat(trade_steps, 4), leg_columns.ravel()), np.tile(leg_position, len(trade_steps)))
+        condor_position = initial_position + np.cumsum(trades, axis=0)
+
+        # time step an instrument is first held at (it is in the portfolio from then on)
+        first_held = np.full(len(ids), n_steps)
+        first_held[book_columns] = -1
+        np.minimum.at(first_held, leg_columns.ravel(), np.repeat(trade_steps, 4))
+
+        hedge = np.zeros(len(ids))
+        hedge_fills, unwind_fills = list(), None
+        unwind_step, pending = None, True
+        checked = np.zeros(n_steps, dtype=bool)
+        unwind_time = pd.Timedelta(minutes=params['UNWIND_TIME']).to_timedelta64()
+        for step in np.flatnonzero(hedged | is_unwind).tolist():
+            if is_unwind[step] and pending:
+                checked[step] = True
+                position = condor_position[step] - trades[step] + hedge
+                expiring = (first_held < step) & ((expiry - times[step]) < unwind_time)
+                if not expiring.any():
+                    # nothing expires today, no more unwind
+                    pending = False
+                elif not (expiring & (position != 0)).any():
+                    # the event driven unwind raises on the empty expiry list, the time step is skipped and retried at the
+                    # next one, the trades and hedges from this step on are delayed: the phase is run again from the start
+                    if step not in unwind_failed:
+                        return self._simulate(arrays, actions, times, first_step, book, expiries, can_unwind,
+                                              unwind_failed=unwind_failed + (step,))
+                    continue
+                else:
+                    expiring &= position != 0
+                    quoted = expiring & ~np.isnan(bid[step])
+                    if quoted.any():
+                        unwind_fills = _make_fills(step, ACTION_UNWIND, ids[quoted], -position[quoted], ask[step, quoted],
+                                                   (bid[step, quoted] + ask[step, quoted])/2)
+                        unwind_step = step
+                        break
+                    logger.warning(f'{times[step]}# no quote to unwind {ids[expiring].tolist()}')
+                    # the unwind is retried as long as the nearest expiry is today
+                    pending = (expiry[expiring].min() - times[step]) // np.timedelta64(1, 'D') == 0
+
+            if hedged[step]:
+                delta = round(float(_net_delta((condor_position[step] + hedge)[None, :], delta_bid[step][None, :], delta_ask[step][None, :],
+                                               [step], missing_delta)[0]))
+                if delta != 0:
+                    # buy the ATM call and sell the ATM put for a positive delta
+                    hedge_columns = np.searchsorted(ids, legs['ExchToken'][step, :2])
+                    hedge_position = np.array([delta, -delta], dtype=np.float64)
+                    hedge_price = np.where(hedge_position > 0, legs['BidPrice'][step, :2], legs['AskPrice'][step, :2])
+                    hedge[hedge_columns] += hedge_position
+                    first_held[hedge_columns] = np.minimum(first_held[hedge_columns], step)
+                    hedge_fills.append(_make_fills(step, ACTION_HEDGE, ids[hedge_columns], hedge_position, hedge_price, hedge_price))
+
+        last_step = unwind_step if unwind_step is not None else n_steps
+        if unwind_step is not None:
+            schedule = _resolve_schedule(actions, first_step, condor_selected, unwind_failed, last_step=unwind_step)
+        trade_steps = np.flatnonzero(traded[:last_step])
+        leg_price = np.where(leg_position < 0, legs['AskPrice'][trade_steps], legs['BidPrice'][trade_steps]).ravel()
+        condor_fills = _make_fills(np.repeat(trade_steps, 4), ACTION_TRADE, legs['ExchToken'][trade_steps].ravel(),
+                                   np.tile(leg_position, len(trade_steps)), leg_price, leg_price)
+        fills = np.concatenate([condor_fills] + hedge_fills)
+        fills = fills[np.lexsort((fills['Action'], fills['Step']))]
+        if unwind_fills is not None:
+            # the unwind trades are in the order of the instruments in the portfolio: the ones carried over, then by first fill
+            slot_order = np.full(len(ids), len(fills))
+            slot_order[book_columns] = np.arange(len(book_columns)) - len(book_columns)
+            first_fill = np.unique(fills['ExchToken'], return_index=True)[1]
+            first_fill_columns = np.searchsorted(ids, fills['ExchToken'][first_fill])
+            slot_order[first_fill_columns] = np.minimum(slot_order[first_fill_columns], first_fill)
+            fills = np.concatenate([fills, unwind_fills[np.argsort(slot_order[np.searchsorted(ids, unwind_fills['ExchToken'])], kind='stable')]])
+
+        # positions at the end of every time step
+        hedges = np.zeros((n_steps, len(ids)))
+        hedge_only = fills[fills['Action'] == ACTION_HEDGE]
+        np.add.at(hedges, (hedge_only['Step'], np.searchsorted(ids, hedge_only['ExchToken'])), hedge_only['Position'])
+        position = condor_position + np.cumsum(hedges, axis=0)
+
+        return {'ids': ids, 'bid': bid, 'ask': ask, 'delta_bid': delta_bid, 'delta_ask': delta_ask, 'missing_delta': missing_delta,
+                'initial_position': initial_position, 'initial_marks': initial_marks,
+                'position': position, 'fills': fills, 'failed': failed, 'checked': checked,
+                'first_step': first_step, 'last_step': last_step, 'unwind_step': unwind_step, 'actions': schedule}
+
+    def _mark(self, phase:dict, cash:float) -> dict:
+        '''
+        Computes the marks, cash and value of the book of a phase after every update of the portfolio (a time step
+        and action with fills), as Portfolio.update() does: the instruments are marked on the bid when long and on the
+        ask when short (the last valid price is kept) and the traded instruments at the price of the trade.
+        '''
+        ids, fills = phase['ids'], phase['fills']
+        columns = np.searchsorted(ids, fills['ExchToken'])
+        update_key, update_idx = np.unique(fills['Step'] * (ACTION_HEDGE + 1) + fills['Action'], return_inverse=True)
+        update_step = update_key // (ACTION_HEDGE + 1)
+
+        changes = np.zeros((len(update_key), len(ids)))
+        np.add.at(changes, (update_idx, columns), fills['Position'])
+        position = phase['initial_position'] + np.cumsum(changes, axis=0)
+        position_before = np.vstack([phase['initial_position'][None, :], position[:-1]])
+
+        # price of the last fill of every instrument in an update
+        traded = np.full((len(update_key), len(ids)), np.nan)
+        last = len(fills) - 1 - np.unique((update_idx * len(ids) + columns)[::-1], return_index=True)[1]
+        traded[update_idx[last], columns[last]] = fills['Mark'][last]
+
+        quote = np.where(position_before < 0, phase['ask'][update_step], phase['bid'][update_step])
+        marks = _forward_fill(np.where(np.isnan(traded), np.where(quote > 0, quote, np.nan), traded), phase['initial_marks'])
+
+        trade_cash = np.zeros(len(update_key))
+        np.add.at(trade_cash, update_idx, fills['Position'] * fills['Price'] + self._txn_cost)
+        cash = cash - np.cumsum(trade_cash)
+        value = cash + np.where(position != 0, position * marks, 0).sum(axis=1)
+        return {'step': update_step, 'marks': marks, 'cash': cash, 'value': value}
+
+    def _record(self, phase:dict, updates:dict, cash:float, value:float) -> np.ndarray:
+        '''
+        Returns the records (Step, Value, Cash, NetDelta, GrossExposure, Legs) of the time steps of a phase,
+        cash and value being the ones before the first update of the phase
+        '''
+        steps = np.arange(phase['first_step'], phase['last_step'])
+        # state after the last update up to every time step, the first row being the state before the phase
+        last_update = np.searchsorted(updates['step'], steps, side='right')
+        marks = np.vstack([phase['initial_marks'][None, :], updates['marks']])[last_update]
+        position = phase['position'][steps]
+
+        records = np.zeros(len(steps), dtype=[('Step', 'i8'), ('Value', 'f8'), ('Cash', 'f8'), ('NetDelta', 'f8'),
+                                              ('GrossExposure', 'f8'), ('Legs', 'i4')])
+        records['Step'] = steps
+        records['Value'] = np.concatenate([[value], updates['value']])[last_update]
+        records['Cash'] = np.concatenate([[cash], updates['cash']])[last_update]
+        records['NetDelta'] = _net_delta(position, phase['delta_bid'][steps], phase['delta_ask'][steps], steps, phase['missing_delta'])
+        records['GrossExposure'] = np.abs(np.where(position != 0, position * marks, 0)).sum(axis=1)
+        records['Legs'] = np.count_nonzero(position, axis=1)
+        return records[~phase['failed'][steps]]
+
+    def _stop_step(self, backtest:Backtest, records:np.ndarray, is_event:np.ndarray) -> int:
+        '''
+        Returns the time step the event driven run would stop at (see Backtest.should_stop), None if it would not stop.
+        The drawdown is only checked at the events.
+        '''
+        limit = params.get('BCKTST_STOP_DRAWDOWN')
+        if limit is None or len(records) == 0:
+            return None
+        metrics = backtest.getOnlineMetrics()
+        values = records['Value']
+        peak = np.fmax.accumulate(np.concatenate([[metrics.getPeak()], values]))[1:]
+        max_drawdown = np.fmin.accumulate(np.concatenate([[metrics.getMaxDrawdown()], np.minimum(values - peak, 0)]))[1:]
+        stops = np.flatnonzero(is_event[records['Step']] & (max_drawdown <= -abs(limit)))
+        return int(records['Step'][stops[0]]) if len(stops) > 0 else None
+
+    def run(self, backtest:Backtest, portfolio:Portfolio, hist_data:HistoricalData, blotter:Blotter=None) -> None:
+        '''
+        Runs the strategy over the time window: records every time step in backtest (same records as Algo.driver),
+        books the fills into the portfolio and the blotter and switches the market data to the next expiry after an unwind
+        '''
+        start = time.perf_counter()
+        n_steps = len(self._time_window)
+        times = pd.DatetimeIndex(self._time_window).values
+
+        # same schedule as the event driven run
+        strategy = Strategy(underlying_instrument=self._underlying, param_list=self._param_list, time_interval_list=self._time_window)
+        calendar = strategy.build_event_calendar(time_window=self._time_window,
+                                                 expiry_times=np.concatenate([hist_data.get_expiry_times(), portfolio.get_expiry_times()]))
+        events = calendar.getEvents()
+        actions = np.zeros(n_steps, dtype=np.int8)
+        actions[events['Step']] = events['Action']
+
+        try:
+            ids, position, marks = portfolio.get_positions()
+            book = (ids, position, marks, portfolio.get_expiry_times())
+            cash, value = portfolio.getCash(), portfolio.get_portfolio_value()
+
+            phase = self._simulate(get_market_arrays(hist_data, self._time_window, self._underlying), actions, times,
+                                   first_step=0, book=book, expiries=hist_data.getContracts(), can_unwind=True)
+            updates = self._mark(phase, cash)
+            phases = [(phase, updates, self._record(phase, updates, cash, value))]
+
+            if phase['unwind_step'] is not None:
+                # the book is dropped after the unwind and the strategy goes on with the next expiry
+                if len(updates['step']) > 0:
+                    cash = updates['cash'][-1]
+                empty = (np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0), np.zeros(0, dtype='datetime64[ns]'))
+                next_phase = self._simulate(get_market_arrays(hist_data, self._time_window, self._underlying, expiry_type='second_weekly'),
+                                            phase['actions'], times, first_step=phase['unwind_step'], book=empty,
+                                            expiries=hist_data.getContracts(), can_unwind=False)
+                next_updates = self._mark(next_phase, cash)
+                next_records = self._record(next_phase, next_updates, cash, cash)
+                # the value recorded at the unwind step is the one before the drop, unless it is traded again
+                unwind_record = next_records['Step'] == phase['unwind_step']
+                if len(updates['step']) > 0 and not (next_updates['step'] == phase['unwind_step']).any():
+                    next_records['Value'][unwind_record] = updates['value'][-1]
+                phases.append((next_phase, next_updates, next_records))
+
+            # time steps where the event driven run checks whether to stop
+            is_event = np.zeros(n_steps, dtype=bool)
+            for phase, _, _ in phases:
+                phase_steps = slice(phase['first_step'], phase['last_step'])
+                is_event[phase_steps] = (phase['actions'][phase_steps] & (ACTION_TRADE | ACTION_HEDGE)) > 0
+            is_event |= phases[0][0]['checked']
+            records = np.concatenate([phase_records for _, _, phase_records in phases])
+            stop_step = self._stop_step(backtest, records, is_event)
+            last_step = stop_step if stop_step is not None else n_steps - 1
+            records = records[records['Step'] <= last_step]
+
+            # the fills are booked in the portfolio in their order, with a drop of the book at the unwind
+            for i, (phase, updates, _) in enumerate(phases):
+                if phase['first_step'] > last_step:
+                    break
+                if i > 0:
+                    portfolio.drop_instruments()
+                fills = phase['fills'][phase['fills']['Step'] <= last_step]
+                portfolio.apply_fills(fills, mkt_data=hist_data)
+                kept_updates = np.flatnonzero(updates['step'] <= last_step)
+                if len(kept_updates) > 0:
+                    portfolio.set_current_prices(phase['ids'], updates['marks'][kept_updates[-1]])
+                    portfolio.update_latest_timestamp(self._time_window[int(updates['step'][kept_updates[-1]])])
+                if blotter is not None and not params['DISABLE_BLOTTER_UPDATE']:
+                    blotter.add_fills(times=[self._time_window[step] for step in fills['Step'].tolist()], instrument_ids=fills['ExchToken'],
+                                      positions=fills['Position'], prices=fills['Price'])
+                if i > 0:
+                    logger.info('next expiry data loaded after unwind')
+                    hist_data.switch_expiry_type('second_weekly')
+
+            backtest.update_many(values=([self._time_window[step] for step in records['Step'].tolist()],
+                                         records['Value'],
+                                         records['Cash'],
+                                         records['NetDelta'],
+                                         records['GrossExposure'],
+                                         records['Legs'],
+                                         (time.perf_counter() - start)/max(len(records), 1)))
+
+            if stop_step is not None:
+                logger.warning(f'stopping the run at {self._time_window[stop_step]}, max drawdown {backtest.getOnlineMetrics().getMaxDrawdown()} beyond the limit')
+            logger.info(f'{len(records)} time steps and {sum(len(phase["fills"]) for phase, _, _ in phases)} fills computed in {time.perf_counter() - start:.4f}s')
+
+        except Exception as ex:
+            logger.critical(f'error while running the vectorized backtest at lineno={get_exception_line_no()} # {ex}')
+
+        if blotter is not None:
+            blotter.serialize(start_time=self._time_window[0], end_time=self._time_window[n_steps - 1])
+
+        logger.info(f'statistics of the run: {backtest.getOnlineMetrics()}')
+        backtest.save(backtestdatetime=self._time_window[0])
@@ -3,7 +3,6 @@ import pandas as pd
 import pymannkendall as mk
 import statsmodels.api as sm
 import matplotlib.pyplot as plt
-from scipy.stats import kurtosis
 
 
 plt.rcParams['axes.facecolor'] = 'lightblue'
@@ -71,6 +70,112 @@ def information_ratio(returns:pd.Series, benchmark_returns:pd.Series, period:int
 
 
 
+# periods in a year and calendar days in a period for each frequency
+PERIODS_PER_YEAR = {'D': 252, 'M': 12, 'W': 52, 'Q': 4, 'Y': 1, '6M': 2}
+DAYS_PER_PERIOD = {'D': 1, 'M': 30, 'W': 7, 'Q': 90, 'Y': 365, '6M': 182}
+
+METRICS = ['Start Date', 'End Date', 'Time Period', 'Annual Return', 'Annual Volatility', 'CAGR', 'Max. Drawdown',
+           'Sharpe Ratio', 'Sortino Ratio', 'Kurtosis', 'Turnover']
+
+
+def _ffill(values:np.ndarray) -> np.ndarray:
+    # forward fills the nan of every column (leading nan are kept)
+    idx = np.where(np.isfinite(values), np.arange(len(values))[:, None], 0)
+    np.maximum.accumulate(idx, axis=0, out=idx)
+    return np.take_along_axis(values, idx, axis=0)
+
+
+def max_drawdown(values) -> np.ndarray:
+    '''
+    Calculates the Max Drawdown of one or many equity curves (running peak with cummax)
+
+    Parameters
+    ----------
+    values : np.ndarray, default - None
+        Equity curve(s), periods along the rows and one column per curve, nan are skipped
+
+    Return
+    ------
+    np.ndarray : Max Drawdown of every curve as a fraction of its first value
+    '''
+    values = np.asarray(values, dtype=np.float64)
+    peaks = np.fmax.accumulate(values, axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.nanmin(values - peaks, axis=0) / _ffill(values[::-1])[-1]
+
+
+def financial_metrics(values, dates, frequency:str='D', risk_free_rate:float=0, returns=None, turnover=None) -> pd.DataFrame:
+    '''
+    Vectorized metrics engine, computes the metrics of financial_summary (numeric) for one or many equity curves
+    sharing the same dates in one call (e.g. the outputs of a parameter sweep). The inputs are not modified.
+
+    Parameters
+    ----------
+    values : pd.Series, pd.DataFrame or np.ndarray, default - None
+        Equity curve(s), periods along the rows and one column per curve (columns of a DataFrame are used as labels)
+    dates : array like, default - None
+        Dates of the periods
+    frequency : Daily (D), Monthly(M) or Weekly(W), default - 'D'.
+        Describes the frequency of data provided.
+    risk_free_rate : float, default 0
+        risk free rate of return
+    returns : array like, default - None
+        Returns of the periods (same shape as values), computed from values if not given
+    turnover : array like, default - None
+        Turnover of the periods (same shape as values), 0 if not given
+
+    Return
+    ------
+    pd.DataFrame : One row per curve with the columns of METRICS, returns are fractions (not %)
+    '''
+    assert (frequency in PERIODS_PER_YEAR), "Should be one of the values of 'D', 'M', 'W', 'Q', 'Y', '6M'"
+
+    labels = values.columns if isinstance(values, pd.DataFrame) else [values.name if isinstance(values, pd.Series) else 0]
+    values = np.asarray(values, dtype=np.float64)
+    values = values.reshape(len(values), -1)
+    k = PERIODS_PER_YEAR[frequency]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if returns is None:
+            # pct_change (nan are forward filled first)
+            filled = _ffill(values)
+            returns = np.full(values.shape, np.nan)
+            returns[1:] = filled[1:] / filled[:-1] - 1
+        else:
+            returns = np.asarray(returns, dtype=np.float64).reshape(values.shape)
+
+        dates = pd.to_datetime(np.asarray(dates))
+        periods = np.around((dates[-1] - dates[0]).days / DAYS_PER_PERIOD[frequency], 2)
+
+        cumulative_return = np.nanprod(1 + returns, axis=0) - 1
+        volatility = np.nanstd(returns, axis=0) * np.sqrt(k)
+        annual_return = (cumulative_return / periods) * k
+        sharpe = (annual_return - risk_free_rate) / volatility
+        downside = np.nanstd(np.where(returns < 0, returns, np.nan), axis=0) * np.sqrt(k)
+        sortino = annual_return / downside
+
+        first, last = _ffill(values[::-1])[-1], _ffill(values)[-1]
+        cagr = (last / first) ** (1 / np.around(periods / k, 2)) - 1
+
+        # pearson kurtosis of the returns (nan are skipped)
+        deviations = returns - np.nanmean(returns, axis=0)
+        kurt = np.nanmean(deviations**4, axis=0) / np.nanmean(deviations**2, axis=0)**2
+
+        turnover = np.zeros(values.shape[1]) if turnover is None else np.nanmean(np.asarray(turnover, dtype=np.float64).reshape(values.shape), axis=0)
+
+        return pd.DataFrame({'Start Date': dates[0],
+                             'End Date': dates[-1],
+                             'Time Period': periods,
+                             'Annual Return': annual_return,
+                             'Annual Volatility': volatility,
+                             'CAGR': cagr,
+                             'Max. Drawdown': max_drawdown(values),
+                             'Sharpe Ratio': sharpe,
+                             'Sortino Ratio': sortino,
+                             'Kurtosis': kurt,
+                             'Turnover': turnover}, index=labels, columns=METRICS)
+
+
 
 
 
@@ -113,55 +218,33 @@ def financial_summary(df_rets:pd.DataFrame, benchmark_rets:pd.DataFrame=None, fr
 
     try:
         mapper = {'D': 'Day', 'M': 'Month', 'W': 'Week', 'Q': 'Quarter', 'Y': 'Year', '6M': 'Half Yearly'}
-        mapper_time = {'D': 252, 'M': 12, 'W': 52, 'Q': 4, 'Y': 1, '6M': 2} # period multiplier
-        calender_time = {'D': 1, 'M': 30, 'W': 7, 'Q': 90, 'Y': 365, '6M': 182} # in days
-
-        # If turnover is provided we skip, else we take it as 0
-        try:
-            turnover_col_check = df_rets['turnover']
-        except:
-            df_rets['turnover'] = 0
-            
-        # if return column is missing we calculate it
-        try:
-            ret_col_check = df_rets['returns']
-        except:
-            df_rets['returns'] = df_rets[col_name_cagr].pct_change()
-        
-        df_rets['c_ret'] = (1 + df_rets['returns']).cumprod() - 1
-        periods = np.around((pd.to_datetime(df_rets.loc[df_rets.iloc[len(df_rets)-1].name, date_col]) - pd.to_datetime(df_rets.loc[df_rets.iloc[0].name, date_col])).days / calender_time[frequency], 2)
-        volatility = np.std(df_rets['returns']) * np.sqrt(mapper_time[frequency])
-        returns = ((df_rets['c_ret'].values[-1])/(periods)) * mapper_time[frequency]
-        sharpe = (returns - risk_free_rate) / volatility
-        cagr = CAGR(df_rets, t=np.around((periods/mapper_time[frequency]), 2), col_name=col_name_cagr)
-        
-        # Default benchmark is None if not provided.
-        if benchmark_rets != None:
-            info_ratio = information_ratio(df_rets['returns'], benchmark_rets['returns'], mapper_time[frequency])
-        elif benchmark_rets == None:
-            info_ratio = 0
-        
-        turnover = df_rets['turnover'].mean()
-        market_class = asset_class
-        
-        # Calculate Max Drawdown
-        inv = df_rets[col_name_cagr]
-        z = pd.Series(index=range(len(inv)))
-        z.iloc[0] = inv.iloc[0]
 
-        for i in range(1, len(inv)):
-            z.iloc[i] = max(inv[i], z[i-1])
+        # returns and turnover are taken from df_rets if provided
+        metrics = financial_metrics(df_rets[col_name_cagr], df_rets[date_col], frequency=frequency, risk_free_rate=risk_free_rate,
+                                    returns=df_rets['returns'] if 'returns' in df_rets else None,
+                                    turnover=df_rets['turnover'] if 'turnover' in df_rets else None).iloc[0]
 
-        maxdrwdn = (inv - z).min()/z[0]
+        periods = metrics['Time Period']
+        returns = metrics['Annual Return']
+        volatility = metrics['Annual Volatility']
+        sharpe = metrics['Sharpe Ratio']
+        cagr = metrics['CAGR'] * 100
+        maxdrwdn = metrics['Max. Drawdown']
+        kurtosiss = metrics['Kurtosis']
+        turnover = metrics['Turnover']
+
+        # Default benchmark is None if not provided.
+        if benchmark_rets is not None:
+            df_returns = df_rets['returns'] if 'returns' in df_rets else df_rets[col_name_cagr].pct_change()
+            info_ratio = information_ratio(df_returns, benchmark_rets['returns'], PERIODS_PER_YEAR[frequency])
+        else:
+            info_ratio = 0
 
-        sortino = returns / (np.std(df_rets[df_rets['returns'] < 0]['returns']) * np.sqrt(mapper_time[frequency]))
-        kurtosiss = kurtosis(df_rets['returns'], fisher=False)
-        
         # Data Arrangement
         meta_data = pd.DataFrame(
             data = [
-                df_rets.loc[df_rets.iloc[0].name, date_col],
-                df_rets.loc[df_rets.iloc[len(df_rets)-1].name, date_col],
+                df_rets[date_col].iloc[0],
+                df_rets[date_col].iloc[-1],
                 periods,
                 asset_class
             ],